@@ -0,0 +1,269 @@
+import bisect
+import logging
+import queue
+import threading
+import zlib
+from collections import OrderedDict
+import numpy as np
+from renderprep import envelope_parts
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+logger = logging.getLogger("phohale.sigvisualizer.CompressedHistory")
+
+CODEC_ZLIB = 'zlib'
+CODEC_LZ4 = 'lz4' ## only if the optional `lz4` package is installed
+DEFAULT_CODEC = CODEC_LZ4 if lz4_frame is not None else CODEC_ZLIB
+QUANTIZED_VALUE_BYTES = 2.1 ## compressed bytes per quantized value (uniform noise; white noise ~2.0, smooth signals ~1.7)
+LOSSLESS_RATIO = 1.2 ## compression ratio of lossless float32 blocks (white noise; smooth signals ~1.4, quantized ADC values ~1.9)
+DEFAULT_HISTORY_SECONDS = 3600.0 ## what the tier keeps by default, see history_budget()
+DEFAULT_MAX_BYTES = 2 ** 28 ## per stream, for streams without a nominal rate
+
+_BLOCK_LOSSLESS = 0
+_BLOCK_QUANTIZED = 1
+_QUANTIZE_MAX = 32767 ## quantized values are int16 in [-_QUANTIZE_MAX, _QUANTIZE_MAX]
+
+
+def history_budget(seconds: float, srate: float, n_channels: int, dtype=np.float32, quantize: bool = True) -> int:
+    """ the compressed bytes `seconds` of a stream take with encode_block(), from what was measured on 4096 x 64 blocks of
+    noise (the least compressible case): QUANTIZED_VALUE_BYTES per value plus an (incompressibly jittered) timestamp per
+    sample for quantized float blocks, and the raw rows (timestamp and samples) divided by LOSSLESS_RATIO otherwise """
+    dtype = np.dtype(dtype)
+    n_samples = float(seconds) * float(srate)
+    if quantize and np.issubdtype(dtype, np.floating):
+        return int(np.ceil(n_samples * (8 + n_channels * QUANTIZED_VALUE_BYTES)))
+    return int(np.ceil(n_samples * (8 + n_channels * dtype.itemsize) / LOSSLESS_RATIO))
+
+
+def _compress(payload: bytes, codec: str) -> bytes:
+    if codec == CODEC_LZ4:
+        return lz4_frame.compress(payload)
+    return zlib.compress(payload, 1)
+
+
+def _decompress(payload: bytes, codec: str) -> bytes:
+    if codec == CODEC_LZ4:
+        return lz4_frame.decompress(payload)
+    return zlib.decompress(payload)
+
+
+def _delta_shuffled(values) -> bytes:
+    """ the integer `values` (n, n_channels) delta-encoded along time, with equally significant bytes of all samples together """
+    delta = np.diff(values, axis=0, prepend=np.zeros((1, values.shape[1]), dtype=values.dtype))
+    return np.ascontiguousarray(delta.view(np.uint8).reshape(len(values), -1, values.dtype.itemsize).transpose(2, 1, 0)).tobytes()
+
+
+def _undelta_shuffled(raw: bytes, offset: int, n_samples: int, n_channels: int, int_dtype):
+    shuffled = np.frombuffer(raw, dtype=np.uint8, offset=offset, count=int_dtype.itemsize * n_channels * n_samples)
+    delta = np.ascontiguousarray(shuffled.reshape(int_dtype.itemsize, n_channels, n_samples).transpose(2, 1, 0)).view(int_dtype)
+    return np.cumsum(delta.reshape(n_samples, n_channels), axis=0, dtype=int_dtype)
+
+
+def encode_block(ts, data, codec: str = DEFAULT_CODEC, quantize: bool = False) -> bytes:
+    """ packs a block of timestamps (n,) and samples (n, n_channels) and compresses it with `codec`.
+
+    Losslessly (the default), the bit patterns are delta-encoded along time as integers (neighbouring samples share their
+    high bits, so the deltas are mostly small) and the delta bytes are shuffled so equally significant bytes of all samples
+    sit together. With `quantize`, finite float blocks are first mapped per channel onto int16 over the block's own range
+    (an error of at most 1/65534 of that range), which halves float32 before compression; blocks holding NaN/inf, and
+    integer blocks, stay lossless. Timestamps are always kept exactly.
+    """
+    ts_bits = np.ascontiguousarray(ts, dtype=np.float64).view(np.int64)
+    ts_bytes = np.diff(ts_bits, prepend=np.int64(0)).tobytes()
+    data = np.ascontiguousarray(data)
+    if quantize and np.issubdtype(data.dtype, np.floating) and len(data) and np.isfinite(data).all():
+        lo, hi = data.min(axis=0).astype(np.float64), data.max(axis=0).astype(np.float64)
+        center, step = (lo + hi) / 2.0, (hi - lo) / (2 * _QUANTIZE_MAX)
+        step = np.where(step > 0, step, 1.0)
+        codes = np.rint((data - center) / step).astype(np.int16)
+        header = bytes([_BLOCK_QUANTIZED]) + center.tobytes() + step.tobytes()
+        return _compress(header + ts_bytes + _delta_shuffled(codes), codec)
+    bits = data.view(np.dtype(f'i{data.dtype.itemsize}'))
+    return _compress(bytes([_BLOCK_LOSSLESS]) + ts_bytes + _delta_shuffled(bits), codec)
+
+
+def decode_block(payload: bytes, n_samples: int, n_channels: int, dtype, codec: str = DEFAULT_CODEC):
+    """ inverse of encode_block(); returns (ts, data) """
+    dtype = np.dtype(dtype)
+    raw = _decompress(payload, codec)
+    offset = 1
+    if raw[0] == _BLOCK_QUANTIZED:
+        center = np.frombuffer(raw, dtype=np.float64, offset=offset, count=n_channels)
+        step = np.frombuffer(raw, dtype=np.float64, offset=offset + 8 * n_channels, count=n_channels)
+        offset += 16 * n_channels
+    ts = np.cumsum(np.frombuffer(raw, dtype=np.int64, offset=offset, count=n_samples), dtype=np.int64).view(np.float64)
+    offset += 8 * n_samples
+    if raw[0] == _BLOCK_QUANTIZED:
+        codes = _undelta_shuffled(raw, offset, n_samples, n_channels, np.dtype(np.int16))
+        return ts, (codes * step + center).astype(dtype)
+    int_dtype = np.dtype(f'i{dtype.itemsize}')
+    return ts, _undelta_shuffled(raw, offset, n_samples, n_channels, int_dtype).view(dtype)
+
+
+
+class CompressedHistoryStore:
+    """ In-memory tiered history of one stream, a drop-in alternative to scrollback.ScrollbackStore for machines where
+    keeping the scrollback in RAM is preferable to disk.
+
+    The newest samples are appended to a preallocated raw block of `block_samples` rows; each full block is handed to a
+    background thread that compresses it with encode_block(), after which only the compressed bytes are kept. Reads
+    decompress the blocks they touch on demand, keeping the last `cache_blocks` of them decompressed, so scrolling within
+    a region doesn't decode the same blocks again. Beyond `max_bytes` (compressed) the oldest blocks are dropped.
+
+    Float blocks are quantized to int16 by default (`quantize`, see encode_block), which measured with zlib level 1 on
+    4096 x 64 float32 blocks compresses them about 2.0x for white noise and 2.4x for smooth signals, against 1.2-1.4x
+    losslessly. Unless given, `max_bytes` is sized to keep `seconds` of a stream at `srate` (history_budget()), so an hour
+    of 64 channels at 1 kHz is budgeted 510 MB instead of the 950 MB of its raw samples; streams without a nominal rate get
+    DEFAULT_MAX_BYTES. `compression_ratio` reports what a stream really gets.
+    """
+
+    def __init__(self, n_channels: int, dtype=np.float32, block_samples: int = 4096, max_bytes: int = None,
+                 codec: str = DEFAULT_CODEC, cache_blocks: int = 16, quantize: bool = True, srate: float = 0.0,
+                 seconds: float = DEFAULT_HISTORY_SECONDS):
+        if (codec == CODEC_LZ4) and (lz4_frame is None):
+            raise ValueError(f'codec {codec!r} needs the optional lz4 package')
+        self.n_channels = int(n_channels)
+        self.dtype = np.dtype(dtype)
+        self.block_samples = int(block_samples)
+        self.quantize = quantize
+        if max_bytes is None:
+            max_bytes = history_budget(seconds, srate, self.n_channels, self.dtype, quantize) if srate else DEFAULT_MAX_BYTES
+        self.max_bytes = max_bytes
+        self.codec = codec
+        self.cache_blocks = cache_blocks
+        self.nbytes = 0 ## bytes held by sealed blocks (compressed, or raw while waiting for compression)
+        self.raw_nbytes = 0 ## what the sealed blocks would take uncompressed
+        self._fill_ts = np.empty((self.block_samples,), dtype=np.float64)
+        self._fill_data = np.empty((self.block_samples, self.n_channels), dtype=self.dtype)
+        self._fill = 0
+        self._blocks = [] ## sealed blocks, oldest first: {'id', 'n', 'payload' (bytes) or None, 'raw' (ts, data) or None}
+        self._first_ts = [] ## first timestamp of each sealed block, the time index
+        self._next_id = 0
+        self._cache = OrderedDict() ## block id -> decoded (ts, data)
+        self._lock = threading.Lock()
+        self._pending = queue.Queue()
+        self._worker = threading.Thread(target=self._compress_loop, name='CompressedHistoryStore', daemon=True)
+        self._worker.start()
+
+
+    @property
+    def compression_ratio(self) -> float:
+        return (self.raw_nbytes / self.nbytes) if self.nbytes else 1.0
+
+
+    def append(self, ts, data):
+        ts = np.asarray(ts, dtype=np.float64)
+        data = np.asarray(data)
+        pos, n = 0, len(ts)
+        while pos < n:
+            k = min(n - pos, self.block_samples - self._fill)
+            self._fill_ts[self._fill:self._fill + k] = ts[pos:pos + k]
+            self._fill_data[self._fill:self._fill + k] = data[pos:pos + k]
+            self._fill += k
+            pos += k
+            if self._fill == self.block_samples:
+                self._seal()
+
+
+    def _seal(self):
+        block = {'id': self._next_id, 'n': self._fill, 'payload': None, 'raw': (self._fill_ts.copy(), self._fill_data.copy())}
+        self._next_id += 1
+        block_bytes = block['raw'][0].nbytes + block['raw'][1].nbytes
+        with self._lock:
+            self._blocks.append(block)
+            self._first_ts.append(float(self._fill_ts[0]))
+            self.nbytes += block_bytes
+            self.raw_nbytes += block_bytes
+        self._fill = 0
+        self._pending.put(block)
+
+
+    def _compress_loop(self):
+        while True:
+            block = self._pending.get()
+            if block is None:
+                break
+            raw = block['raw']
+            if raw is None:
+                continue
+            try:
+                payload = encode_block(raw[0], raw[1], self.codec, quantize=self.quantize)
+            except Exception as e:
+                logger.exception(f'CompressedHistoryStore failed to compress a block: {e}')
+                continue
+            with self._lock:
+                if block['raw'] is None:
+                    continue ## dropped meanwhile
+                self.nbytes += len(payload) - (raw[0].nbytes + raw[1].nbytes)
+                block['payload'], block['raw'] = payload, None
+                self._enforce_limit()
+
+
+    def _enforce_limit(self):
+        while (self.nbytes > self.max_bytes) and (len(self._blocks) > 1):
+            block = self._blocks.pop(0)
+            self._first_ts.pop(0)
+            raw_bytes = block['n'] * (8 + self.n_channels * self.dtype.itemsize)
+            self.nbytes -= len(block['payload']) if block['payload'] is not None else raw_bytes
+            self.raw_nbytes -= raw_bytes
+            block['raw'] = None
+            self._cache.pop(block['id'], None)
+
+
+    def _block_arrays(self, block):
+        """ (ts, data) of a sealed block, decompressing it if needed (call with the lock held) """
+        if block['raw'] is not None:
+            return block['raw']
+        cached = self._cache.get(block['id'])
+        if cached is not None:
+            self._cache.move_to_end(block['id'])
+            return cached
+        arrays = decode_block(block['payload'], block['n'], self.n_channels, self.dtype, self.codec)
+        self._cache[block['id']] = arrays
+        while len(self._cache) > self.cache_blocks:
+            self._cache.popitem(last=False)
+        return arrays
+
+
+    def time_span(self):
+        """ (first, last) timestamp held, or None if empty """
+        with self._lock:
+            first = self._first_ts[0] if self._first_ts else (float(self._fill_ts[0]) if self._fill else None)
+            if first is None:
+                return None
+            last = float(self._fill_ts[self._fill - 1]) if self._fill else float(self._block_arrays(self._blocks[-1])[0][-1])
+        return first, last
+
+
+    def read_range(self, t_start: float, t_stop: float, max_samples: int = None):
+        """ returns copies (ts, data) of the samples with t_start <= ts <= t_stop, or their min/max envelope
+        (renderprep.envelope_parts) within `max_samples` rows if there are more """
+        parts = []
+        with self._lock:
+            i0 = max(bisect.bisect_right(self._first_ts, t_start) - 1, 0)
+            i1 = bisect.bisect_right(self._first_ts, t_stop)
+            sources = [self._block_arrays(block) for block in self._blocks[i0:i1]]
+        if self._fill:
+            sources.append((self._fill_ts[:self._fill], self._fill_data[:self._fill]))
+        for ts, data in sources:
+            a = int(np.searchsorted(ts, t_start, side='left'))
+            b = int(np.searchsorted(ts, t_stop, side='right'))
+            if b > a:
+                parts.append((ts[a:b], data[a:b]))
+        total = sum(len(ts) for ts, _ in parts)
+        return envelope_parts(parts, total, t_start, t_stop, max_samples, self.n_channels, self.dtype)
+
+
+    def close(self):
+        """ stops the compression thread and frees all blocks """
+        self._pending.put(None)
+        with self._lock:
+            for block in self._blocks:
+                block['raw'] = None
+            self._blocks, self._first_ts = [], []
+            self._cache.clear()
+            self.nbytes = self.raw_nbytes = 0
+        self._fill = 0
@@ -1,5 +1,6 @@
 from datathread import DataThread
-from PyQt5.QtCore import Qt
+import numpy as np
+from PyQt5.QtCore import Qt, QLineF, QPointF
 from PyQt5.QtGui import QPalette, QPainter, QPen
 from PyQt5.QtWidgets import QWidget
 import math
@@ -18,18 +19,30 @@ class ConsoleWidget(QWidget):
         self.setPalette(pal)
 
         self.dataTr = DataThread(self)
+        self.dataTr.push_payloads = True ## this widget consumes sendData payloads rather than the ring buffers
         self.dataTr.sendData.connect(self.get_data)
+        self.dataTr.sendMarkerData.connect(self.get_markers)
         self.dataTr.changedStream.connect(self.reset)
 
     def reset(self):
         self.chunk_idx = 0
+        self.channelHeight = 0
+        self.px_per_samp = 0
+        self.lastY = []
+        self.scaling = []
+        self.mean = []
         self.dataBuffer = None
         self.markerBuffer = None
         self.t0 = 0
 
-    def get_data(self, sig_ts, sig_buffer, marker_ts, marker_buffer):
+    def get_markers(self, marker_stream_names, marker_ts, marker_buffer):
+        """ sendMarkerData slot: the markers that arrived since the previous frame """
+        self.get_data('', [], [], marker_stream_names, marker_ts, marker_buffer)
+
+    def get_data(self, stream_name, sig_ts, sig_buffer, marker_stream_names, marker_ts, marker_buffer):
         update_x0 = float(self.width())
         update_width = 0.
+        sig_ts, sig_buffer = list(sig_ts), np.asarray(sig_buffer).tolist() ## this widget paints from nested lists
 
         # buffer should have exactly self.dataTr.chunkSize samples or be empty
         if any(sig_ts):
@@ -115,17 +128,17 @@ class ConsoleWidget(QWidget):
                 chan_offset = (ch_idx + 0.5) * self.channelHeight
                 if self.lastY:
                     if not math.isnan(self.lastY[ch_idx]) and not math.isnan(self.dataBuffer[0][ch_idx]):
-                        painter.drawLine(x0 - self.px_per_samp,
-                                         -self.lastY[ch_idx] + chan_offset,
-                                         x0,
-                                         -self.dataBuffer[0][ch_idx] + chan_offset)
+                        painter.drawLine(QLineF(x0 - self.px_per_samp,
+                                                -self.lastY[ch_idx] + chan_offset,
+                                                x0,
+                                                -self.dataBuffer[0][ch_idx] + chan_offset))
 
                 for m in range(n_samps - 1):
                     if not math.isnan(self.dataBuffer[m][ch_idx]) and not math.isnan(self.dataBuffer[m+1][ch_idx]):
-                        painter.drawLine(x0 + m * self.px_per_samp,
-                                         -self.dataBuffer[m][ch_idx] + chan_offset,
-                                         x0 + (m + 1) * self.px_per_samp,
-                                         -self.dataBuffer[m+1][ch_idx] + chan_offset)
+                        painter.drawLine(QLineF(x0 + m * self.px_per_samp,
+                                            -self.dataBuffer[m][ch_idx] + chan_offset,
+                                            x0 + (m + 1) * self.px_per_samp,
+                                            -self.dataBuffer[m+1][ch_idx] + chan_offset))
 
             # Reset for next iteration
             self.chunk_idx = (self.chunk_idx + 1) % self.dataTr.chunksPerScreen  # For next iteration
@@ -135,6 +148,6 @@ class ConsoleWidget(QWidget):
         if self.markerBuffer is not None:
             painter.setPen(QPen(Qt.red))
             for px, mrk in self.markerBuffer:
-                painter.drawLine(px, 0, px, self.height())
-                painter.drawText(px - 2 * self.px_per_samp, 0.95 * self.height(), mrk)
+                painter.drawLine(QLineF(px, 0, px, self.height()))
+                painter.drawText(QPointF(px - 2 * self.px_per_samp, 0.95 * self.height()), mrk)
             self.markerBuffer = None
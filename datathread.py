@@ -1,152 +1,694 @@
 import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from PyQt5.QtCore import QThread, Qt, pyqtSignal
+import numpy as np
 import pylsl
 import copy
+from downsampling import DECIMATORS, make_decimator
+from framedelivery import DROP_OLDEST, FrameCoalescer
+from ingestprocess import EVENT_CLOCK_OFFSET, EVENT_OPEN_FAILED, EVENT_OPENED, IngestionProcessPool, SharedStreamRingBuffer
+from inletworker import InletWorker
+from markerstore import MarkerStore
+from recorder import StreamRecorder
+from replaysource import ReplaySource
+from ringbuffer import StreamRingBuffer
+from streamdiscovery import StreamDiscovery, stream_key
+from streammetadata import StreamMetadataCache, parse_channel_labels
 
 logger = logging.getLogger("phohale.sigvisualizer.DataThread")
 
+## maps pylsl channel formats to the numpy dtype liblsl writes for them (cf_string has no numeric buffer)
+CHANNEL_FORMAT_DTYPES = {
+    pylsl.cf_float32: np.float32,
+    pylsl.cf_double64: np.float64,
+    pylsl.cf_int32: np.int32,
+    pylsl.cf_int16: np.int16,
+    pylsl.cf_int8: np.int8,
+    pylsl.cf_int64: np.int64,
+}
+
 class DataThread(QThread):
-    updateStreamNames = pyqtSignal(list, int) ## emitted when the stream names are updated
+    streamAdded = pyqtSignal(dict) ## emitted with a stream's metadata when discovery finds a new stream and its inlet is open
+    streamRemoved = pyqtSignal(str) ## emitted with a stream's name after it vanished from the network and its inlet was closed
+    dataAvailable = pyqtSignal(str, int) ## (stream_name, head): the stream's ring buffer (see get_ring_buffer) holds new samples up to absolute index `head`
+    # Payload delivery, only emitted when push_payloads is enabled (legacy consumers):
     # Standardized order: (stream_name, sig_ts, sig_buffer, marker_stream_names, marker_ts, marker_buffer)
-    sendData = pyqtSignal(str, list, list, list, list, list)
+    # The marker lists are always empty; markers are queried by time window from `marker_store` instead
+    # sig_ts/sig_buffer are NDArrays of shape (n_samples,) and (n_samples, n_channels) in numpy ingestion mode, lists otherwise
+    sendData = pyqtSignal(str, object, object, list, list, list)
     # sendSingleStreamData = pyqtSignal(str, list, list) # (stream_name: str, sig_ts: NDArray, sig_buffer: NDArray)
-    sendMarkerData = pyqtSignal(list, list, list) # (marker_stream_names: list, marker_ts: list, marker_buffer: list)
+    sendMarkerData = pyqtSignal(list, list, list) # (marker_stream_names: list, marker_ts: list, marker_buffer: list): the markers that arrived since the previous frame
+    
+    frameDelivered = pyqtSignal() ## emitted after each frame's sendData/sendMarkerData batch; used to track how far behind the GUI is
     
     changedStream = pyqtSignal() ## emitted when the stream selection is changed. Based off of the idea that only one stream is selected at a time.
     
     def_stream_parms = {'chunk_idx': 0, 'metadata': {}, 'srate': None, 'chunkSize': None,
-                        'downSampling': None, 'downSamplingFactor': None, 'downSamplingBuffer': None,
-                        'inlet': None, 'stream_idx': None, 'is_marker': False}
+                        'downSampling': None, 'downSamplingFactor': None, 'downSamplingMethod': None, 'decimator': None,
+                        'inlet': None, 'stream_key': None, 'is_marker': False,
+                        'pull_buffer': None, 'info_xml': None, 'is_replay': False,
+                        'pull_buffer_layout': None, 'stream_info': None, 'ingest_pending': False}
 
     def __init__(self, parent):
         super().__init__(parent)
         self.chunksPerScreen = 50  # For known sampling rate data, divide the screen into this many segments.
         self.seconds_per_screen = 2  # Number of seconds per sweep
-        self.streams = []
-        self.stream_params = []
-        self.sig_strm_idx = -1 ## the index of the selected stream -- TODO 2025-10-09 - replace so that it works with multiple streams
+        self.stream_params = {} ## stream key (see streamdiscovery.stream_key) -> params dict, in discovery order
+        self.sig_strm_key = None ## the key of the selected (expanded) stream
+        self.use_numpy_ingestion = True ## pull numeric chunks straight into preallocated per-stream NDArrays instead of lists of Python floats
+        self.max_pull_samples = 1024 ## row capacity of each stream's preallocated pull buffer
+        self.downsampling_threshold_srate = 1000 ## streams above this nominal rate are decimated by default, down to roughly this rate
+        self.default_downsampling_method = 'mean' ## one of downsampling.DECIMATORS: 'mean', 'minmax', 'lttb', 'fir'
+        self.target_latency = 0.05 ## longest a sample may wait in its inlet before its worker polls it (seconds)
+        self.dispatch_poll_timeout = 0.2 ## longest the dispatch loop waits on the chunk queue before re-checking for stop
+        self.max_parallel_inlet_opens = 8 ## inlets opened (and info() fetched) concurrently when several streams appear at once
+        self.info_timeout = 5.0 ## seconds to wait for a new inlet's full info() before giving up on the stream
+        self.metadata_cache = StreamMetadataCache() ## extended metadata by (source_id/uid, session_id), so re-discovered streams skip info()
+        self.auto_discovery = True ## whether the discovery service diffs the network continuously, or only on update_streams()
+        self._chunk_queue = queue.Queue() ## (stream_key, is_marker, ts, data) tuples from the per-stream InletWorkers (or (key, False, None, head) and (key, None, event, payload) from the process backend)
+        self._workers = {} ## stream key -> InletWorker
+        self._streams_lock = threading.RLock() ## guards stream_params/_workers, which the discovery thread mutates
+        self.ring_buffer_seconds = 10.0 ## history each stream's shared ring buffer holds (at the post-decimation rate)
+        self.irregular_rate_guess = 1000.0 ## samples/s assumed when sizing ring buffers of irregular-rate numeric streams
+        self.ring_buffers = {} ## stream key -> StreamRingBuffer, written by the dispatch loop and read by the plot widgets
+        self.marker_store = MarkerStore() ## every marker of every marker stream, time-sorted; plots query their visible window
+        self.push_payloads = False ## additionally emit sendData with the frame's samples (for consumers that don't read the ring buffers)
+        self.ingestion_backend = 'thread' ## 'thread': InletWorkers in this process; 'process': an IngestionProcessPool outside the GUI's GIL
+        self.n_ingest_processes = max(min((os.cpu_count() or 2) // 2, 8), 1) ## size of the process pool (streams are spread across it)
+        self._process_pool = None
+        self._payload_index = {} ## stream key -> next ring index to push as payload (process backend with push_payloads)
+        self._clock_offsets = {} ## stream key -> latest (collection_time, offset) an ingestion process measured (process backend)
+        self.delivery_fps = 30 ## rate at which collected chunks are handed to the GUI, one batch per stream per frame
+        self.max_frames_in_flight = 2 ## delivered-but-unprocessed frames allowed before further frames are skipped (backpressure)
+        self.max_pending_seconds = 2.0 ## per-stream cap on data coalesced while frames are skipped; beyond it drop_policy applies
+        self.drop_policy = DROP_OLDEST ## framedelivery.DROP_OLDEST or DROP_NEWEST
+        self.skipped_frames = 0
+        self.dropped_samples = 0
+        self._frames_in_flight = 0
+        self._frame_lock = threading.Lock()
+        self.recorder = None ## StreamRecorder fed with every chunk the dispatch loop receives, while recording (see start_recording)
+        self.clock_offset_interval = 5.0 ## seconds between the clock offsets written to a recording
+        self.clock_offset_timeout = 2.0 ## seconds the blocking time_correction() may take when a stream joins a recording
+        self._finishing_recorders = [] ## stopped StreamRecorders whose threads are still writing out (see stop_recording)
+        self._record_index = {} ## stream key -> next ring index to record (process backend)
+        self._last_clock_offset_t = 0.0
+        self._replays = [] ## (ReplaySource, [stream keys]) of the running replays (see start_replay)
+        self._discovery = None
         self._running = False
+        self.frameDelivered.connect(self._acknowledge_frame, Qt.QueuedConnection)
         logger.info(f'DataThread initialized.')
 
     def handle_stream_expanded(self, name):
         logger.info(f'DataThread handle_stream_expanded() started.')
-        stream_names = [_['metadata']['name'] for _ in self.stream_params]
-        self.sig_strm_idx = stream_names.index(name)
-        self.changedStream.emit() ## emit the self.changedStream signal
+        with self._streams_lock:
+            matches = [key for key, params in self.stream_params.items() if params['metadata']['name'] == name]
+        if matches:
+            self.sig_strm_key = matches[0]
+            self.changedStream.emit() ## emit the self.changedStream signal
 
         logger.info(f'DataThread handle_stream_expanded() finished.')
 
 
+    def get_stream_metadata(self, name: str):
+        """ returns the metadata dict of the stream with the given display name, or None """
+        with self._streams_lock:
+            for params in self.stream_params.values():
+                if params['metadata'].get('name') == name:
+                    return params['metadata']
+        return None
+
+
+    def get_ring_buffer(self, name: str):
+        """ returns the shared StreamRingBuffer of the numeric stream with the given display name, or None """
+        with self._streams_lock:
+            for key, params in self.stream_params.items():
+                if params['metadata'].get('name') == name:
+                    return self.ring_buffers.get(key)
+        return None
+
+
+    def _create_ring_buffer(self, params) -> StreamRingBuffer:
+        """ sizes a ring buffer for `ring_buffer_seconds` of the stream's post-decimation output (in shared memory for the process backend) """
+        srate = params['metadata'].get('srate') or 0.0
+        out_rate = (srate / (params.get('downSamplingFactor') or 1)) if srate > 0 else self.irregular_rate_guess
+        if params.get('downSamplingMethod') == 'minmax':
+            out_rate *= 2 ## two samples (min and max) per block
+        capacity = max(int(out_rate * self.ring_buffer_seconds), 1024)
+        dtype = np.float64 if params['metadata'].get('ch_format') in (pylsl.cf_double64, pylsl.cf_int64) else np.float32
+        ring_class = SharedStreamRingBuffer if self._uses_process_pool(params) else StreamRingBuffer
+        return ring_class(capacity, params['metadata'].get('ch_count', 0), dtype=dtype)
+
+
+    def _uses_process_pool(self, params) -> bool:
+        """ replayed streams always use an InletWorker: the ingestion processes can only open network streams """
+        return (self.ingestion_backend == 'process') and (not params.get('is_replay'))
+
+
     def update_streams(self):
+        """ starts stream discovery and the dispatch loop if needed and requests an immediate, non-blocking discovery pass.
+        Only the differences are applied: inlets are opened for new streams and closed for vanished ones (see add_streams/remove_streams).
+        """
         logger.info(f'DataThread update_streams() started.')
-        if not self.streams:
-            self.streams = pylsl.resolve_streams(wait_time=1.0)
-            for k, stream in enumerate(self.streams):
-                n = stream.name()
-                stream_params = copy.deepcopy(self.def_stream_parms)
-                stream_params['inlet'] = pylsl.StreamInlet(stream, processing_flags=(pylsl.proc_monotonize|pylsl.proc_clocksync))
-                # Extended meta data using info object
-                info = stream_params['inlet'].info()
-                channelLabels = []
-                logger.info("\tGetting channel names from stream metadata...")
-                ch = info.desc().child("channels").child("channel")
-                for ch_ix in range(info.channel_count()):
-                    #print(ch.desc())
-                    print("  " + ch.child_value("label"))
-                    channelLabels.append(ch.child_value("label"))
-                    ch = ch.next_sibling()
-                stream_params['metadata'].update({
-                    "name": n,
-                    "ch_count": stream.channel_count(),
-                    "ch_format": stream.channel_format(),
-                    "srate": stream.nominal_srate(),
-                    "ch_labels": channelLabels
-                })
-                stream_params['is_marker'] = (stream.channel_format() in ["String", pylsl.cf_string]) and (stream.nominal_srate() == pylsl.IRREGULAR_RATE)
-                if not stream_params['is_marker']:
-                    if (self.sig_strm_idx < 0):
-                        self.sig_strm_idx = k
-                    srate = stream.nominal_srate()
-                    stream_params['downSampling'] = srate > 1000
-                    stream_params['chunkSize'] = round(srate / self.chunksPerScreen * self.seconds_per_screen)
-                    if stream_params['downSampling']:
-                        stream_params['downSamplingFactor'] = round(srate / 1000)
-                        n_buff = round(stream_params['chunkSize'] / stream_params['downSamplingFactor'])
-                        stream_params['downSamplingBuffer'] = [[0] * int(stream.channel_count())] * n_buff
-                self.stream_params.append(stream_params)
-
-            self.updateStreamNames.emit([_['metadata'] for _ in self.stream_params], self.sig_strm_idx)
+        if self._discovery is None:
+            self._discovery = StreamDiscovery(on_added=self.add_streams, on_removed=self.remove_streams, auto_refresh=self.auto_discovery)
+            self._discovery.start()
+        if not self.isRunning():
             self._running = True
             self.start()
+        self._discovery.refresh()
         logger.info(f'DataThread update_streams() finished.')
 
 
+    def set_auto_discovery(self, enabled: bool):
+        """ toggles continuous discovery; when off, the network is only diffed on update_streams() """
+        self.auto_discovery = bool(enabled)
+        if self._discovery is not None:
+            self._discovery.set_auto_refresh(self.auto_discovery)
+        elif self.auto_discovery:
+            self.update_streams()
+
+
+    def rebroadcast_streams(self):
+        """ re-emits streamAdded for every open stream, e.g. after the plots were reset """
+        with self._streams_lock:
+            all_metadata = [dict(params['metadata']) for params in self.stream_params.values() if not params['ingest_pending']]
+        for a_metadata in all_metadata:
+            self.streamAdded.emit(a_metadata)
+
+
+    def _unique_stream_name(self, name: str) -> str:
+        """ plots and tree items are keyed by display name, so disambiguate distinct streams that share a name """
+        used_names = {params['metadata'].get('name') for params in self.stream_params.values()}
+        unique_name, counter = name, 2
+        while unique_name in used_names:
+            unique_name = f'{name} [{counter}]'
+            counter += 1
+        return unique_name
+
+
+    def _fetch_extended_metadata(self, stream, inlet):
+        """ returns {'ch_labels', 'info_xml'} for a stream, from the metadata cache when possible.
+        On a miss this costs one blocking `inlet.info()` round-trip, and the channel labels are parsed in bulk from its XML.
+        """
+        cached = self.metadata_cache.get(stream)
+        if cached is not None:
+            logger.info(f'\tUsing cached channel metadata for {stream.name()!r}.')
+            return cached
+        info = inlet.info(timeout=self.info_timeout)
+        info_xml = info.as_xml()
+        entry = {'ch_labels': parse_channel_labels(info_xml, info.channel_count()), 'info_xml': info_xml}
+        self.metadata_cache.put(stream, entry)
+        return entry
+
+
+    def _build_stream_params(self, stream, inlet=None):
+        """ opens an inlet for a resolved stream (unless one is given, e.g. a replaysource.ReplayInlet) and builds its params dict (metadata, downsampling, pull buffer).
+        Streams that go to the ingestion processes get no inlet here, since their process opens the only one: their channel labels come
+        from the metadata cache or, on a miss, from the process once it has opened the stream (`info_xml` stays None until then, see _on_ingest_event).
+        """
+        stream_params = copy.deepcopy(self.def_stream_parms)
+        stream_params['stream_info'] = stream
+        in_process = (inlet is None) and (self.ingestion_backend == 'process')
+        if in_process:
+            stream_params['ingest_pending'] = True
+            extended_metadata = self.metadata_cache.get(stream) or {'ch_labels': [''] * stream.channel_count(), 'info_xml': None}
+        else:
+            stream_params['inlet'] = inlet if inlet is not None else pylsl.StreamInlet(stream, processing_flags=(pylsl.proc_monotonize|pylsl.proc_clocksync))
+            # Extended meta data using info object
+            extended_metadata = self._fetch_extended_metadata(stream, stream_params['inlet'])
+        stream_params['info_xml'] = extended_metadata['info_xml']
+        stream_params['metadata'].update({
+            "name": stream.name(),
+            "type": stream.type(),
+            "ch_count": stream.channel_count(),
+            "ch_format": stream.channel_format(),
+            "srate": stream.nominal_srate(),
+            "ch_labels": list(extended_metadata['ch_labels']),
+            "source_id": stream.source_id(),
+            "uid": stream.uid(),
+            "session_id": stream.session_id(),
+            "hostname": stream.hostname(),
+        })
+        stream_params['is_marker'] = (stream.channel_format() in ["String", pylsl.cf_string]) and (stream.nominal_srate() == pylsl.IRREGULAR_RATE)
+        if not stream_params['is_marker']:
+            srate = stream.nominal_srate()
+            # irregular-rate numeric streams have no meaningful chunk size; their workers pace themselves from the observed rate
+            stream_params['chunkSize'] = round(srate / self.chunksPerScreen * self.seconds_per_screen) if srate > 0 else None
+            if srate > self.downsampling_threshold_srate:
+                self._configure_downsampling(stream_params, factor=round(srate / self.downsampling_threshold_srate), method=self.default_downsampling_method)
+            if self.use_numpy_ingestion and in_process:
+                stream_params['pull_buffer_layout'] = self._pull_buffer_layout(stream, stream_params['chunkSize']) ## allocated by the ingestion process
+            elif self.use_numpy_ingestion:
+                stream_params['pull_buffer'] = self._allocate_pull_buffer(stream, stream_params['chunkSize'])
+        return stream_params
+
+
+    def add_streams(self, streams):
+        """ discovery callback: opens inlets for newly found streams only, starts their workers and emits streamAdded for each.
+        Inlets are opened (and their `info()` fetched) concurrently, and each stream is registered as soon as it is ready,
+        so one slow stream doesn't hold back the others. Returns the keys of the given streams that are now registered
+        (a stream whose inlet failed to open is left out, so discovery offers it again).
+        """
+        logger.info(f'DataThread add_streams({len(streams)} streams) started.')
+        all_keys = [stream_key(stream) for stream in streams]
+        with self._streams_lock:
+            streams = [stream for stream in streams if stream_key(stream) not in self.stream_params]
+        if not streams:
+            return all_keys
+        with ThreadPoolExecutor(max_workers=min(self.max_parallel_inlet_opens, len(streams)), thread_name_prefix='InletOpen') as executor:
+            futures = {executor.submit(self._build_stream_params, stream): stream for stream in streams}
+            for a_future in as_completed(futures):
+                stream = futures[a_future]
+                try:
+                    stream_params = a_future.result()
+                except Exception as e:
+                    logger.exception(f'DataThread failed to open an inlet for stream {stream.name()!r}: {e}')
+                    continue
+                self._register_stream(stream_key(stream), stream_params)
+        logger.info(f'DataThread add_streams(...) finished.')
+        with self._streams_lock:
+            return [key for key in all_keys if key in self.stream_params]
+
+
+    def _register_stream(self, key, stream_params):
+        with self._streams_lock:
+            if key in self.stream_params:
+                return
+            stream_params['stream_key'] = key
+            stream_params['metadata']['key'] = key
+            stream_params['metadata']['name'] = self._unique_stream_name(stream_params['metadata']['name'])
+            self.stream_params[key] = stream_params
+            if not stream_params['is_marker']:
+                self.ring_buffers[key] = self._create_ring_buffer(stream_params)
+                if self.sig_strm_key is None:
+                    self.sig_strm_key = key
+            if self._uses_process_pool(stream_params):
+                a_worker = None
+                if self._process_pool is None:
+                    self._process_pool = IngestionProcessPool(self._chunk_queue, n_processes=self.n_ingest_processes, target_latency=self.target_latency,
+                                                              resolve_timeout=self.info_timeout, clock_offset_interval=self.clock_offset_interval)
+                self._process_pool.add_stream(key, stream_params, self.ring_buffers.get(key), fetch_info=(stream_params['info_xml'] is None))
+            else:
+                a_worker = InletWorker(key, stream_params, self._chunk_queue, target_latency=self.target_latency)
+                self._workers[key] = a_worker
+        if a_worker is not None:
+            a_worker.start()
+        if stream_params['ingest_pending']:
+            return ## announced (and recorded) once its ingestion process has opened it, see _on_ingest_event
+        if self.recorder is not None:
+            self._add_recorded_stream(key, stream_params)
+        self.streamAdded.emit(dict(stream_params['metadata']))
+
+
+    def _on_ingest_event(self, key, event: str, payload):
+        """ handles an ingestion process's report (ingestprocess.EVENT_*) about one of its streams, on the dispatch thread """
+        if event == EVENT_OPEN_FAILED:
+            self.remove_streams([key])
+            if self._discovery is not None:
+                self._discovery.forget([key]) ## offered again on the next discovery pass
+            return
+        with self._streams_lock:
+            params = self.stream_params.get(key)
+        if params is None:
+            return
+        if event == EVENT_CLOCK_OFFSET:
+            self._clock_offsets[key] = payload
+            if self.recorder is not None:
+                self.recorder.add_clock_offset(key, *payload)
+        elif event == EVENT_OPENED:
+            if payload['clock_offset'] is not None:
+                self._clock_offsets[key] = payload['clock_offset']
+            if payload['info_xml'] is not None:
+                entry = {'ch_labels': parse_channel_labels(payload['info_xml'], params['metadata'].get('ch_count', 0)), 'info_xml': payload['info_xml']}
+                self.metadata_cache.put(params['stream_info'], entry)
+                params['info_xml'] = entry['info_xml']
+                params['metadata']['ch_labels'] = list(entry['ch_labels'])
+            params['ingest_pending'] = False
+            if self.recorder is not None:
+                self._add_recorded_stream(key, params)
+            self.streamAdded.emit(dict(params['metadata']))
+
+
+    def remove_streams(self, keys):
+        """ discovery callback: stops the workers and closes the inlets of vanished streams, then emits streamRemoved for each """
+        logger.info(f'DataThread remove_streams({len(keys)} streams) started.')
+        for key in keys:
+            with self._streams_lock:
+                stream_params = self.stream_params.pop(key, None)
+                a_worker = self._workers.pop(key, None)
+                a_ring = self.ring_buffers.pop(key, None)
+                self._payload_index.pop(key, None)
+                self._record_index.pop(key, None)
+                self._clock_offsets.pop(key, None)
+                if self.sig_strm_key == key:
+                    self.sig_strm_key = None
+            if stream_params is None:
+                continue
+            if self.recorder is not None:
+                self.recorder.remove_stream(key)
+            if a_worker is not None:
+                a_worker.stop()
+                a_worker.join(1.0)
+            if stream_params['is_marker']:
+                self.marker_store.remove_stream(stream_params['metadata']['name'])
+            if self._process_pool is not None:
+                self._process_pool.remove_stream(key)
+            if isinstance(a_ring, SharedStreamRingBuffer):
+                a_ring.release()
+            if stream_params['inlet'] is not None:
+                try:
+                    stream_params['inlet'].close_stream()
+                except Exception:
+                    pass
+            if not stream_params['ingest_pending']:
+                self.streamRemoved.emit(stream_params['metadata']['name'])
+        logger.info(f'DataThread remove_streams(...) finished.')
+
+
+    def _configure_downsampling(self, params, factor=None, method=None):
+        """ (re)builds the stream's decimator. A factor <= 1 disables downsampling for the stream. """
+        factor = int(factor if factor is not None else (params.get('downSamplingFactor') or 1))
+        method = method or params.get('downSamplingMethod') or self.default_downsampling_method
+        if method not in DECIMATORS:
+            raise ValueError(f'Unknown downsampling method {method!r}; expected one of {sorted(DECIMATORS)}')
+        params['downSamplingFactor'] = factor
+        params['downSamplingMethod'] = method
+        params['downSampling'] = factor > 1
+        ## swapping in a fresh decimator is a single assignment, so run() sees either the old or the new one
+        params['decimator'] = make_decimator(method, factor, params['metadata'].get('ch_count', 0)) if factor > 1 else None
+
+
+    def set_downsampling(self, stream_name: str, factor=None, method=None):
+        """ changes the downsampling factor and/or method ('mean', 'minmax', 'lttb', 'fir') for a numeric stream.
+        Filter state restarts from the next chunk.
+        """
+        with self._streams_lock:
+            all_params = list(self.stream_params.values())
+        for params in all_params:
+            if (params['metadata'].get('name') == stream_name) and (not params['is_marker']):
+                self._configure_downsampling(params, factor=factor, method=method)
+                if self._process_pool is not None:
+                    self._process_pool.set_downsampling(params['stream_key'], params['downSamplingFactor'], params['downSamplingMethod'],
+                                                        params['metadata'].get('ch_count', 0))
+                logger.info(f'DataThread set_downsampling({stream_name!r}): factor={params["downSamplingFactor"]}, method={params["downSamplingMethod"]}')
+                return True
+        logger.warning(f'DataThread set_downsampling(): no numeric stream named {stream_name!r}')
+        return False
+
+
+    def _pull_buffer_layout(self, stream, chunk_size=None):
+        """ returns the ((max_samples, n_channels), dtype) of the stream's pull buffer, or None if the format has no numeric buffer """
+        dtype = CHANNEL_FORMAT_DTYPES.get(stream.channel_format())
+        if dtype is None:
+            return None
+        return (max(int(chunk_size or 0), self.max_pull_samples), int(stream.channel_count())), dtype
+
+
+    def _allocate_pull_buffer(self, stream, chunk_size=None):
+        """ returns a C-contiguous (max_samples, n_channels) NDArray in the stream's native dtype for `pull_chunk(dest_obj=...)`, or None if the format has no numeric buffer """
+        layout = self._pull_buffer_layout(stream, chunk_size)
+        if layout is None:
+            return None
+        return np.zeros(layout[0], dtype=layout[1], order='C')
+
+
+    def start_recording(self, path: str, **recorder_kwargs) -> StreamRecorder:
+        """ records every current and future stream to `path` (XDF, or HDF5 for .h5/.hdf5) until stop_recording().
+        The chunks are those the dispatch loop receives, i.e. after any downsampling (see set_downsampling) """
+        self.stop_recording()
+        for a_finishing in self._finishing_recorders:
+            if os.path.abspath(a_finishing.path) == os.path.abspath(path):
+                a_finishing.join() ## still writing out the file we're about to overwrite
+        a_recorder = StreamRecorder(path, **recorder_kwargs)
+        a_recorder.start()
+        with self._streams_lock:
+            joining = [(key, params) for key, params in self.stream_params.items() if not params['ingest_pending']]
+        clock_offsets = {key: self._initial_clock_offset(key, params) for key, params in joining} ## blocking, so outside the lock
+        with self._streams_lock:
+            self.recorder = a_recorder
+            self._last_clock_offset_t = pylsl.local_clock()
+            for key, params in self.stream_params.items():
+                if not params['ingest_pending']:
+                    self._add_recorded_stream(key, params, clock_offsets)
+        logger.info(f'DataThread start_recording({path!r}).')
+        return a_recorder
+
+
+    def stop_recording(self, wait: bool = False, timeout: float = 5.0):
+        """ stops feeding the recorder; its thread then writes out the rest and closes the file on its own, so this doesn't
+        block the caller (the GUI thread) unless `wait` (at shutdown) asks to join it """
+        a_recorder, self.recorder = self.recorder, None
+        self._record_index.clear()
+        if a_recorder is not None:
+            a_recorder.stop(wait=False)
+            self._finishing_recorders.append(a_recorder)
+            logger.info(f'DataThread stop_recording(): finishing {a_recorder.path!r}.')
+        if wait:
+            for a_finishing in self._finishing_recorders:
+                a_finishing.join(timeout)
+        self._finishing_recorders = [a_finishing for a_finishing in self._finishing_recorders if a_finishing.is_alive()]
+
+
+    def _initial_clock_offset(self, key, params):
+        """ (collection_time, offset) for a stream joining the recording: a blocking time_correction() on its inlet, or what
+        its ingestion process measured on opening it (process backend); None, logged, if there is no estimate """
+        inlet = params['inlet']
+        if inlet is None:
+            clock_offset = self._clock_offsets.get(key)
+            if clock_offset is None:
+                logger.warning(f'DataThread: no clock offset for {key!r} yet; it is recorded uncorrected until the first one arrives.')
+            return clock_offset
+        try:
+            offset = inlet.time_correction(timeout=self.clock_offset_timeout)
+            return pylsl.local_clock(), offset
+        except Exception as e:
+            logger.warning(f'DataThread could not measure the clock offset of {key!r} ({e}); it is recorded uncorrected until the first one arrives.')
+            return None
+
+
+    def _add_recorded_stream(self, key, params, clock_offsets: dict = None):
+        """ adds a stream to the running recording; its initial clock offset is taken from `clock_offsets` if measured there """
+        metadata = params['metadata']
+        clock_offset = clock_offsets[key] if (clock_offsets is not None) and (key in clock_offsets) else self._initial_clock_offset(key, params)
+        if params['is_marker']:
+            self.recorder.add_stream(key, metadata.get('name') or key, params.get('info_xml'), metadata.get('ch_count', 1), is_marker=True,
+                                     clock_offset=clock_offset)
+            return
+        ring = self.ring_buffers.get(key)
+        if ring is None:
+            return
+        srate = (metadata.get('srate') or 0.0) / (params.get('downSamplingFactor') or 1)
+        if params.get('downSamplingMethod') == 'minmax':
+            srate *= 2
+        dtype = ring.dtype if self._uses_process_pool(params) or (params.get('decimator') is not None) else CHANNEL_FORMAT_DTYPES.get(metadata.get('ch_format'), ring.dtype)
+        self.recorder.add_stream(key, metadata.get('name') or key, params.get('info_xml'), metadata.get('ch_count', 0), dtype=dtype, srate=srate,
+                                 clock_offset=clock_offset)
+        self._record_index[key] = ring.head
+
+
+    def _record_clock_offsets(self):
+        """ measures each recorded stream's clock offset (the inlets already have an estimate, see _initial_clock_offset) and
+        hands it to the recorder. Process-backed streams have no inlet here; their ingestion process reports the offsets
+        instead (see _on_ingest_event) """
+        now, a_recorder = pylsl.local_clock(), self.recorder
+        if (a_recorder is None) or ((now - self._last_clock_offset_t) < self.clock_offset_interval):
+            return
+        self._last_clock_offset_t = now
+        with self._streams_lock:
+            inlets = [(key, params['inlet']) for key, params in self.stream_params.items() if params['inlet'] is not None]
+        for key, inlet in inlets:
+            try:
+                a_recorder.add_clock_offset(key, now, inlet.time_correction(timeout=0.0))
+            except Exception as e:
+                logger.warning(f'DataThread could not measure the clock offset of {key!r}: {e}')
+
+
+    def start_replay(self, path: str, speed: float = 1.0, loop: bool = False) -> ReplaySource:
+        """ plays a recorded XDF, NPZ or HDF5 file through the same pipeline as live streams (workers, decimation, ring buffers,
+        frames), at `speed`× the original timing or as fast as possible with `speed` None; the dispatch loop is started if needed.
+        Replayed streams appear alongside any live ones until stop_replay() """
+        source = ReplaySource(path, speed=speed, loop=loop)
+        if not self.isRunning():
+            self._running = True
+            self.start()
+        keys = []
+        with self._streams_lock: ## checked and registered atomically, as the discovery thread may add streams meanwhile
+            for info in source.stream_infos:
+                key = stream_key(info)
+                if key in self.stream_params:
+                    logger.warning(f'DataThread start_replay(): {info.name()!r} of {path!r} is already being replayed, skipping it.')
+                    continue
+                stream_params = self._build_stream_params(info, inlet=source.open_inlet(info)) ## a ReplayInlet, so this doesn't block
+                stream_params['is_replay'] = True
+                self._register_stream(key, stream_params)
+                keys.append(key)
+        self._replays.append((source, keys))
+        source.start()
+        return source
+
+
+    def stop_replay(self, source: ReplaySource = None):
+        """ removes the streams of `source` (of every running replay if None) """
+        for a_source, keys in list(self._replays):
+            if (source is None) or (a_source is source):
+                self._replays.remove((a_source, keys))
+                self.remove_streams(keys)
+
+
+    def _stop_workers(self, timeout: float = 1.0):
+        with self._streams_lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for a_worker in workers:
+            a_worker.stop()
+        for a_worker in workers:
+            a_worker.join(timeout)
+
+
+    def _acknowledge_frame(self):
+        """ runs on the GUI thread (queued after the frame's sendData slots) once a delivered frame has been consumed """
+        with self._frame_lock:
+            self._frames_in_flight = max(self._frames_in_flight - 1, 0)
+
+
+    def _deliver_frame(self, coalescer: FrameCoalescer, dirty_keys) -> bool:
+        """ publishes one frame: the frame's new markers (sendMarkerData, for the message log) first, then one dataAvailable per
+        stream that received samples (and, with push_payloads, one sendData per stream with everything collected since the previous frame)
+        """
+        batches, (send_mrk_stream_names, send_mrk_ts, send_mrk_data) = coalescer.take()
+        n_emitted = 0
+        if send_mrk_ts:
+            self.sendMarkerData.emit(send_mrk_stream_names, send_mrk_ts, send_mrk_data)
+            n_emitted += 1
+        for key in dirty_keys:
+            params = self.stream_params.get(key)
+            ring = self.ring_buffers.get(key)
+            if (params is None) or (ring is None):
+                continue # stream was removed meanwhile
+            self.dataAvailable.emit(params['metadata'].get('name') or key, ring.head)
+            n_emitted += 1
+        for key, (sig_ts, sig_data) in batches.items():
+            params = self.stream_params.get(key)
+            if params is None:
+                continue
+            stream_name = params['metadata'].get('name') or key
+            # Emit in standardized order
+            self.sendData.emit(stream_name, sig_ts, sig_data, [], [], [])
+            n_emitted += 1
+        if n_emitted == 0:
+            return False
+        with self._frame_lock:
+            self._frames_in_flight += 1
+        self.frameDelivered.emit()
+        return True
+
 
     def run(self):
+        """ dispatch loop: writes worker chunks into the per-stream ring buffers as they arrive and notifies the GUI once per
+        display frame (dataAvailable with the new head index) instead of pushing the samples themselves.
+        While the GUI still has `max_frames_in_flight` undelivered frames queued, frames are skipped and data keeps coalescing
+        (the ring buffers bound how much a reader can fall behind; pushed payloads are bounded by the coalescer's drop policy),
+        so the Qt event queue cannot grow without bound.
+        """
         logger.info(f'DataThread run() started.')
-        if self.streams:
-            logger.info(f'DataThread run() started.')
-            while self._running:
-                # Aggregate markers once per loop; reuse for all numeric streams
-                send_mrk_ts, send_mrk_data, send_mrk_stream_names = [], [], []
-                is_marker = [_['is_marker'] for _ in self.stream_params]
-                if any(is_marker):
-                    for stream_ix, params in enumerate(self.stream_params):
-                        if is_marker[stream_ix]:
-                            d, ts = params['inlet'].pull_chunk()
-                            a_stream_name: str = params['metadata'].get('name') or f'stream[{stream_ix}]'
-                            ## hitting this a lot, but ts and d are always empty
-                            if ts:                                
-                                logger.info(f'\t marker stream [{stream_ix}] [{a_stream_name}] in .run(): {len(d)} samples, {len(ts)} timestamps.')
-                                send_mrk_stream_names.extend([a_stream_name] * len(d))
-                                send_mrk_data.extend(d)
-                                send_mrk_ts.extend(ts)
-                    ## END for stream_ix, params in enumerate(self.stream_params)...
-                ## END if any(is_marker)...
-
-
-
-                # Pull chunks for each non-marker stream and emit individually
-                for stream_ix, params in enumerate(self.stream_params):
-                    if params.get('is_marker'):
-                        continue
-                    inlet = params['inlet']
-                    pull_kwargs = {'timeout': 1}
-                    if params.get('chunkSize'):
-                        pull_kwargs['max_samples'] = params['chunkSize']
-                    sig_data, sig_ts = inlet.pull_chunk(**pull_kwargs)
-                    if sig_ts and params.get('downSampling'):
-                        # Downsample by simple mean over contiguous blocks
-                        for m in range(round(params['chunkSize'] / params['downSamplingFactor'])):
-                            end_idx = min((m + 1) * params['downSamplingFactor'], len(sig_data))
-                            for ch_idx in range(int(self.streams[stream_ix].channel_count())):
-                                buf = [sig_data[n][ch_idx] for n in range(m * params['downSamplingFactor'], end_idx)]
-                                params['downSamplingBuffer'][m][ch_idx] = sum(buf) / len(buf)
-                        sig_data = params['downSamplingBuffer']
-
-                    if sig_ts or send_mrk_ts:
-                        stream_name = params['metadata'].get('name') or f'stream_{stream_ix}'
-                        # Emit in standardized order
-                        # self.sendSingleStreamData.emit(stream_name, sig_ts, sig_data)
-                        self.sendData.emit(stream_name, sig_ts, sig_data, send_mrk_stream_names, send_mrk_ts, send_mrk_data)
-                        
-
-                ## END for stream_ix, params in enumerate(self.stream_params):...
-                ## only emit after all streams are aggregated:
-                # self.sendData.emit(stream_name, sig_ts, sig_data, send_mrk_stream_names, send_mrk_ts, send_mrk_data)
-
-                if send_mrk_ts:
-                    self.sendMarkerData.emit(send_mrk_stream_names, send_mrk_ts, send_mrk_data)
-
-            ## END while self._running:...
+        coalescer = FrameCoalescer(max_pending_seconds=self.max_pending_seconds, drop_policy=self.drop_policy)
+        dirty_keys = set() ## streams whose ring buffer received samples since the last delivered frame
+        next_frame_t = time.monotonic()
+        while self._running:
+            frame_interval = 1.0 / max(self.delivery_fps, 1e-3)
+            # Wait for chunks until the next frame is due, then drain whatever else has already been queued
+            wait_t = min(max(next_frame_t - time.monotonic(), 0.0), self.dispatch_poll_timeout)
+            try:
+                batch = [self._chunk_queue.get(timeout=wait_t)] if wait_t > 0 else []
+            except queue.Empty:
+                batch = []
+            while True:
+                try:
+                    batch.append(self._chunk_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for key, is_marker, ts, d in batch:
+                if is_marker is None:
+                    self._on_ingest_event(key, ts, d) ## (key, None, event, payload) from an ingestion process
+                    continue
+                params = self.stream_params.get(key)
+                if params is None:
+                    continue # chunks of streams removed meanwhile are dropped
+                if is_marker:
+                    a_stream_name: str = params['metadata'].get('name') or key
+                    logger.info(f'\t marker stream [{a_stream_name}] in .run(): {len(d)} samples, {len(ts)} timestamps.')
+                    a_names = [a_stream_name] * len(d)
+                    self.marker_store.add(a_names, ts, d) ## visible to the plots right away, independent of any signal chunk
+                    coalescer.add_markers(a_names, ts, d)
+                    if self.recorder is not None:
+                        self.recorder.write_chunk(key, ts, d)
+                elif ts is None:
+                    # process backend: the samples are already in the shared ring buffer, `d` is its new head
+                    dirty_keys.add(key)
+                    ring = self.ring_buffers.get(key)
+                    if self.push_payloads and (ring is not None):
+                        ring_ts, ring_data, start = ring.read(self._payload_index.get(key, 0), d)
+                        self._payload_index[key] = start + len(ring_ts)
+                        coalescer.add_chunk(key, ring_ts.copy(), ring_data.copy())
+                    if (self.recorder is not None) and (ring is not None) and (key in self._record_index):
+                        ring_ts, ring_data, start = ring.read(self._record_index[key], d)
+                        if start > self._record_index[key]:
+                            logger.warning(f'DataThread: recording of {key!r} lost {start - self._record_index[key]} samples (ring buffer overrun).')
+                        self._record_index[key] = start + len(ring_ts)
+                        self.recorder.write_chunk(key, ring_ts.copy(), ring_data.copy())
+                else:
+                    ring = self.ring_buffers.get(key)
+                    if ring is not None:
+                        ring.write(ts, d)
+                        dirty_keys.add(key)
+                    if self.push_payloads:
+                        coalescer.add_chunk(key, ts, d)
+                    if self.recorder is not None:
+                        self.recorder.write_chunk(key, ts, d)
+            ## END for key, is_marker, ts, d in batch...
+            if self.recorder is not None:
+                self._record_clock_offsets()
+
+            now = time.monotonic()
+            if now < next_frame_t:
+                continue
+            # advance on a fixed clock; if we fell more than a frame behind, resynchronize rather than bursting
+            next_frame_t = next_frame_t + frame_interval if (now - next_frame_t) < frame_interval else now + frame_interval
+            if not (dirty_keys or coalescer.has_pending()):
+                continue
+            with self._frame_lock:
+                backlogged = self._frames_in_flight >= self.max_frames_in_flight
+            if backlogged:
+                self.skipped_frames += 1
+                continue
+            self._deliver_frame(coalescer, dirty_keys)
+            dirty_keys = set()
+            if coalescer.dropped_samples != self.dropped_samples:
+                logger.warning(f'DataThread: GUI is falling behind; {coalescer.dropped_samples - self.dropped_samples} samples dropped ({self.drop_policy}).')
+                self.dropped_samples = coalescer.dropped_samples
 
+        ## END while self._running:...
 
         logger.info(f'DataThread run() finished.')
 
     def stop(self):
-        """Cooperatively stop the thread's loop and wait for exit."""
+        """Cooperatively stop the thread's loop and its inlet workers."""
         try:
             self._running = False
+            if self._discovery is not None:
+                self._discovery.stop()
+            self._stop_workers()
+            self.stop_recording(wait=True)
+            if self._process_pool is not None:
+                self._process_pool.stop()
+                for a_ring in list(self.ring_buffers.values()):
+                    if isinstance(a_ring, SharedStreamRingBuffer):
+                        a_ring.release()
         except Exception:
             pass
         
\ No newline at end of file
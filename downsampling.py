@@ -0,0 +1,205 @@
+import logging
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+logger = logging.getLogger("phohale.sigvisualizer.downsampling")
+
+
+class Decimator:
+    """ Chunk-wise decimation stage for a single stream.
+
+    `process(sig_ts, sig_data)` takes a chunk of timestamps (n_samples,) and samples (n_samples, n_channels) and returns the
+    decimated (ts, data) arrays. Any state needed to make consecutive chunks join seamlessly (partial blocks, filter history)
+    is carried inside the instance, so one decimator must be used per stream.
+    """
+    name: str = None
+
+    def __init__(self, factor: int, n_channels: int):
+        self.factor = max(int(factor), 1)
+        self.n_channels = int(n_channels)
+        self.reset()
+
+    def reset(self):
+        """ drops any state carried over from previous chunks """
+        self._pending_ts = np.empty((0,), dtype=np.float64)
+        self._pending_data = None
+
+    def _take_pending(self, sig_ts, sig_data):
+        """ returns the pending samples from previous chunks concatenated with the new chunk """
+        sig_ts = np.asarray(sig_ts, dtype=np.float64)
+        sig_data = np.asarray(sig_data)
+        if self._pending_data is None or len(self._pending_ts) == 0:
+            return sig_ts, sig_data
+        return np.concatenate((self._pending_ts, sig_ts)), np.concatenate((self._pending_data, sig_data), axis=0)
+
+    def _keep_pending(self, ts, data):
+        self._pending_ts = ts.copy()
+        self._pending_data = data.copy()
+
+    def _empty(self, sig_data):
+        return np.empty((0,), dtype=np.float64), np.empty((0, self.n_channels), dtype=np.asarray(sig_data).dtype)
+
+    def process(self, sig_ts, sig_data):
+        raise NotImplementedError
+
+
+class _BlockDecimator(Decimator):
+    """ Reduces consecutive blocks of `factor` samples; samples that don't fill a whole block are held until the next chunk. """
+
+    def process(self, sig_ts, sig_data):
+        ts, data = self._take_pending(sig_ts, sig_data)
+        n_blocks = len(ts) // self.factor
+        n_used = n_blocks * self.factor
+        self._keep_pending(ts[n_used:], data[n_used:])
+        if n_blocks == 0:
+            return self._empty(data)
+        ts_blocks = ts[:n_used].reshape(n_blocks, self.factor)
+        data_blocks = data[:n_used].reshape(n_blocks, self.factor, data.shape[1])
+        return self._reduce_blocks(ts_blocks, data_blocks)
+
+    def _reduce_blocks(self, ts_blocks, data_blocks):
+        raise NotImplementedError
+
+
+class BlockMeanDecimator(_BlockDecimator):
+    """ Block average: one sample per block, stamped with the block's mean timestamp. """
+    name = 'mean'
+
+    def _reduce_blocks(self, ts_blocks, data_blocks):
+        out_dtype = np.result_type(data_blocks.dtype, np.float32)
+        return ts_blocks.mean(axis=1), data_blocks.mean(axis=1, dtype=out_dtype)
+
+
+class MinMaxDecimator(_BlockDecimator):
+    """ Peak-preserving envelope: two samples per block holding each channel's min and max, in the order they occurred.
+    The output rate is 2 / factor of the input rate, so use factor >= 2 for an actual reduction.
+    """
+    name = 'minmax'
+
+    def _reduce_blocks(self, ts_blocks, data_blocks):
+        n_blocks = data_blocks.shape[0]
+        idx_min = data_blocks.argmin(axis=1)
+        idx_max = data_blocks.argmax(axis=1)
+        v_min = np.take_along_axis(data_blocks, idx_min[:, None, :], axis=1)[:, 0, :]
+        v_max = np.take_along_axis(data_blocks, idx_max[:, None, :], axis=1)[:, 0, :]
+        min_first = idx_min <= idx_max
+        out = np.empty((n_blocks, 2, data_blocks.shape[2]), dtype=data_blocks.dtype)
+        out[:, 0, :] = np.where(min_first, v_min, v_max)
+        out[:, 1, :] = np.where(min_first, v_max, v_min)
+        # channels disagree on where their extrema are, so share the block's first and middle timestamps
+        half = self.factor // 2
+        out_ts = np.stack((ts_blocks[:, 0], ts_blocks[:, half]), axis=1)
+        return out_ts.reshape(-1), out.reshape(-1, data_blocks.shape[2])
+
+
+class LTTBDecimator(Decimator):
+    """ Largest-Triangle-Three-Buckets: keeps one real sample per bucket of `factor` samples, chosen to maximise the triangle
+    formed with the previously kept sample and the mean of the next bucket. Areas are summed over channels (each scaled by the
+    chunk's range) so all channels share one set of timestamps.
+    The last full bucket of each chunk needs the following bucket's mean, so it is held back until the next chunk arrives.
+    """
+    name = 'lttb'
+
+    def reset(self):
+        super().reset()
+        self._prev_t = None
+        self._prev_y = None
+
+    def process(self, sig_ts, sig_data):
+        ts, data = self._take_pending(sig_ts, sig_data)
+        n_buckets = len(ts) // self.factor
+        if n_buckets < 2:
+            self._keep_pending(ts, data)
+            return self._empty(data)
+
+        n_ready = n_buckets - 1
+        n_used = n_ready * self.factor
+        self._keep_pending(ts[n_used:], data[n_used:])
+
+        y = data.astype(np.float64, copy=False)
+        span = np.ptp(y[:n_used + self.factor], axis=0)
+        weights = 1.0 / np.where(span > 0, span, 1.0)
+        ts_buckets = ts[:n_buckets * self.factor].reshape(n_buckets, self.factor)
+        y_buckets = y[:n_buckets * self.factor].reshape(n_buckets, self.factor, y.shape[1])
+        next_t = ts_buckets[1:].mean(axis=1)
+        next_y = y_buckets[1:].mean(axis=1)
+
+        prev_t, prev_y = self._prev_t, self._prev_y
+        keep_idx = np.empty((n_ready,), dtype=np.int64)
+        for b in range(n_ready):
+            cand_t = ts_buckets[b]
+            cand_y = y_buckets[b]
+            if prev_t is None:
+                # no previous point yet: keep the first sample
+                choice = 0
+            else:
+                area = np.abs((prev_t - next_t[b]) * (cand_y - prev_y) - (prev_t - cand_t)[:, None] * (next_y[b] - prev_y))
+                choice = int(np.argmax(area @ weights))
+            keep_idx[b] = b * self.factor + choice
+            prev_t, prev_y = cand_t[choice], cand_y[choice]
+        self._prev_t, self._prev_y = prev_t, prev_y
+        return ts[keep_idx], data[keep_idx]
+
+
+class FIRDecimator(Decimator):
+    """ Anti-aliased decimation: a windowed-sinc low-pass FIR evaluated only at every `factor`-th output position.
+    The last `n_taps - 1` input samples (and the output phase) carry across chunks so the filter runs continuously.
+    Output timestamps are compensated for the filter's group delay.
+    """
+    name = 'fir'
+
+    def __init__(self, factor: int, n_channels: int, taps_per_factor: int = 8, cutoff: float = 0.8):
+        self.taps = self.design_lowpass(max(int(factor), 1), taps_per_factor=taps_per_factor, cutoff=cutoff)
+        super().__init__(factor, n_channels)
+
+    @staticmethod
+    def design_lowpass(factor: int, taps_per_factor: int = 8, cutoff: float = 0.8):
+        """ Hamming-windowed sinc with unity DC gain whose corner sits at `cutoff` times the decimated Nyquist frequency """
+        n_taps = (taps_per_factor * factor) | 1
+        fc = cutoff / (2.0 * factor)  # cycles per input sample
+        n = np.arange(n_taps) - (n_taps - 1) / 2.0
+        taps = 2.0 * fc * np.sinc(2.0 * fc * n) * np.hamming(n_taps)
+        return taps / taps.sum()
+
+    def reset(self):
+        super().reset()
+        self._phase = 0 ## index (into pending+chunk) of the next output sample's window start
+
+    def process(self, sig_ts, sig_data):
+        n_taps = len(self.taps)
+        sig_ts = np.asarray(sig_ts, dtype=np.float64)
+        sig_data = np.asarray(sig_data)
+        if self._pending_data is None and len(sig_ts):
+            # prime the filter history with the first sample to avoid a start-up transient from zeros
+            self._pending_ts = np.full((n_taps - 1,), sig_ts[0])
+            self._pending_data = np.repeat(sig_data[:1], n_taps - 1, axis=0)
+        ts, data = self._take_pending(sig_ts, sig_data)
+        out_dtype = np.result_type(data.dtype, np.float32)
+        if len(ts) < n_taps:
+            self._keep_pending(ts, data)
+            return np.empty((0,), dtype=np.float64), np.empty((0, self.n_channels), dtype=out_dtype)
+
+        n_windows = len(ts) - n_taps + 1
+        starts = np.arange(self._phase, n_windows, self.factor)
+        windows = sliding_window_view(data, n_taps, axis=0)  # (n_windows, n_channels, n_taps), no copy
+        out_data = (windows[starts] @ self.taps[::-1]).astype(out_dtype, copy=False)
+        out_ts = ts[starts + (n_taps - 1) // 2]
+
+        next_start = (starts[-1] + self.factor) if len(starts) else self._phase
+        keep_from = min(next_start, len(ts) - (n_taps - 1))
+        self._phase = next_start - keep_from
+        self._keep_pending(ts[keep_from:], data[keep_from:])
+        return out_ts, out_data
+
+
+## registry of available decimation methods, keyed by the name used in DataThread's per-stream downsampling settings
+DECIMATORS = {a_cls.name: a_cls for a_cls in (BlockMeanDecimator, MinMaxDecimator, LTTBDecimator, FIRDecimator)}
+
+
+def make_decimator(method: str, factor: int, n_channels: int) -> Decimator:
+    """ builds a fresh decimator for `method` (one of DECIMATORS), raising ValueError for unknown methods """
+    try:
+        a_cls = DECIMATORS[method]
+    except KeyError:
+        raise ValueError(f'Unknown downsampling method {method!r}; expected one of {sorted(DECIMATORS)}') from None
+    return a_cls(factor, n_channels)
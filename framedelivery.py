@@ -0,0 +1,76 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger("phohale.sigvisualizer.framedelivery")
+
+DROP_OLDEST = 'drop_oldest' ## keep the newest data when a stream's pending batch overflows (live view stays current)
+DROP_NEWEST = 'drop_newest' ## keep the oldest data and discard incoming chunks while the batch is full (no gaps inside a batch)
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST)
+
+
+class FrameCoalescer:
+    """ Collects the chunks that arrive between two display frames into one batch per stream.
+
+    `add_chunk()` queues a numeric chunk, `add_markers()` marker samples; `take()` hands back everything collected since the
+    previous `take()` with each stream's chunks concatenated. A stream's pending batch is bounded to `max_pending_seconds`
+    of data (by timestamp span); when it would grow beyond that, whole chunks are dropped according to `drop_policy`.
+    Markers are not subject to the drop policy, but at most `max_pending_markers` of them are kept per batch: beyond that
+    the oldest pending markers are dropped (counted in `dropped_markers` and logged).
+    """
+
+    def __init__(self, max_pending_seconds: float = 2.0, drop_policy: str = DROP_OLDEST, max_pending_markers: int = 10000):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f'Unknown drop policy {drop_policy!r}; expected one of {DROP_POLICIES}')
+        self.max_pending_seconds = max_pending_seconds
+        self.drop_policy = drop_policy
+        self.max_pending_markers = max_pending_markers
+        self.dropped_samples = 0 ## running count of samples discarded by the drop policy
+        self.dropped_markers = 0 ## running count of markers discarded beyond max_pending_markers
+        self._pending = {} ## stream key -> list of (ts, data) chunks, oldest first
+        self._marker_names, self._marker_ts, self._marker_data = [], [], []
+
+
+    def _span(self, chunks) -> float:
+        return float(chunks[-1][0][-1] - chunks[0][0][0])
+
+
+    def add_chunk(self, key, ts, data):
+        if len(ts) == 0:
+            return
+        chunks = self._pending.setdefault(key, [])
+        if chunks and self.drop_policy == DROP_NEWEST and (float(ts[-1]) - float(chunks[0][0][0])) > self.max_pending_seconds:
+            self.dropped_samples += len(ts)
+            return
+        chunks.append((np.asarray(ts, dtype=np.float64), np.asarray(data)))
+        while len(chunks) > 1 and self._span(chunks) > self.max_pending_seconds:
+            dropped_ts, _ = chunks.pop(0)
+            self.dropped_samples += len(dropped_ts)
+
+
+    def add_markers(self, names, ts, data):
+        self._marker_names.extend(names)
+        self._marker_ts.extend(ts)
+        self._marker_data.extend(data)
+        overflow = len(self._marker_ts) - self.max_pending_markers
+        if overflow > 0:
+            del self._marker_names[:overflow], self._marker_ts[:overflow], self._marker_data[:overflow]
+            self.dropped_markers += overflow
+            logger.warning(f'FrameCoalescer: more than {self.max_pending_markers} markers pending, dropped the oldest {overflow} ({self.dropped_markers} so far).')
+
+
+    def has_pending(self) -> bool:
+        return bool(self._pending) or bool(self._marker_ts)
+
+
+    def take(self):
+        """ returns ({key: (ts, data)}, (marker_names, marker_ts, marker_data)) and starts a new batch """
+        batches = {}
+        for key, chunks in self._pending.items():
+            if len(chunks) == 1:
+                batches[key] = chunks[0]
+            else:
+                batches[key] = (np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks], axis=0))
+        markers = (self._marker_names, self._marker_ts, self._marker_data)
+        self._pending = {}
+        self._marker_names, self._marker_ts, self._marker_data = [], [], []
+        return batches, markers
@@ -0,0 +1,331 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from ringbuffer import StreamRingBuffer
+
+logger = logging.getLogger("phohale.sigvisualizer.IngestProcess")
+
+_HEADER_BYTES = 64 ## the shared head counter lives in its own cache line in front of the sample arrays
+
+## events an ingestion process reports as (key, None, event, payload)
+EVENT_OPENED = 'opened' ## payload {'info_xml': full info XML or None, 'clock_offset': (collection_time, offset) or None}
+EVENT_OPEN_FAILED = 'open_failed' ## payload None: the stream could not be re-resolved/opened
+EVENT_CLOCK_OFFSET = 'clock_offset' ## payload (collection_time, offset), measured every clock_offset_interval
+
+
+def _attach_shared_memory(name: str):
+    """ attaches to an existing block without registering it with this process's resource tracker (the creator owns it) """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError: ## Python < 3.13 has no `track` argument
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedStreamRingBuffer(StreamRingBuffer):
+    """ StreamRingBuffer whose head counter, timestamps and samples live in one `multiprocessing.shared_memory` block, so an
+    ingestion process can write it while the GUI process reads views of the very same memory.
+
+    The GUI process creates (and owns) the block; the writer attaches with `attach(spec())`. The single-producer protocol is
+    unchanged: the writer stores the samples, then publishes `head`.
+    """
+
+    def __init__(self, capacity: int, n_channels: int, dtype=np.float32, guard: int = None, name: str = None):
+        self.capacity = int(capacity)
+        self.n_channels = int(n_channels)
+        self.guard = int(guard) if guard is not None else max(self.capacity // 8, 1)
+        dtype = np.dtype(dtype)
+        ts_bytes = 2 * self.capacity * np.dtype(np.float64).itemsize
+        data_bytes = 2 * self.capacity * max(self.n_channels, 1) * dtype.itemsize
+        self.is_owner = name is None
+        if self.is_owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=_HEADER_BYTES + ts_bytes + data_bytes)
+        else:
+            self._shm = _attach_shared_memory(name)
+        buf = self._shm.buf
+        self._head = np.ndarray((1,), dtype=np.int64, buffer=buf, offset=0)
+        self._ts = np.ndarray((2 * self.capacity,), dtype=np.float64, buffer=buf, offset=_HEADER_BYTES)
+        self._data = np.ndarray((2 * self.capacity, self.n_channels), dtype=dtype, buffer=buf, offset=_HEADER_BYTES + ts_bytes)
+        if self.is_owner:
+            self._head[0] = 0
+
+
+    @property
+    def head(self) -> int:
+        return int(self._head[0])
+
+    @head.setter
+    def head(self, value: int):
+        self._head[0] = value
+
+
+    def spec(self) -> dict:
+        """ picklable description another process passes to `attach()` """
+        return {'name': self._shm.name, 'capacity': self.capacity, 'n_channels': self.n_channels, 'dtype': self.dtype.str, 'guard': self.guard}
+
+
+    @classmethod
+    def attach(cls, spec: dict) -> 'SharedStreamRingBuffer':
+        return cls(spec['capacity'], spec['n_channels'], dtype=np.dtype(spec['dtype']), guard=spec['guard'], name=spec['name'])
+
+
+    def release(self):
+        """ detaches from the block; the owner also unlinks it. Views handed out earlier keep the mapping alive until dropped. """
+        try:
+            if self.is_owner:
+                self._shm.unlink()
+        except FileNotFoundError:
+            pass
+        self._head, self._ts, self._data = self._head.copy(), self._ts[:0].copy(), self._data[:0].copy()
+        try:
+            self._shm.close()
+        except BufferError:
+            pass ## a reader still holds a view; the mapping goes away with it
+
+
+
+def _open_stream_in_process(spec: dict, resolve_timeout: float):
+    """ re-resolves a stream by uid inside the ingestion process and builds the params dict an InletWorker expects.
+    Returns (params, opened) where `opened` is the payload of the 'opened' event sent back to the GUI process: the full info
+    XML if the GUI asked for it (`spec['fetch_info']`) and a first (blocking) clock offset as (collection_time, offset).
+    """
+    import pylsl
+    from downsampling import make_decimator
+
+    results = pylsl.resolve_byprop('uid', spec['uid'], 1, resolve_timeout)
+    if not results:
+        return None, None
+    params = {'metadata': {'name': spec['name'], 'srate': spec['srate'], 'ch_count': spec['ch_count']},
+              'inlet': pylsl.StreamInlet(results[0], processing_flags=(pylsl.proc_monotonize|pylsl.proc_clocksync)),
+              'is_marker': spec['is_marker'], 'pull_buffer': None, 'decimator': None}
+    opened = {'info_xml': None, 'clock_offset': None}
+    if spec.get('fetch_info'):
+        opened['info_xml'] = params['inlet'].info(timeout=resolve_timeout).as_xml()
+    try:
+        opened['clock_offset'] = (pylsl.local_clock(), params['inlet'].time_correction(timeout=resolve_timeout))
+    except Exception as e:
+        logger.warning(f'IngestProcess could not measure the clock offset of {spec["name"]!r}: {e}')
+    if spec.get('pull_buffer_shape') is not None:
+        params['pull_buffer'] = np.zeros(spec['pull_buffer_shape'], dtype=np.dtype(spec['pull_buffer_dtype']), order='C')
+    if (spec.get('factor') or 1) > 1:
+        params['decimator'] = make_decimator(spec['method'], spec['factor'], spec['ch_count'])
+    return params, opened
+
+
+def _measure_clock_offsets(params_by_key: dict, lock, notify_queue):
+    """ reports each open inlet's current clock offset as a `(key, None, EVENT_CLOCK_OFFSET, (collection_time, offset))` event """
+    import pylsl
+
+    with lock:
+        inlets = [(key, params['inlet']) for key, params in params_by_key.items()]
+    for key, inlet in inlets:
+        try:
+            notify_queue.put((key, None, EVENT_CLOCK_OFFSET, (pylsl.local_clock(), inlet.time_correction(timeout=0.0))))
+        except Exception as e:
+            logger.warning(f'IngestProcess could not measure the clock offset of {key!r}: {e}')
+
+
+def _ingest_process_main(command_queue, notify_queue, target_latency: float, resolve_timeout: float, clock_offset_interval: float):
+    """ entry point of one ingestion process.
+
+    A command thread opens/closes streams as the GUI process asks; each stream is pulled (and decimated) by an InletWorker
+    thread, and this process's main loop writes the numeric chunks into the streams' shared ring buffers. Per drained batch,
+    only the newest head of each stream is reported through `notify_queue` as `(key, False, None, head)`; marker chunks are
+    forwarded as `(key, True, ts, data)`. Stream lifecycle and clock offsets are reported as `(key, None, event, payload)`
+    (see the EVENT_* constants), every `clock_offset_interval` seconds for the clock offsets.
+    """
+    from downsampling import make_decimator
+    from inletworker import InletWorker
+
+    chunk_queue = queue.Queue()
+    workers, rings, params_by_key = {}, {}, {}
+    lock = threading.Lock()
+    stopping = threading.Event()
+
+    def _remove(key):
+        with lock:
+            a_worker = workers.pop(key, None)
+            a_ring = rings.pop(key, None)
+            params = params_by_key.pop(key, None)
+        if a_worker is not None:
+            a_worker.stop()
+            a_worker.join(1.0)
+        if params is not None:
+            try:
+                params['inlet'].close_stream()
+            except Exception:
+                pass
+        if a_ring is not None:
+            a_ring.release()
+
+    def _handle_commands():
+        while not stopping.is_set():
+            command, *args = command_queue.get()
+            try:
+                if command == 'add':
+                    spec = args[0]
+                    try:
+                        params, opened = _open_stream_in_process(spec, resolve_timeout)
+                        if params is None:
+                            raise LookupError(f'no stream with uid {spec["uid"]} was resolved')
+                    except Exception as e:
+                        logger.warning(f'IngestProcess could not open stream {spec["name"]!r}: {e}')
+                        notify_queue.put((spec['key'], None, EVENT_OPEN_FAILED, None))
+                        continue
+                    a_worker = InletWorker(spec['key'], params, chunk_queue, target_latency=target_latency)
+                    with lock:
+                        params_by_key[spec['key']] = params
+                        if spec.get('ring') is not None:
+                            rings[spec['key']] = SharedStreamRingBuffer.attach(spec['ring'])
+                        workers[spec['key']] = a_worker
+                    notify_queue.put((spec['key'], None, EVENT_OPENED, opened)) ## before the worker's first head notification
+                    a_worker.start()
+                elif command == 'remove':
+                    _remove(args[0])
+                elif command == 'downsampling':
+                    key, factor, method, n_channels = args
+                    with lock:
+                        params = params_by_key.get(key)
+                    if params is not None:
+                        params['decimator'] = make_decimator(method, factor, n_channels) if factor > 1 else None
+                elif command == 'stop':
+                    stopping.set()
+            except Exception as e:
+                logger.exception(f'IngestProcess command {command!r} failed: {e}')
+
+    command_thread = threading.Thread(target=_handle_commands, name='IngestCommands', daemon=True)
+    command_thread.start()
+    next_clock_offset_t = time.monotonic() + clock_offset_interval
+    while not stopping.is_set():
+        if time.monotonic() >= next_clock_offset_t:
+            _measure_clock_offsets(params_by_key, lock, notify_queue)
+            next_clock_offset_t = time.monotonic() + clock_offset_interval
+        try:
+            batch = [chunk_queue.get(timeout=0.2)]
+        except queue.Empty:
+            continue
+        while True:
+            try:
+                batch.append(chunk_queue.get_nowait())
+            except queue.Empty:
+                break
+        heads = {}
+        for key, is_marker, ts, d in batch:
+            if is_marker:
+                notify_queue.put((key, True, list(ts), list(d)))
+                continue
+            with lock:
+                a_ring = rings.get(key)
+            if a_ring is not None:
+                heads[key] = a_ring.write(ts, d)
+        for key, head in heads.items():
+            notify_queue.put((key, False, None, head))
+
+    for key in list(workers.keys()):
+        _remove(key)
+
+
+
+class IngestionProcessPool:
+    """ Runs the pull/decimate work of numeric and marker streams in `n_processes` separate processes, outside the GUI
+    process's GIL. Each stream is assigned to the least-loaded process, which re-resolves it by uid, opens the only inlet of
+    the stream and writes its samples into the stream's SharedStreamRingBuffer. A forwarding thread relays the processes'
+    notifications into `out_queue` (the DataThread's chunk queue): `(key, False, None, head)` for numeric streams,
+    `(key, True, ts, data)` for markers and `(key, None, event, payload)` for the EVENT_* events.
+    """
+
+    def __init__(self, out_queue: queue.Queue, n_processes: int = 2, target_latency: float = 0.05, resolve_timeout: float = 5.0,
+                 clock_offset_interval: float = 5.0):
+        self.out_queue = out_queue
+        self.n_processes = max(int(n_processes), 1)
+        self.target_latency = target_latency
+        self.resolve_timeout = resolve_timeout
+        self.clock_offset_interval = clock_offset_interval
+        self._ctx = multiprocessing.get_context('spawn') ## never fork a process that has Qt (and liblsl) threads running
+        self._notify_queue = self._ctx.Queue()
+        self._processes = [] ## (process, command_queue)
+        self._assignments = {} ## stream key -> process index
+        self._lock = threading.Lock()
+        self._forwarder = None
+        self._running = False
+
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            for i in range(self.n_processes):
+                command_queue = self._ctx.Queue()
+                a_process = self._ctx.Process(target=_ingest_process_main, name=f'IngestProcess-{i}', daemon=True,
+                                              args=(command_queue, self._notify_queue, self.target_latency, self.resolve_timeout,
+                                                    self.clock_offset_interval))
+                a_process.start()
+                self._processes.append((a_process, command_queue))
+        self._forwarder = threading.Thread(target=self._forward_notifications, name='IngestForwarder', daemon=True)
+        self._forwarder.start()
+        logger.info(f'IngestionProcessPool started {self.n_processes} process(es).')
+
+
+    def _forward_notifications(self):
+        while self._running:
+            try:
+                self.out_queue.put(self._notify_queue.get(timeout=0.2))
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+
+    def add_stream(self, key: str, params: dict, ring: SharedStreamRingBuffer = None, fetch_info: bool = False):
+        """ hands a registered stream to the least-loaded ingestion process, which reports EVENT_OPENED (with the full info
+        XML if `fetch_info`) or EVENT_OPEN_FAILED. The process allocates the pull buffer described by `params['pull_buffer_layout']`. """
+        self.start()
+        metadata = params['metadata']
+        pull_buffer_layout = params.get('pull_buffer_layout')
+        spec = {'key': key, 'uid': metadata['uid'], 'name': metadata.get('name') or key, 'is_marker': params['is_marker'],
+                'srate': metadata.get('srate') or 0.0, 'ch_count': metadata.get('ch_count', 0),
+                'factor': params.get('downSamplingFactor') or 1, 'method': params.get('downSamplingMethod'),
+                'pull_buffer_shape': pull_buffer_layout[0] if pull_buffer_layout is not None else None,
+                'pull_buffer_dtype': np.dtype(pull_buffer_layout[1]).str if pull_buffer_layout is not None else None,
+                'ring': ring.spec() if ring is not None else None, 'fetch_info': fetch_info}
+        with self._lock:
+            loads = [0] * len(self._processes)
+            for a_index in self._assignments.values():
+                loads[a_index] += 1
+            a_index = loads.index(min(loads))
+            self._assignments[key] = a_index
+            self._processes[a_index][1].put(('add', spec))
+
+
+    def remove_stream(self, key: str):
+        with self._lock:
+            a_index = self._assignments.pop(key, None)
+            if a_index is not None:
+                self._processes[a_index][1].put(('remove', key))
+
+
+    def set_downsampling(self, key: str, factor: int, method: str, n_channels: int):
+        with self._lock:
+            a_index = self._assignments.get(key)
+            if a_index is not None:
+                self._processes[a_index][1].put(('downsampling', key, factor, method, n_channels))
+
+
+    def stop(self, timeout: float = 2.0):
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            processes, self._processes = self._processes, []
+            self._assignments.clear()
+        for _, command_queue in processes:
+            command_queue.put(('stop',))
+        for a_process, _ in processes:
+            a_process.join(timeout)
+            if a_process.is_alive():
+                a_process.terminate()
+        logger.info(f'IngestionProcessPool stopped.')
@@ -0,0 +1,107 @@
+import logging
+import queue
+import threading
+import time
+import numpy as np
+from pollscheduler import AdaptivePollScheduler
+
+logger = logging.getLogger("phohale.sigvisualizer.InletWorker")
+
+
+def pull_numeric_chunk(params, **pull_kwargs):
+    """ pulls a numeric chunk for a stream, returning (sig_data, sig_ts).
+    With a preallocated `pull_buffer` liblsl writes directly into it and the filled rows are returned as an NDArray alongside a float64 timestamp array.
+    The filled rows are copied out of the pull buffer (a single contiguous memcpy) so the emitted array stays valid after the buffer is reused by the next pull.
+    """
+    inlet = params['inlet']
+    pull_buffer = params.get('pull_buffer')
+    if pull_buffer is None:
+        return inlet.pull_chunk(**pull_kwargs)
+
+    pull_kwargs['max_samples'] = min(pull_kwargs.get('max_samples') or pull_buffer.shape[0], pull_buffer.shape[0])
+    _, sig_ts = inlet.pull_chunk(dest_obj=pull_buffer, **pull_kwargs)
+    n_samples = len(sig_ts)
+    if n_samples == 0:
+        return pull_buffer[:0], np.empty((0,), dtype=np.float64)
+    return pull_buffer[:n_samples].copy(), np.asarray(sig_ts, dtype=np.float64)
+
+
+class InletWorker(threading.Thread):
+    """ Pulls chunks from a single stream's inlet on its own thread and hands them to a queue shared by all workers.
+
+    Each worker only ever touches its own inlet, so a quiet or stalled stream no longer delays the others.
+    Pulls never block: an AdaptivePollScheduler picks each wake-up from the stream's nominal/observed rate and
+    `samples_available()`, and the worker sleeps until then, so idle streams cost (almost) no CPU and no sample waits
+    longer than `target_latency` in the inlet. Irregular-rate numeric streams are paced from their observed arrival rate.
+    Numeric chunks are decimated here (with the stream's decimator, if any) before being queued as
+    `(stream_key, is_marker, ts, data)` tuples; marker streams are served the same way with their raw string samples.
+    """
+
+    def __init__(self, stream_key: str, params: dict, out_queue: queue.Queue, target_latency: float = 0.05, open_timeout: float = 1.0):
+        name = params['metadata'].get('name') or stream_key
+        super().__init__(name=f'InletWorker[{name}]', daemon=True)
+        self.stream_key = stream_key
+        self.params = params
+        self.out_queue = out_queue
+        self.open_timeout = open_timeout ## how long each attempt to open the inlet's stream blocks, which also bounds stop() latency while connecting
+        pull_buffer = params.get('pull_buffer')
+        self.max_chunk_samples = pull_buffer.shape[0] if pull_buffer is not None else 1024
+        self.scheduler = AdaptivePollScheduler(nominal_srate=params['metadata'].get('srate') or 0.0, target_latency=target_latency,
+                                               max_chunk_samples=self.max_chunk_samples)
+        self._stop_event = threading.Event()
+
+
+    def stop(self):
+        self._stop_event.set()
+
+
+    def _pull(self):
+        """ pulls whatever is waiting in the inlet without blocking, returning (ts, data, n_pulled) where n_pulled counts samples before decimation """
+        params = self.params
+        if params['is_marker']:
+            data, ts = params['inlet'].pull_chunk(timeout=0.0, max_samples=self.max_chunk_samples)
+            return ts, data, len(ts)
+
+        sig_data, sig_ts = pull_numeric_chunk(params, timeout=0.0, max_samples=self.max_chunk_samples)
+        n_pulled = len(sig_ts)
+        decimator = params.get('decimator')
+        if n_pulled and (decimator is not None):
+            # Decimate the whole chunk at once; partial blocks/filter history carry over to the next chunk
+            sig_ts, sig_data = decimator.process(sig_ts, sig_data)
+        return sig_ts, sig_data, n_pulled
+
+
+    def _open_stream(self) -> bool:
+        """ subscribes the inlet so `samples_available()` reports buffered data, retrying until connected or stopped """
+        while not self._stop_event.is_set():
+            try:
+                self.params['inlet'].open_stream(timeout=self.open_timeout)
+                return True
+            except Exception as e:
+                logger.debug(f'{self.name} waiting to open stream: {e}')
+        return False
+
+
+    def run(self):
+        logger.info(f'{self.name} run() started.')
+        if not self._open_stream():
+            logger.info(f'{self.name} run() finished.')
+            return
+        inlet = self.params['inlet']
+        while not self._stop_event.is_set():
+            n_remaining = 0
+            try:
+                n_available = inlet.samples_available()
+                if n_available > 0:
+                    ts, data, n_pulled = self._pull()
+                    if len(ts):
+                        self.out_queue.put((self.stream_key, self.params['is_marker'], ts, data))
+                    n_remaining = max(n_available - n_pulled, 0)
+                else:
+                    n_pulled = 0
+                self.scheduler.observe(n_pulled)
+            except Exception as e:
+                logger.exception(f'{self.name} failed to pull a chunk: {e}')
+            deadline = self.scheduler.next_deadline(n_remaining)
+            self._stop_event.wait(max(deadline - time.monotonic(), 0.0))
+        logger.info(f'{self.name} run() finished.')
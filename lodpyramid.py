@@ -0,0 +1,105 @@
+import numpy as np
+from ringbuffer import StreamRingBuffer
+
+
+class MinMaxPyramid:
+    """ Multi-resolution min/max summary of a stream's history, for drawing long windows at a cost independent of their length.
+
+    Level L holds one bucket per `ratio ** (L + 1)` raw samples: the bucket's first timestamp and the per-channel minimum and
+    maximum (columns [:n_channels] and [n_channels:] of a StreamRingBuffer). Buckets are aligned to absolute raw indices, so
+    bucket k of level L covers raw samples [k * factor, (k + 1) * factor) and raw windows map to bucket ranges by integer
+    division. `write()` is O(chunk): each level reduces the complete buckets of the level below and keeps the incomplete remainder
+    for the next chunk. Levels are only built while they'd still have at least `min_buckets` buckets within `capacity` raw samples.
+
+    The pyramid has a single writer, which pulls from the raw history with `catch_up()` (renderprep.prepare_render does so on
+    the RenderPrepWorker), so the producer of the raw history never pays for it. If the raw history laps the pyramid, the
+    pyramid restarts at the oldest raw sample still readable, and raw indices before `first_index` read as empty.
+    """
+
+    def __init__(self, capacity: int, n_channels: int, dtype=np.float32, ratio: int = 4, min_buckets: int = 256):
+        self.ratio = int(ratio)
+        self.n_channels = int(n_channels)
+        self.head = 0 ## raw index up to which the pyramid is written
+        self.first_index = 0 ## raw index the pyramid (re)started at
+        self.levels = [] ## StreamRingBuffer per level
+        self.factors = [] ## raw samples per bucket, per level
+        factor = self.ratio
+        while (capacity // factor) >= min_buckets:
+            self.levels.append(StreamRingBuffer(capacity // factor + 2, 2 * self.n_channels, dtype=dtype))
+            self.factors.append(factor)
+            factor *= self.ratio
+        self._pending = [None] * len(self.levels) ## per level: (ts, lo, hi) of the rows not yet making up a full bucket
+
+
+    def catch_up(self, ring, stop: int = None):
+        """ writes the samples of the raw history `ring` (a StreamRingBuffer) from `head` up to `stop` (default: the ring's head) """
+        stop = ring.head if stop is None else min(int(stop), ring.head)
+        if self.head < ring.oldest_index:
+            self._restart(ring.oldest_index)
+        if stop <= self.head:
+            return
+        ts, data, start = ring.read(self.head, stop)
+        self.write(ts, data)
+        if not ring.is_valid(start):
+            self._restart(ring.head) ## the ring was overwritten while we were reading it
+
+
+    def _restart(self, start: int):
+        """ drops everything and continues at raw index `start`, rounded up so the buckets of every level stay aligned """
+        top = self.factors[-1] if self.factors else 1
+        start = -(-int(start) // top) * top
+        for level, factor in zip(self.levels, self.factors):
+            level.head = start // factor
+        self._pending = [None] * len(self.levels)
+        self.head = self.first_index = start
+
+
+    def write(self, ts, data):
+        """ feeds the raw chunk that starts at raw index `head` """
+        ts = np.asarray(ts, dtype=np.float64)
+        data = np.asarray(data)
+        self.head += len(ts)
+        lo = hi = data
+        for level_idx in range(len(self.levels)):
+            ts, lo, hi = self._reduce_into(level_idx, ts, lo, hi)
+            if len(ts) == 0:
+                break
+
+
+    def _reduce_into(self, level_idx: int, ts, lo, hi):
+        pending = self._pending[level_idx]
+        if pending is not None:
+            ts, lo, hi = np.concatenate((pending[0], ts)), np.concatenate((pending[1], lo)), np.concatenate((pending[2], hi))
+        r = self.ratio
+        n_full = (len(ts) // r) * r
+        self._pending[level_idx] = (ts[n_full:].copy(), lo[n_full:].copy(), hi[n_full:].copy()) if n_full < len(ts) else None
+        if n_full == 0:
+            return ts[:0], lo[:0], hi[:0]
+        k = n_full // r
+        bucket_ts = ts[:n_full:r]
+        bucket_lo = lo[:n_full].reshape(k, r, -1).min(axis=1)
+        bucket_hi = hi[:n_full].reshape(k, r, -1).max(axis=1)
+        self.levels[level_idx].write(bucket_ts, np.concatenate((bucket_lo, bucket_hi), axis=1))
+        return bucket_ts, bucket_lo, bucket_hi
+
+
+    def select_level(self, n_samples: int, n_pixels: int):
+        """ the coarsest level that still has at least two buckets per pixel column for a window of `n_samples` raw samples,
+        or None if the raw samples should be used """
+        chosen = None
+        for level_idx, factor in enumerate(self.factors):
+            if (n_samples // factor) >= 2 * n_pixels:
+                chosen = level_idx
+        return chosen
+
+
+    def read(self, level_idx: int, start: int, stop: int):
+        """ returns (bucket_ts, lo, hi, bucket_start) views of the complete buckets of a level within raw indices [start, stop) """
+        factor = self.factors[level_idx]
+        start = max(int(start), self.first_index)
+        ts, data, bucket_start = self.levels[level_idx].read(-(-start // factor), int(stop) // factor)
+        return ts, data[:, :self.n_channels], data[:, self.n_channels:], bucket_start
+
+
+    def is_valid(self, level_idx: int, bucket_start: int) -> bool:
+        return self.levels[level_idx].is_valid(bucket_start)
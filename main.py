@@ -1,6 +1,7 @@
+import multiprocessing
 import sys
 
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QStatusBar, QTreeWidgetItem, QLabel)
+from PyQt5.QtWidgets import QApplication
 
 from sigvisualizer import SigVisualizer
 
@@ -12,6 +13,7 @@ def main():
     return window                                
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() ## the ingestion processes are spawned; in a frozen (PyInstaller) build they must not re-run the GUI
     app = QApplication(sys.argv)
     window: SigVisualizer = main()
     sys.exit(app.exec_())
@@ -0,0 +1,136 @@
+import math
+import numpy as np
+import pyqtgraph as pg
+from pyqtgraph.Qt import QtCore, QtGui
+
+
+class MarkerOverlayItem(pg.GraphicsObject):
+    """ Persistent marker layer of one plot: draws every visible marker as a fixed-size triangle with its label.
+
+    The item lives as long as its plot. Marker positions are kept in preallocated arrays (grown by doubling, never shrunk),
+    labels are rendered once into a QStaticText cache, and the markers are in shared-time-axis coordinates, so scrolling
+    is just the view transform moving under them: `setMarkers()` only does work when the set of visible markers changed.
+    Markers closer together than `cluster_px` pixels are drawn as one cluster glyph labelled with their count.
+    """
+
+    def __init__(self, size: float = 14.0, cluster_px: float = 8.0, show_labels: bool = True, max_cached_labels: int = 1024,
+                 pen=None, brush=None, label_color='k'):
+        super().__init__()
+        self.size = float(size)
+        self.cluster_px = float(cluster_px)
+        self.show_labels = show_labels
+        self.max_cached_labels = max_cached_labels
+        self.pen = pg.mkPen('k', width=1) if pen is None else pg.mkPen(pen)
+        self.brush = pg.mkBrush('r') if brush is None else pg.mkBrush(brush)
+        self.cluster_brush = pg.mkBrush(255, 140, 0)
+        self.label_pen = pg.mkPen(label_color)
+        half = self.size * 0.5
+        self._glyph = QtGui.QPolygonF([QtCore.QPointF(-half, -half), QtCore.QPointF(half, -half), QtCore.QPointF(0.0, half)])
+        self._x = np.empty((64,), dtype=np.float64) ## marker (or cluster) x, first `_n` entries valid
+        self._count = np.empty((64,), dtype=np.int64) ## number of markers per entry (1 = single marker)
+        self._labels = [] ## label text per entry
+        self._n = 0
+        self._y = 0.0
+        self._key = None ## identifies the last marker set, so unchanged frames return early
+        self._label_cache = {} ## text -> QStaticText
+        self._label_width = 0.0 ## widest label in pixels, for the bounding rect
+        self._bounds = QtCore.QRectF()
+
+
+    def _reserve(self, n: int):
+        if n <= len(self._x):
+            return
+        capacity = len(self._x)
+        while capacity < n:
+            capacity *= 2
+        self._x = np.empty((capacity,), dtype=np.float64)
+        self._count = np.empty((capacity,), dtype=np.int64)
+
+
+    @staticmethod
+    def _label_text(sample) -> str:
+        if isinstance(sample, (list, tuple, np.ndarray)):
+            return str(sample[0]) if len(sample) else ''
+        return str(sample)
+
+
+    def _static_text(self, text: str):
+        static = self._label_cache.get(text)
+        if static is None:
+            if len(self._label_cache) >= self.max_cached_labels:
+                self._label_cache.clear()
+            static = QtGui.QStaticText(text)
+            static.setPerformanceHint(QtGui.QStaticText.PerformanceHint.AggressiveCaching)
+            self._label_cache[text] = static
+        return static
+
+
+    def setMarkers(self, ts, samples, x_origin: float, y: float, x_span: float, px_width: int):
+        """ shows the markers with timestamps `ts` (sorted) and samples `samples` at height `y`; `x_span` / `px_width` is the
+        current zoom (x units per pixel column), used to decide which markers are dense enough to cluster """
+        n = len(ts)
+        bin_width = self.cluster_px * float(x_span) / max(int(px_width), 1)
+        key = (n, ts[0] if n else None, ts[-1] if n else None, float(y), bin_width)
+        if key == self._key:
+            return
+        self._key = key
+        self._y = float(y)
+        if n == 0:
+            self._n = 0
+            self._labels = []
+        else:
+            x = np.asarray(ts, dtype=np.float64) - x_origin
+            bins = np.floor(x / bin_width) if bin_width > 0 else np.arange(n)
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(bins)) + 1))
+            counts = np.diff(np.append(starts, n))
+            self._reserve(len(starts))
+            m = len(starts)
+            self._count[:m] = counts
+            self._x[:m] = np.add.reduceat(x, starts) / counts ## clusters sit at their members' mean time
+            self._labels = [self._label_text(samples[i]) if c == 1 else f'{c}×' for i, c in zip(starts, counts)]
+            self._n = m
+        self._label_width = max((self._static_text(text).size().width() for text in self._labels if text), default=0.0) if self.show_labels else 0.0
+        self.prepareGeometryChange()
+        if self._n:
+            x_min, x_max = float(self._x[0]), float(self._x[self._n - 1])
+            self._bounds = QtCore.QRectF(x_min, self._y, x_max - x_min, 0.0)
+        else:
+            self._bounds = QtCore.QRectF()
+        self.update()
+
+
+    def clear(self):
+        self.setMarkers([], [], 0.0, self._y, 1.0, 1)
+
+
+    def viewTransformChanged(self):
+        self.prepareGeometryChange() ## the glyphs have a fixed pixel size, so the bounds (in data units) change with the zoom
+
+
+    def boundingRect(self):
+        if self._n == 0:
+            return QtCore.QRectF()
+        px, py = self.pixelVectors()
+        px_x = abs(px.x()) if px is not None else 0.0
+        pad_y = abs(py.y()) * self.size * 2.0 if py is not None else 0.0
+        return self._bounds.adjusted(-px_x * self.size, -pad_y, px_x * (self.size + self._label_width), pad_y)
+
+
+    def paint(self, p, *args):
+        if self._n == 0:
+            return
+        tr = p.transform()
+        p.resetTransform() ## draw glyphs and labels in device pixels so they keep their size at any zoom
+        p.setRenderHint(QtGui.QPainter.RenderHint.Antialiasing, True)
+        label_offset = QtCore.QPointF(self.size * 0.5 + 2.0, -self.size * 0.5 - 2.0)
+        label_free_x = -math.inf ## labels that would overlap the previous one are skipped (the glyphs are still drawn)
+        for i in range(self._n):
+            pt = tr.map(QtCore.QPointF(self._x[i], self._y))
+            p.setPen(self.pen)
+            p.setBrush(self.brush if self._count[i] == 1 else self.cluster_brush)
+            p.drawPolygon(self._glyph.translated(pt))
+            if self.show_labels and self._labels[i] and (pt.x() >= label_free_x):
+                static = self._static_text(self._labels[i])
+                p.setPen(self.label_pen)
+                p.drawStaticText(pt + label_offset, static)
+                label_free_x = pt.x() + label_offset.x() + static.size().width()
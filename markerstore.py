@@ -0,0 +1,76 @@
+import bisect
+import threading
+
+
+class MarkerStore:
+    """ Thread-safe, time-sorted store of the marker samples of all marker streams.
+
+    The dispatch loop `add()`s each marker chunk once; plots ask for the markers inside their visible time window with
+    `query()` (a binary search), so the cost of marker handling scales with the number of markers, not with markers × plots.
+    Markers almost always arrive in order and are appended; late ones are inserted at their place. Beyond `max_markers` the
+    oldest are discarded. `version` increases with every change, so readers can skip work when nothing new arrived.
+    """
+
+    def __init__(self, max_markers: int = 100000):
+        self.max_markers = max_markers
+        self.version = 0
+        self._ts = []
+        self._names = []
+        self._data = []
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self._ts)
+
+
+    def add(self, names, ts, data):
+        """ adds marker samples: parallel sequences of stream names, timestamps and samples """
+        if len(ts) == 0:
+            return
+        with self._lock:
+            for a_name, a_ts, a_sample in zip(names, ts, data):
+                a_ts = float(a_ts)
+                if (not self._ts) or (a_ts >= self._ts[-1]):
+                    self._ts.append(a_ts)
+                    self._names.append(a_name)
+                    self._data.append(a_sample)
+                else:
+                    i = bisect.bisect_right(self._ts, a_ts)
+                    self._ts.insert(i, a_ts)
+                    self._names.insert(i, a_name)
+                    self._data.insert(i, a_sample)
+            overflow = len(self._ts) - self.max_markers
+            if overflow > 0:
+                del self._ts[:overflow], self._names[:overflow], self._data[:overflow]
+            self.version += 1
+
+
+    def query(self, t_start: float, t_stop: float, stream_names=None):
+        """ returns (names, ts, data) lists of the markers with t_start <= ts <= t_stop, optionally only from `stream_names` """
+        with self._lock:
+            i0 = bisect.bisect_left(self._ts, t_start)
+            i1 = bisect.bisect_right(self._ts, t_stop)
+            names, ts, data = self._names[i0:i1], self._ts[i0:i1], self._data[i0:i1]
+        if stream_names is not None:
+            keep = [i for i, a_name in enumerate(names) if a_name in stream_names]
+            names, ts, data = [names[i] for i in keep], [ts[i] for i in keep], [data[i] for i in keep]
+        return names, ts, data
+
+
+    def remove_stream(self, stream_name: str):
+        """ drops all markers of one stream (e.g. after it vanished) """
+        with self._lock:
+            keep = [i for i, a_name in enumerate(self._names) if a_name != stream_name]
+            if len(keep) == len(self._names):
+                return
+            self._ts = [self._ts[i] for i in keep]
+            self._names = [self._names[i] for i in keep]
+            self._data = [self._data[i] for i in keep]
+            self.version += 1
+
+
+    def clear(self):
+        with self._lock:
+            self._ts, self._names, self._data = [], [], []
+            self.version += 1
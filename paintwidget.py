@@ -1,5 +1,6 @@
 from copy import deepcopy
 from datathread import DataThread
+import numpy as np
 from PyQt5.QtCore import Qt, QPointF, QPoint, QLine, QLineF
 from PyQt5.QtGui import QPalette, QPainter, QPen
 from PyQt5.QtWidgets import QWidget
@@ -19,7 +20,9 @@ class PaintWidget(QWidget):
         self.setPalette(pal)
 
         self.dataTr = DataThread(self)
+        self.dataTr.push_payloads = True ## this widget consumes sendData payloads rather than the ring buffers
         self.dataTr.sendData.connect(self.get_data)
+        self.dataTr.sendMarkerData.connect(self.get_markers)
         self.dataTr.changedStream.connect(self.reset)
 
     def reset(self):
@@ -33,9 +36,14 @@ class PaintWidget(QWidget):
         self.mean = []
         self.t0 = 0
 
-    def get_data(self, sig_ts, sig_buffer, marker_ts, marker_buffer):
+    def get_markers(self, marker_stream_names, marker_ts, marker_buffer):
+        """ sendMarkerData slot: the markers that arrived since the previous frame """
+        self.get_data('', [], [], marker_stream_names, marker_ts, marker_buffer)
+
+    def get_data(self, stream_name, sig_ts, sig_buffer, marker_stream_names, marker_ts, marker_buffer):
         update_x0 = float(self.width())
         update_width = 0.
+        sig_ts, sig_buffer = list(sig_ts), np.asarray(sig_buffer).tolist() ## this widget paints from nested lists
 
         # buffer should have exactly self.dataTr.chunkSize samples or be empty
         if any(sig_ts):
@@ -146,6 +154,6 @@ class PaintWidget(QWidget):
         if self.markerBuffer is not None:
             painter.setPen(QPen(Qt.red))
             for px, mrk in self.markerBuffer:
-                painter.drawLine(px, 0, px, self.height())
-                painter.drawText(px - 2 * self.px_per_samp, 0.95 * self.height(), mrk)
+                painter.drawLine(QLineF(px, 0, px, self.height()))
+                painter.drawText(QPointF(px - 2 * self.px_per_samp, 0.95 * self.height()), mrk)
             self.markerBuffer = None
@@ -0,0 +1,75 @@
+import time
+
+
+class AdaptivePollScheduler:
+    """ Decides when an InletWorker should next poll its inlet.
+
+    The wake-up interval is derived from the best available estimate of the stream's rate: an exponentially weighted
+    average of the observed arrival rate, seeded with the nominal rate (irregular-rate streams start with no estimate).
+    The worker sleeps until roughly `target_chunk_fraction` of the latency budget worth of samples should be waiting,
+    but never longer than `target_latency`, so no sample sits in the inlet longer than that. Wake-ups are scheduled on
+    absolute monotonic deadlines so sleep overshoot does not accumulate as drift.
+    """
+
+    def __init__(self, nominal_srate: float = 0.0, target_latency: float = 0.05, max_chunk_samples: int = 1024,
+                 min_interval: float = 0.001, rate_smoothing: float = 0.2, target_chunk_fraction: float = 0.5):
+        self.nominal_srate = float(nominal_srate or 0.0)
+        self.target_latency = float(target_latency) ## hard cap on how long a sample may wait in the inlet before being polled
+        self.max_chunk_samples = int(max_chunk_samples) ## poll before the pull buffer would overflow
+        self.min_interval = float(min_interval)
+        self.rate_smoothing = float(rate_smoothing)
+        self.target_chunk_fraction = float(target_chunk_fraction)
+        self.observed_srate = self.nominal_srate if self.nominal_srate > 0 else None
+        self._last_observe_t = None
+        self._deadline = None
+
+
+    @property
+    def rate_estimate(self):
+        """ samples/s used for scheduling, or None while an irregular-rate stream hasn't delivered anything yet """
+        return self.observed_srate
+
+
+    def observe(self, n_samples: int, now: float = None):
+        """ records that `n_samples` were pulled at `now` (monotonic seconds) and updates the arrival-rate estimate """
+        now = time.monotonic() if now is None else now
+        if self._last_observe_t is not None:
+            elapsed = now - self._last_observe_t
+            if elapsed > 0:
+                inst_rate = n_samples / elapsed
+                if self.observed_srate is None:
+                    self.observed_srate = inst_rate
+                else:
+                    self.observed_srate += self.rate_smoothing * (inst_rate - self.observed_srate)
+        self._last_observe_t = now
+
+
+    def next_interval(self, samples_available: int = 0) -> float:
+        """ seconds until the next poll, given how many samples are already waiting in the inlet """
+        if samples_available >= self.max_chunk_samples:
+            return 0.0
+        rate = self.observed_srate
+        if not rate or rate <= 0:
+            # no rate information (idle or irregular stream): poll at the latency cap
+            return self.target_latency
+        wanted = max(self.target_chunk_fraction * rate * self.target_latency, 1.0)
+        wanted = min(wanted, 0.5 * self.max_chunk_samples)
+        interval = (wanted - samples_available) / rate
+        return min(max(interval, self.min_interval), self.target_latency)
+
+
+    def next_deadline(self, samples_available: int = 0, now: float = None) -> float:
+        """ absolute monotonic time of the next poll. Deadlines advance from the previous deadline rather than from `now`,
+        unless the worker has fallen behind, in which case it resynchronizes instead of bursting to catch up.
+        """
+        now = time.monotonic() if now is None else now
+        interval = self.next_interval(samples_available)
+        base = self._deadline if (self._deadline is not None and (now - self._deadline) < interval) else now
+        self._deadline = max(base + interval, now)
+        return self._deadline
+
+
+    def reset(self):
+        self.observed_srate = self.nominal_srate if self.nominal_srate > 0 else None
+        self._last_observe_t = None
+        self._deadline = None
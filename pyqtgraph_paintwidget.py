@@ -1,31 +1,88 @@
-from copy import deepcopy
 import logging
+import os
+import shutil
+import tempfile
+import time
+from compressedhistory import CompressedHistoryStore, DEFAULT_HISTORY_SECONDS as COMPRESSED_DEFAULT_HISTORY_SECONDS
 from datathread import DataThread
-from PyQt5.QtCore import Qt, QPointF, QPoint, QLine, QLineF
-from PyQt5.QtGui import QPalette, QPainter, QPen
-from PyQt5.QtWidgets import QWidget
-import math
+from PyQt5.QtCore import QTimer, pyqtSignal
+import numpy as np
+from lodpyramid import MinMaxPyramid
+from markeroverlay import MarkerOverlayItem
+from markerstore import MarkerStore
+from recordingfile import info_field
+from recordingindex import RecordingIndex
+from renderprep import RenderPrepWorker, prepare_render
+from ringbuffer import StreamRingBuffer
+from scaling import SCALING_RESERVOIR, RobustScaler
+from scrollback import ScrollbackStore, ScrollbackView
+from stackedcurves import COLORS_GUTTER, StackedCurvesItem
+from streammetadata import parse_channel_labels
 
 CHANNEL_Y_FILL = 0.7  # How much of the per-channel vertical space is filled.  > 1 will overlap the lines.
 import pyqtgraph as pg
 
+RENDER_STACKED = 'stacked' ## all channels of a stream in one StackedCurvesItem
+RENDER_PER_CHANNEL = 'per_channel' ## one PlotDataItem per channel
+RENDER_MODES = (RENDER_STACKED, RENDER_PER_CHANNEL)
+
+SCROLLBACK_MEMMAP = 'memmap' ## ScrollbackStore: segment files mapped from a temporary directory
+SCROLLBACK_COMPRESSED = 'compressed' ## CompressedHistoryStore: int16-quantized, delta-encoded, compressed blocks kept in RAM
+SCROLLBACK_BACKENDS = (SCROLLBACK_MEMMAP, SCROLLBACK_COMPRESSED)
+
 logger = logging.getLogger("phohale.sigvisualizer.MultiStreamPlotManagingWidget")
 
 # class MultiStreamPlotManagingWidget(pg.GraphicsLayoutWidget):
 class MultiStreamPlotManagingWidget(pg.GraphicsLayoutWidget):
     """ the container widget that manages the plots for multiple LSL streams, each of which can have multiple channels """
+    renderPrepared = pyqtSignal(str, object) ## (stream_name, result of renderprep.prepare_render), emitted from the RenderPrepWorker
 
     def __init__(self, widget):
         super().__init__()
         # Initialize containers before any reset
         self.stream_plots = {} ## stream name -> PlotItem
         self.stream_plot_channels = {} ## stream name -> { channel_name -> { idx, tooltip, is_enabled } }
-        self.stream_graphics = {} ## stream name -> { curves: [], marker_scatter: pg.ScatterPlotItem|None, means: [], scales: [], channel_labels: [], last_x_range: tuple|None }
+        self.stream_graphics = {} ## stream name -> { curves: [], marker_overlay: MarkerOverlayItem|None, means: [], scales: [], channel_labels: [], last_x_range: tuple|None }
         self.last_x_range = None
+        self.scaling_method = SCALING_RESERVOIR ## one of scaling.SCALING_METHODS: 'exact', 'reservoir', 'streaming'
+        self.rescale_interval = 0.5 ## seconds between autoscale recomputations, independent of the chunk rate
+        self.scale_hysteresis = 0.1 ## relative change a channel's centre/scale needs before the display follows it
+        self.render_mode = RENDER_STACKED ## one of RENDER_MODES
+        self.stacked_color_mode = COLORS_GUTTER ## one of stackedcurves.COLOR_MODES: single path with a colour gutter, or one coloured path per pen
+        self.use_render_worker = True ## reduce/normalize/stack the visible windows on a RenderPrepWorker instead of the GUI thread
+        self._render_worker = None
+        self.renderPrepared.connect(self.on_render_prepared)
+        self.target_fps = 30 ## redraws per second of the frame clock; data arrival only marks streams dirty
+        self.frame_budget = 0.025 ## seconds of redraw work per frame; remaining dirty streams are deferred to the next frame
+        self.stream_priorities = {} ## stream name -> priority (higher redraws first when over budget; default 0)
+        self.deferred_redraws = 0
+        self._dirty_streams = {} ## stream name -> number of frames its redraw has been deferred
+        self.time_origin = None ## LSL timestamp that x = 0 stands for on the shared time axis (the first timestamp plotted)
+        self._time_master = None ## the plot the other timestamped plots are XLinked to
+        self._time_view = None ## (x_start, x_stop) last applied to the shared time axis
+        self._suppress_range_signals = False
+        self.paused = False ## frozen view: ingestion continues, the time axis can be browsed over the scrollback (see set_paused)
+        self.scrollback_enabled = True ## keep each stream's full history in a scrollback store
+        self.scrollback_backend = SCROLLBACK_MEMMAP ## one of SCROLLBACK_BACKENDS
+        self.scrollback_max_bytes = 2 ** 31 ## per stream on disk (SCROLLBACK_MEMMAP); the oldest data is dropped beyond this
+        self.compressed_scrollback_seconds = COMPRESSED_DEFAULT_HISTORY_SECONDS ## kept per stream in RAM (SCROLLBACK_COMPRESSED); its byte budget follows from the stream's rate and channel count
+        self.compressed_scrollback_max_bytes = None ## per stream, to cap SCROLLBACK_COMPRESSED by bytes instead of seconds
+        self.browse_max_samples = 2000000 ## per plot and view, when browsing the scrollback
+        self._scrollback_dir = None ## temporary directory of the scrollback files, created with the first store
+        self._scrollback_counter = 0
+        self.recording = None ## RecordingIndex shown instead of the live streams (see open_recording)
+        self.recording_marker_store = None ## MarkerStore with the recording's markers
+        self.recording_max_samples = 200000 ## per plot and view, when viewing a recording
+        self._live_view = None ## the live plots and their state (history, scrollback, scaler), set aside while a recording is shown
+        self._restored_streams = set() ## live plots just put back by close_recording(), kept when their streams are rebroadcast
+        self.frame_timer = QTimer(self)
+        self.frame_timer.timeout.connect(self.on_frame)
+        self.frame_timer.start(int(round(1000.0 / self.target_fps)))
 
         self.dataTr = DataThread(self)
-        self.dataTr.sendData.connect(self.get_data)
-        self.dataTr.changedStream.connect(self.reset)
+        self.dataTr.dataAvailable.connect(self.on_data_available)
+        self.dataTr.streamAdded.connect(self.on_stream_added)
+        self.dataTr.streamRemoved.connect(self._on_live_stream_removed)
 
         self.reset()
         logger.info(f'MultiStreamPlotManagingWidget initialized')
@@ -33,6 +90,8 @@ class MultiStreamPlotManagingWidget(pg.GraphicsLayoutWidget):
 
     def reset(self):
         logger.info(f'MultiStreamPlotManagingWidget reset')
+        for st in self.stream_graphics.values():
+            self._close_scrollback_store(st)
         for _, plot_item in self.stream_plots.items():
             try:
                 self.removeItem(plot_item)
@@ -45,92 +104,249 @@ class MultiStreamPlotManagingWidget(pg.GraphicsLayoutWidget):
         self.stream_plots.clear()
         self.stream_plot_channels.clear()
         self.stream_graphics.clear()
+        self._dirty_streams.clear()
         self.clear()
         self.last_x_range = None
+        self.time_origin = None
+        self._time_master = None
+        self._time_view = None
         # self.update()
         # self.repaint()
 
 
     def on_streams_updated(self, metadata, default_idx):
-        """ called when the streams are changed (new streams/etc)
-        1. Need to update the tree widget with the new streams and channels 
-        2. Update the plotted graphs (building new ones/removing old ones if needed) so they can be displayed when updated date is received.
+        """ rebuilds all plots from a full list of stream metadata (dropping any existing plots) """
+        logger.debug(f'MultiStreamPlotManagingWidget on_streams_updated() started.')
+        self.reset()
+        for s_meta in metadata:
+            self.on_stream_added(s_meta)
+        logger.debug(f'\tMultiStreamPlotManagingWidget on_streams_updated() finished.')
 
-        TODO 2025-10-09 - moving away from single stream selection (specified by default_idx) to being able to preview multiple streams simultaneously.
 
+    def on_stream_added(self, s_meta):
+        """ called when discovery finds a new stream: builds its plot without touching the plots of other streams.
+        If a plot with the same name already exists (e.g. a re-added stream) it is replaced.
 
         # p1 = self.addPlot(row=0, col=0)
         # p2 = self.addPlot(row=0, col=1)
         # v = self.addViewBox(row=1, col=0, colspan=2)
         #         
         """
-        logger.debug(f'MultiStreamPlotManagingWidget on_streams_updated() started.')
-        self.reset()
-
-        for s_ix, s_meta in enumerate(metadata):
-            a_stream_name: str = s_meta["name"]
-            a_plot_item = self.addPlot(row=s_ix, col=0)
-            self.stream_plots[a_stream_name] = a_plot_item
-            self.stream_plot_channels[a_stream_name] = {} ## initialize per-stream channels
+        a_stream_name: str = s_meta["name"]
+        logger.debug(f'MultiStreamPlotManagingWidget on_stream_added({a_stream_name!r}) started.')
+        if (self.recording is not None) and (not s_meta.get('recording')):
+            if self._live_view is not None:
+                self._live_view['replaced'].add(a_stream_name) ## (re)added meanwhile: its set-aside plot is rebuilt on close_recording()
+            return # live streams get their plots back on close_recording()
+        if a_stream_name in self._restored_streams:
+            self._restored_streams.discard(a_stream_name)
+            return # the plot (and history) set aside by open_recording() is back already
+        if a_stream_name in self.stream_plots:
+            self.on_stream_removed(a_stream_name)
+
+        a_plot_item = self.addPlot(row=len(self.stream_plots), col=0)
+        self.stream_plots[a_stream_name] = a_plot_item
+        self.stream_plot_channels[a_stream_name] = {} ## initialize per-stream channels
+
+        # PlotItem has no setBackground; set the ViewBox background instead
+        try:
+            a_plot_item.getViewBox().setBackgroundColor('w')
+        except Exception:
+            pass
+        a_plot_item.showGrid(x=True, y=True, alpha=0.3)
+        a_plot_item.hideButtons()
+        # Enable built-in pyqtgraph context menu and interactions
+        a_plot_item.setMenuEnabled(True)
+        a_plot_item.setMouseEnabled(x=True, y=True)
+        a_plot_item.setClipToView(True)
+        ## no setDownsampling(): render prep already reduces each window to min/max envelopes at the plot's pixel width
+        a_plot_item.setAutoPan(y=False)
+        # Keep y positions stationary; disable auto-visible/auto-range on Y
+        a_plot_item.setAutoVisible(y=False)
+        try:
+            a_plot_item.getViewBox().enableAutoRange(axis=pg.ViewBox.YAxis, enable=False)
+        except Exception:
+            pass
+        a_plot_item.setLabel('bottom', 'Time', units='s')
+        a_plot_item.setLabel('left', a_stream_name)
 
-            # PlotItem has no setBackground; set the ViewBox background instead
-            try:
-                a_plot_item.getViewBox().setBackgroundColor('w')
-            except Exception:
-                pass
-            a_plot_item.showGrid(x=True, y=True, alpha=0.3)
-            a_plot_item.hideButtons()
-            # Enable built-in pyqtgraph context menu and interactions
-            a_plot_item.setMenuEnabled(True)
-            a_plot_item.setMouseEnabled(x=True, y=True)
-            a_plot_item.setClipToView(True)
-            a_plot_item.setDownsampling(mode='peak')
-            a_plot_item.setAutoPan(y=False)
-            # Keep y positions stationary; disable auto-visible/auto-range on Y
-            a_plot_item.setAutoVisible(y=False)
+        # Attach menu actions and y-range change tracking
+        self._attach_plot_interactions(a_stream_name, a_plot_item)
+        
+        ## Setup channels for the plot
+        ch_labels = s_meta.get("ch_labels", []) or []
+        for m in range(s_meta["ch_count"]):
+            channel_name: str = ch_labels[m] if m < len(ch_labels) else ""
+            if not channel_name:
+                channel_name = f'Ch[{m}]'
+            self.stream_plot_channels[a_stream_name][channel_name] = {'name': channel_name, 'idx': m, 'tooltip': f'Channel[{m+1}]', 'is_enabled': True}
+
+        self.stream_graphics[a_stream_name] = {
+            'curves': [], ## the drawn per-channel curves, in channel_order (RENDER_PER_CHANNEL)
+            'curve_pool': {}, ## channel index -> PlotDataItem, kept for the plot's lifetime and shown/hidden on toggles
+            'stacked_item': None, ## StackedCurvesItem drawing all enabled channels (RENDER_STACKED)
+            'layout': None, ## {'key', 'channel_order', 'y_offsets', 'spacing'}, rebuilt by _ensure_layout only when needed
+            'layout_dirty': True,
+            'n_enabled': len(self.stream_plot_channels[a_stream_name]),
+            'marker_overlay': None, ## MarkerOverlayItem, created with the first marker and kept for the plot's lifetime
+            'means': [],
+            'scales': [],
+            'channel_labels': ch_labels,
+            'last_x_range': None,
+            'history': None, ## StreamRingBuffer of the recent samples (time x channels), created on the first chunk
+            'lod': None, ## MinMaxPyramid of the history, caught up by render prep (level-of-detail for long windows)
+            'scrollback': None, ## ScrollbackStore with everything received since the history was created (memory-mapped)
+            'browse_key': None, ## (view range, layout version) last rendered from the scrollback while paused
+            'window_start': 0, ## absolute history index of the oldest sample inside the visible window
+            'scaler': None, ## RobustScaler with the per-channel centre/scale, created with the history
+            'sample_counter': 0,
+            'time_mode': True, ## whether the history holds timestamps (False: synthetic sample indices)
+            'x_linked': True, ## whether the plot follows the shared time axis (only plots with timestamps do)
+            'latest_x': None, ## x of the newest sample on the shared time axis
+            'tree_visible': True, ## False while the stream's node is collapsed in the stream tree (see set_stream_tree_visible)
+            'layout_version': 0, ## bumped when the plot is resized or its channel selection changes; older render results are discarded
+            'y_manual': False,
+            'suppress_y_signal': False,
+            'fit_to_band': False,
+        }
+        self._relink_time_axes()
+        logger.debug(f'\tMultiStreamPlotManagingWidget on_stream_added(...) finished.')
+
+
+    def on_stream_removed(self, stream_name: str):
+        """ called when a stream vanished: drops only its plot and re-packs the remaining plots into consecutive rows """
+        logger.debug(f'MultiStreamPlotManagingWidget on_stream_removed({stream_name!r}) started.')
+        plot_item = self.stream_plots.pop(stream_name, None)
+        self.stream_plot_channels.pop(stream_name, None)
+        self._close_scrollback_store(self.stream_graphics.pop(stream_name, None))
+        self._dirty_streams.pop(stream_name, None)
+        if plot_item is None:
+            return
+        try:
+            plot_item.setXLink(None)
+            self.removeItem(plot_item)
+            plot_item.deleteLater()
+        except Exception:
+            pass
+        self._relink_time_axes()
+        for a_row, (_, a_plot_item) in enumerate(self.stream_plots.items()):
             try:
-                a_plot_item.getViewBox().enableAutoRange(axis=pg.ViewBox.YAxis, enable=False)
+                self.ci.removeItem(a_plot_item)
+                self.ci.addItem(a_plot_item, row=a_row, col=0)
             except Exception:
                 pass
-            a_plot_item.setLabel('bottom', 'Time', units='s')
-            a_plot_item.setLabel('left', a_stream_name)
-
-            # Attach menu actions and y-range change tracking
-            self._attach_plot_interactions(a_stream_name, a_plot_item)
-            
-            ## Setup channels for the plot
-            ch_labels = s_meta.get("ch_labels", []) or []
-            for m in range(s_meta["ch_count"]):
-                channel_name: str = ch_labels[m] if m < len(ch_labels) else ""
-                if not channel_name:
-                    channel_name = f'Ch[{m}]'
-                self.stream_plot_channels[s_meta["name"]][channel_name] = {'name': channel_name, 'idx': m, 'tooltip': f'Channel[{m+1}]', 'is_enabled': True}
-
-            self.stream_graphics[a_stream_name] = {
-                'curves': [],
-                'marker_scatter': None,
-                'means': [],
-                'scales': [],
-                'channel_labels': ch_labels,
-                'last_x_range': None,
-                'ts_history': [],
-                'raw_history': [],
-                'sample_counter': 0,
-                'y_manual': False,
-                'suppress_y_signal': False,
-                'fit_to_band': False,
-            }
-        ## END for s_ix, s_meta in enumerate(metadata)...
-        logger.debug(f'\tMultiStreamPlotManagingWidget on_streams_updated() finished.')
+        logger.debug(f'\tMultiStreamPlotManagingWidget on_stream_removed(...) finished.')
 
 
-            
 
+    def _on_live_stream_removed(self, stream_name: str):
+        if self.recording is None:
+            self.on_stream_removed(stream_name)
+        elif self._live_view is not None:
+            ## while a recording is shown its plots stay; only the set-aside live plot is dropped
+            plot_item = self._live_view['stream_plots'].pop(stream_name, None)
+            self._live_view['stream_plot_channels'].pop(stream_name, None)
+            self._close_scrollback_store(self._live_view['stream_graphics'].pop(stream_name, None))
+            self._live_view['replaced'].discard(stream_name)
+            if plot_item is not None:
+                plot_item.deleteLater()
 
 
-    def get_data(self, stream_name, sig_ts, sig_buffer, marker_stream_names, marker_ts, marker_buffer):
+    def on_data_available(self, stream_name: str, head: int):
+        """ only marks the stream dirty; the frame clock (on_frame) redraws it """
+        if stream_name in self.stream_graphics:
+            self._dirty_streams.setdefault(stream_name, 0)
+
+
+    def set_target_fps(self, fps: float):
+        self.target_fps = max(float(fps), 1.0)
+        self.frame_timer.setInterval(int(round(1000.0 / self.target_fps)))
+
+
+    def set_seconds_per_screen(self, seconds: float):
+        """ changes the visible time span of all plots. Long spans are cheap: histories grow to hold the window, and render
+        prep draws them from their MinMaxPyramid level matching the plot's pixel width """
+        self.dataTr.seconds_per_screen = max(float(seconds), 0.1)
+        self._time_view = None
+        for name, st in self.stream_graphics.items():
+            st['last_x_range'] = None
+            st['layout_version'] = st.get('layout_version', 0) + 1
+            self._dirty_streams.setdefault(name, 0)
+
+
+    def on_frame(self):
+        """ frame clock tick: redraws each dirty stream once, highest priority first (the selected stream, then by
+        stream_priorities plus the number of frames a stream has already been deferred, so nothing starves).
+        Once `frame_budget` is used up, the remaining streams stay dirty for the next frame.
+        While paused, the redraws only ingest (see get_data) and the plots show the browsed range of their scrollback.
+        """
+        if self.paused:
+            self._update_browse_view()
+        if not self._dirty_streams:
+            return
+        t_start = time.perf_counter()
+        selected_params = self.dataTr.stream_params.get(self.dataTr.sig_strm_key) or {}
+        selected_name = selected_params.get('metadata', {}).get('name')
+        order = sorted(self._dirty_streams, key=lambda name: (name != selected_name, -(self.stream_priorities.get(name, 0) + self._dirty_streams[name])))
+        for i, name in enumerate(order):
+            if (i > 0) and ((time.perf_counter() - t_start) > self.frame_budget):
+                self._dirty_streams[name] += 1
+                self.deferred_redraws += 1
+                continue
+            del self._dirty_streams[name]
+            self._redraw_stream(name)
+        self._apply_time_view()
+
+
+    def _relink_time_axes(self):
+        """ XLinks every timestamped plot to the first one, so the whole window scrolls along one shared time axis """
+        linked = [plot_item for name, plot_item in self.stream_plots.items() if self.stream_graphics.get(name, {}).get('x_linked', True)]
+        master = linked[0] if linked else None
+        for name, plot_item in self.stream_plots.items():
+            if (plot_item is master) or (plot_item not in linked):
+                plot_item.setXLink(None)
+            else:
+                plot_item.setXLink(master)
+        self._time_master = master
+        self._time_view = None
+
+
+    def _apply_time_view(self):
+        """ scrolls the shared time axis to end at the newest sample of any plot; a no-op if that hasn't moved (or while paused) """
+        if self.paused:
+            return
+        latest = [st['latest_x'] for st in self.stream_graphics.values() if st.get('x_linked', True) and (st.get('latest_x') is not None)]
+        if (not latest) or (self._time_master is None):
+            return
+        x_stop = max(latest)
+        time_view = (x_stop - getattr(self.dataTr, 'seconds_per_screen', 2), x_stop)
+        if time_view == self._time_view:
+            return
+        self._suppress_range_signals = True ## our own range change, not a manual zoom
+        try:
+            self._time_master.setXRange(*time_view, padding=0.0)
+        finally:
+            self._suppress_range_signals = False
+        self._time_view = time_view
+
+
+    def _redraw_stream(self, stream_name: str):
+        """ reads everything published since this stream's last read from the shared ring buffer (as views) and plots it """
+        state = self.stream_graphics.get(stream_name)
+        ring = self.dataTr.get_ring_buffer(stream_name)
+        if (state is None) or (ring is None) or (self.recording is not None):
+            return
+        sig_ts, sig_buffer, start = ring.read(state.get('ring_read_index', 0))
+        state['ring_read_index'] = start + len(sig_ts)
+        self.get_data(stream_name, sig_ts, sig_buffer)
+
+
+    def get_data(self, stream_name, sig_ts, sig_buffer, marker_stream_names=None, marker_ts=None, marker_buffer=None):
         """Update per-stream plot for the active signal stream with a scrolling window.
-        Maintains a per-stream history buffer and updates curves via setData.
+        Appends the chunk to the stream's circular NumPy history (time x channels) and finds the window start with a binary
+        search, so the bookkeeping per chunk is O(chunk); the window is then reduced, normalized and stacked by render prep
+        (on the RenderPrepWorker by default) and swapped into the curve items in on_render_prepared().
+        Unless marker lists are passed explicitly, the markers inside the visible window are queried from the DataThread's marker_store.
         """
         logger.debug(f'MultiStreamPlotManagingWidget get_data(...) started.')
         
@@ -142,36 +358,334 @@ class MultiStreamPlotManagingWidget(pg.GraphicsLayoutWidget):
         state = self.stream_graphics.get(active_stream_name)
         if state is None:
             state = {
-                'curves': [], 'marker_scatter': None, 'means': [], 'scales': [], 'channel_labels': [], 'last_x_range': None,
-                'ts_history': [], 'raw_history': [], 'sample_counter': 0,
+                'curves': [], 'curve_pool': {}, 'stacked_item': None, 'layout': None, 'layout_dirty': True,
+                'n_enabled': len(self.stream_plot_channels.get(active_stream_name, {})), 'marker_overlay': None, 'means': [], 'scales': [], 'channel_labels': [], 'last_x_range': None,
+                'history': None, 'lod': None, 'scrollback': None, 'window_start': 0, 'scaler': None, 'sample_counter': 0, 'time_mode': True, 'layout_version': 0,
+                'tree_visible': True,
             }
             self.stream_graphics[active_stream_name] = state
         else:
             # Upgrade state with any missing keys for backward compatibility
             state.setdefault('curves', [])
-            state.setdefault('marker_scatter', None)
+            state.setdefault('stacked_item', None)
+            state.setdefault('curve_pool', {})
+            state.setdefault('layout', None)
+            state.setdefault('layout_dirty', True)
+            state.setdefault('marker_overlay', None)
             state.setdefault('means', [])
             state.setdefault('scales', [])
             state.setdefault('channel_labels', [])
             state.setdefault('last_x_range', None)
-            state.setdefault('ts_history', [])
-            state.setdefault('raw_history', [])
+            state.setdefault('history', None)
+            state.setdefault('lod', None)
+            state.setdefault('scrollback', None)
+            state.setdefault('window_start', 0)
+            state.setdefault('scaler', None)
             state.setdefault('sample_counter', 0)
+            state.setdefault('layout_version', 0)
+            state.setdefault('time_mode', True)
+            state.setdefault('tree_visible', True)
+
+        # Defensive: check for valid buffer -- an (n_samples, n_channels) NDArray, or a list of samples from the list ingestion mode
+        if sig_buffer is None or len(sig_buffer) == 0:
+            # No new data; only redraw from the history (e.g. a plot that just became visible again) if there is any
+            if (state['history'] is None) or (state['history'].head == 0):
+                return
+        else:
+            sig_buffer = np.asarray(sig_buffer)
+            if sig_buffer.ndim != 2:
+                return
+            self._append_to_history(plot_item, state, active_stream_name, sig_ts, sig_buffer)
+        history = state['history']
+        n_channels_total = history.n_channels
+        time_mode = state['time_mode']
+        seconds_per_screen = getattr(self.dataTr, 'seconds_per_screen', 2)
 
-        # Defensive: check for valid buffer
-        if not sig_buffer or not isinstance(sig_buffer, list) or not sig_buffer or not isinstance(sig_buffer[0], (list, tuple)):
-            # No new data; nothing to update
+        # Trim history to time window: advance the window start to the first sample >= cutoff
+        ts_all, data_all, start = history.read(state['window_start'])
+        cutoff = (ts_all[-1] - seconds_per_screen) if time_mode else max(0, state['sample_counter'] - int(seconds_per_screen * 1000))
+        start_idx = int(np.searchsorted(ts_all, cutoff, side='left'))
+        state['window_start'] = start + start_idx
+        ts_win, data_win = ts_all[start_idx:], data_all[start_idx:]
+        if self.paused or (not self.is_stream_visible(active_stream_name)):
+            return # paused or culled: the history (and scrollback) stays current, and the plot catches up from it later
+
+        # x is seconds since the widget's shared time_origin: all timestamped plots share one (XLinked) time axis, and
+        # scrolling is a single view-range change per frame (_apply_time_view) rather than re-anchoring every plot's x to
+        # its first sample. Plots without timestamps keep their own [0, n_samples] axis.
+        if time_mode:
+            if self.time_origin is None:
+                self.time_origin = float(ts_all[-1])
+            x_origin = self.time_origin
+            state['latest_x'] = float(ts_all[-1]) - x_origin
+            x_range = (state['latest_x'] - seconds_per_screen, state['latest_x'])
+            if not state.get('x_linked', True):
+                state['x_linked'] = True
+                self._relink_time_axes()
+        else:
+            x_origin = 0.0
+            x_range = (0.0, float(max(len(ts_win), 1)))
+            if state.get('x_linked', True):
+                state['x_linked'] = False
+                self._relink_time_axes()
+
+        # Channel layout (order, y offsets, ticks, Y range, curve visibility); only rebuilt after the enabled set, the channel
+        # count or the render mode changed
+        layout = self._ensure_layout(plot_item, state, active_stream_name, n_channels_total)
+        channel_order, y_offsets, spacing = layout['channel_order'], layout['y_offsets'], layout['spacing']
+
+        # Robust stats over a bounded, evenly strided sample of the visible window, recomputed at the scaler's own cadence (see scaling.RobustScaler)
+        if state['scaler'].maybe_rescale(data_win, fit_to_band=bool(state.get('fit_to_band'))):
+            state['means'] = state['scaler'].center
+            state['scales'] = state['scaler'].scale
+
+        if len(ts_win) and len(channel_order):
+            # Reduction to pixel width, normalization and stacking happen in render prep (see renderprep.prepare_render)
+            job = {'ring': history, 'lod': state['lod'], 'start': state['window_start'], 'stop': history.head, 'time_mode': time_mode,
+                   'x_origin': x_origin, 'x_range': x_range,
+                   'n_pixels': self._plot_pixel_width(plot_item), 'channel_order': channel_order,
+                   'means': state['means'], 'scales': state['scales'], 'y_offsets': y_offsets,
+                   'layout_version': state['layout_version']}
+            self._submit_render(active_stream_name, job)
+
+        # Lock x-range to the window (timestamped plots follow the shared time view instead)
+        if (not time_mode) and (state['last_x_range'] != x_range):
+            state['suppress_y_signal'] = True ## our own range change, not a manual zoom
+            plot_item.setXRange(*x_range, padding=0.0)
+            state['suppress_y_signal'] = False
+            state['last_x_range'] = x_range
+
+        # Markers at the top of the stack, drawn by the plot's persistent MarkerOverlayItem (a no-op while the visible set is unchanged)
+        if time_mode and len(ts_win) and len(channel_order):
+            if marker_ts is not None:
+                keep = [i for i, ts in enumerate(marker_ts) if x_range[0] <= (ts - x_origin) <= x_range[1]]
+                marker_ts, marker_buffer = [marker_ts[i] for i in keep], [marker_buffer[i] for i in keep]
+            self._update_marker_overlay(plot_item, state, x_origin, x_range, y_offsets[-1] + spacing*0.5, marker_ts, marker_buffer)
+        # synthetic index mode: skip marker alignment unless we can map indices
+        elif state['marker_overlay'] is not None:
+            state['marker_overlay'].clear()
+
+        logger.info(f'MultiStreamPlotManagingWidget get_data(...) finished.')
+
+
+    def _submit_render(self, stream_name: str, job: dict):
+        """ hands a render job to the RenderPrepWorker (or runs it right here if the worker is disabled) """
+        if self.use_render_worker:
+            if self._render_worker is None:
+                self._render_worker = RenderPrepWorker(on_result=self.renderPrepared.emit)
+                self._render_worker.start()
+            self._render_worker.submit(stream_name, job)
+        else:
+            self.on_render_prepared(stream_name, prepare_render(job))
+
+
+    def _update_marker_overlay(self, plot_item, state, x_origin: float, x_range, y: float, marker_ts=None, marker_buffer=None):
+        """ shows the markers within x_range (queried from the marker_store unless given) on the plot's MarkerOverlayItem """
+        if marker_ts is None:
+            marker_store = self.recording_marker_store if self.recording is not None else self.dataTr.marker_store
+            _, marker_ts, marker_buffer = marker_store.query(x_origin + x_range[0], x_origin + x_range[1])
+        if marker_ts or (state['marker_overlay'] is not None):
+            if state['marker_overlay'] is None:
+                state['marker_overlay'] = MarkerOverlayItem()
+                plot_item.addItem(state['marker_overlay'], ignoreBounds=True)
+            state['marker_overlay'].setMarkers(marker_ts, marker_buffer, x_origin, y, x_range[1] - x_range[0], self._plot_pixel_width(plot_item))
+
+
+    def set_paused(self, paused: bool):
+        """ freezes (or resumes) the display. Ingestion continues while paused; panning/zooming the time axis then browses
+        each stream's scrollback, and resuming jumps back to live data """
+        self.paused = bool(paused)
+        self._time_view = None
+        for name, st in self.stream_graphics.items():
+            st['browse_key'] = None
+            st['layout_version'] = st.get('layout_version', 0) + 1 ## drop render results still in flight from before the switch
+            self._dirty_streams.setdefault(name, 0)
+
+
+    def _update_browse_view(self):
+        """ while paused: re-renders the visible timestamped plots from their scrollback whenever the shared time axis was
+        panned/zoomed or a plot's layout changed """
+        if (self._time_master is None) or (self.time_origin is None):
+            return
+        x_range = tuple(float(v) for v in self._time_master.viewRange()[0])
+        for name, st in self.stream_graphics.items():
+            if (not st.get('x_linked', True)) or (st.get('scrollback') is None) or (not self.is_stream_visible(name)):
+                continue
+            browse_key = (x_range, st['layout_version'])
+            if st.get('browse_key') == browse_key:
+                continue
+            st['browse_key'] = browse_key
+            self._render_browse_view(name, st, x_range)
+
+
+    def _render_browse_view(self, stream_name: str, state, x_range):
+        plot_item = self.stream_plots[stream_name]
+        layout = self._ensure_layout(plot_item, state, stream_name, state['history'].n_channels)
+        channel_order, y_offsets, spacing = layout['channel_order'], layout['y_offsets'], layout['spacing']
+        if not len(channel_order):
+            return
+        max_samples = self.recording_max_samples if self.recording is not None else self.browse_max_samples
+        ts, data = state['scrollback'].read_range(self.time_origin + x_range[0], self.time_origin + x_range[1], max_samples=max_samples)
+        if (self.recording is not None) and state['scaler'].maybe_rescale(data, fit_to_band=bool(state.get('fit_to_band'))):
+            state['means'] = state['scaler'].center ## nothing streams in, so the scale follows the browsed window
+            state['scales'] = state['scaler'].scale
+        view = ScrollbackView(ts, data)
+        job = {'ring': view, 'lod': None, 'start': 0, 'stop': view.head, 'time_mode': True, 'x_origin': self.time_origin, 'x_range': x_range,
+               'n_pixels': self._plot_pixel_width(plot_item), 'channel_order': channel_order,
+               'means': state['means'], 'scales': state['scales'], 'y_offsets': y_offsets, 'layout_version': state['layout_version']}
+        if view.head:
+            self._submit_render(stream_name, job)
+        self._update_marker_overlay(plot_item, state, self.time_origin, x_range, y_offsets[-1] + spacing*0.5)
+
+
+    def open_recording(self, path: str):
+        """ shows an XDF or HDF5 recording instead of the live streams, in browse mode: panning/zooming the time axis reads
+        only the samples in view through the recording's RecordingIndex (built on first open and cached next to the file).
+        The live plots are set aside with their histories and scrollback, and close_recording() puts them back.
+        Returns the metadata of the recorded streams, as streamAdded would have carried them """
+        recording = RecordingIndex.open(path)
+        if self.recording is None:
+            self._stash_live_view()
+        else:
+            self._drop_recording_view()
+        self.recording = recording
+        self.recording_marker_store = MarkerStore()
+        self.set_paused(True)
+        self.time_origin = recording.t_start
+        all_metadata = []
+        for i, stream in enumerate(recording.streams):
+            if stream.is_marker:
+                ts, samples = recording.read_markers(i)
+                self.recording_marker_store.add([stream.name] * len(ts), list(ts), samples)
+                continue
+            if recording.time_span(i) is None:
+                continue
+            name, counter = stream.name, 2
+            while name in self.stream_plots:
+                name, counter = f'{stream.name} [{counter}]', counter + 1
+            s_meta = {'name': name, 'type': info_field(stream.info_xml, 'type'), 'ch_count': stream.n_channels,
+                      'srate': stream.srate, 'ch_labels': parse_channel_labels(stream.info_xml, stream.n_channels) if stream.info_xml else [],
+                      'recording': path}
+            self.on_stream_added(s_meta)
+            st = self.stream_graphics[name]
+            st['scrollback'] = recording.stream_view(i)
+            st['history'] = StreamRingBuffer(1024, stream.n_channels, dtype=np.result_type(stream.dtype, np.float32)) ## only carries the channel count here
+            st['scaler'] = RobustScaler(stream.n_channels, method=self.scaling_method, rescale_interval=self.rescale_interval,
+                                        hysteresis=self.scale_hysteresis)
+            st['means'], st['scales'] = st['scaler'].center, st['scaler'].scale
+            st['latest_x'] = recording.time_span(i)[1] - recording.t_start
+            all_metadata.append(s_meta)
+        if self._time_master is not None:
+            seconds_per_screen = getattr(self.dataTr, 'seconds_per_screen', 2)
+            self._time_master.setXRange(0.0, min(seconds_per_screen, max(recording.t_stop - recording.t_start, 1e-3)), padding=0.0)
+        logger.info(f'MultiStreamPlotManagingWidget open_recording({path!r}): {len(all_metadata)} plots, {recording.t_stop - recording.t_start:.1f} s.')
+        return all_metadata
+
+
+    def close_recording(self, rebroadcast: bool = True):
+        """ leaves the recording view and puts the live plots back. With `rebroadcast`, streamAdded is re-emitted for every
+        live stream (rebuilding e.g. the tree nodes), which only builds plots for the streams added while the recording was shown """
+        if self.recording is None:
+            return
+        self._drop_recording_view()
+        self._restore_live_view()
+        self.set_paused(False)
+        if rebroadcast:
+            self.dataTr.rebroadcast_streams()
+        self._restored_streams.clear()
+
+
+    def _drop_recording_view(self):
+        self.reset()
+        self.recording.close()
+        self.recording = None
+        self.recording_marker_store = None
+
+
+    def _stash_live_view(self):
+        """ takes the live plots out of the layout, keeping them and their per-stream state for _restore_live_view() """
+        for plot_item in self.stream_plots.values():
+            plot_item.setXLink(None)
+            self.removeItem(plot_item)
+        self._live_view = {'stream_plots': self.stream_plots, 'stream_plot_channels': self.stream_plot_channels,
+                           'stream_graphics': self.stream_graphics, 'time_origin': self.time_origin, 'replaced': set()}
+        self.stream_plots, self.stream_plot_channels, self.stream_graphics = {}, {}, {}
+        self.reset()
+
+
+    def _restore_live_view(self):
+        """ puts the plots set aside by _stash_live_view() back; their histories catch up from the DataThread's ring buffers """
+        live, self._live_view = self._live_view, None
+        if live is None:
             return
+        self.stream_plots, self.stream_plot_channels, self.stream_graphics = live['stream_plots'], live['stream_plot_channels'], live['stream_graphics']
+        self.time_origin = live['time_origin']
+        for a_row, (name, plot_item) in enumerate(self.stream_plots.items()):
+            self.addItem(plot_item, row=a_row, col=0)
+            self.stream_graphics.get(name, {})['last_x_range'] = None
+            self._dirty_streams.setdefault(name, 0)
+        self._relink_time_axes()
+        self._restored_streams = set(self.stream_plots) - live['replaced']
+
+
+    def _create_scrollback_store(self, stream_name: str, n_channels: int, dtype):
+        if not self.scrollback_enabled:
+            return None
+        try:
+            if self.scrollback_backend == SCROLLBACK_COMPRESSED:
+                srate = (self.dataTr.get_stream_metadata(stream_name) or {}).get('srate') or 0.0
+                return CompressedHistoryStore(n_channels, dtype=dtype, max_bytes=self.compressed_scrollback_max_bytes, srate=srate,
+                                              seconds=self.compressed_scrollback_seconds)
+            if self._scrollback_dir is None:
+                self._scrollback_dir = tempfile.mkdtemp(prefix='sigvisualizer-scrollback-')
+            self._scrollback_counter += 1
+            safe_name = ''.join(c if c.isalnum() else '_' for c in stream_name)[:64]
+            path_prefix = os.path.join(self._scrollback_dir, f'{safe_name}-{self._scrollback_counter}')
+            return ScrollbackStore(path_prefix, n_channels, dtype=dtype, max_bytes=self.scrollback_max_bytes)
+        except Exception as e:
+            logger.warning(f'MultiStreamPlotManagingWidget could not create the scrollback of {stream_name!r}: {e}')
+            return None
+
+
+    def _close_scrollback_store(self, state):
+        store = state.get('scrollback') if state else None
+        if store is not None:
+            state['scrollback'] = None
+            try:
+                store.close()
+            except Exception:
+                pass
 
-        n_samples = len(sig_buffer)
-        n_channels_total = len(sig_buffer[0]) if n_samples > 0 else 0
 
-        # Ensure history arrays sized to channel count
-        if not state['raw_history'] or len(state['raw_history']) != n_channels_total:
-            state['raw_history'] = [[] for _ in range(n_channels_total)]
-            state['means'] = [0 for _ in range(n_channels_total)]
-            state['scales'] = [1 for _ in range(n_channels_total)]
+    def close_scrollback(self):
+        """ deletes all scrollback files (call on shutdown) """
+        for st in list(self.stream_graphics.values()) + list((self._live_view or {}).get('stream_graphics', {}).values()):
+            self._close_scrollback_store(st)
+        if self._scrollback_dir is not None:
+            shutil.rmtree(self._scrollback_dir, ignore_errors=True)
+            self._scrollback_dir = None
+
+
+    def _append_to_history(self, plot_item, state, stream_name: str, sig_ts, sig_buffer):
+        """ appends a chunk (and its timestamps, or synthetic indices) to the stream's history, (re)creating it if the channel count changed """
+        n_samples, n_channels_total = sig_buffer.shape
+
+        # (Re)create the history if the channel count changed
+        history = state['history']
+        if (history is None) or (history.n_channels != n_channels_total):
+            history = self._create_history(stream_name, n_channels_total, sig_buffer.dtype)
+            state['history'] = history
+            state['lod'] = MinMaxPyramid(history.capacity, n_channels_total, dtype=history.dtype)
+            self._close_scrollback_store(state)
+            state['scrollback'] = self._create_scrollback_store(stream_name, n_channels_total, history.dtype)
+            state['window_start'] = 0
+            state['scaler'] = RobustScaler(n_channels_total, method=self.scaling_method, rescale_interval=self.rescale_interval,
+                                           hysteresis=self.scale_hysteresis)
+            state['means'] = state['scaler'].center
+            state['scales'] = state['scaler'].scale
             state['curves'] = []
+            state['curve_pool'] = {}
+            state['layout'] = None
             # remove any existing curves if channel count changed
             for c in list(plot_item.listDataItems()):
                 try:
@@ -179,190 +693,225 @@ class MultiStreamPlotManagingWidget(pg.GraphicsLayoutWidget):
                 except Exception:
                     pass
 
-        # Append timestamps (or synthetic indices)
-        seconds_per_screen = getattr(self.dataTr, 'seconds_per_screen', 2)
-        if not sig_ts or len(sig_ts) != n_samples:
+        # Append timestamps (or synthetic indices) and samples
+        if sig_ts is None or len(sig_ts) != n_samples:
             # synthesize monotonically increasing indices as time base
             base = state['sample_counter']
-            new_ts = [base + i for i in range(n_samples)]
+            new_ts = np.arange(base, base + n_samples, dtype=np.float64)
             state['sample_counter'] = base + n_samples
-            time_mode = False
-        else:
-            new_ts = list(sig_ts)
-            time_mode = True
-        state['ts_history'].extend(new_ts)
-
-        # Append raw channel data
-        for ch in range(n_channels_total):
-            state['raw_history'][ch].extend([row[ch] for row in sig_buffer])
-
-        # Trim history to time window
-        if state['ts_history']:
-            last_ts = state['ts_history'][-1]
-            cutoff = (last_ts - seconds_per_screen) if time_mode else max(0, state['sample_counter'] - int(seconds_per_screen * 1000))
-            # Find first index >= cutoff
-            start_idx = 0
-            for i, t in enumerate(state['ts_history']):
-                if t >= cutoff:
-                    start_idx = i
-                    break
-            if start_idx > 0:
-                state['ts_history'] = state['ts_history'][start_idx:]
-                for ch in range(n_channels_total):
-                    state['raw_history'][ch] = state['raw_history'][ch][start_idx:]
-
-        # Build x in window [0, seconds_per_screen]
-        if state['ts_history']:
-            t0 = state['ts_history'][0]
-            if time_mode:
-                x = [t - t0 for t in state['ts_history']]
-                x_max = seconds_per_screen
-            else:
-                # sample index base; map to [0, len-1]
-                x = [i for i in range(len(state['ts_history']))]
-                x_max = len(x) if len(x) > 0 else 1
+            state['time_mode'] = False
         else:
-            x = []
-            x_max = seconds_per_screen if time_mode else 1
+            new_ts = np.asarray(sig_ts, dtype=np.float64)
+            state['time_mode'] = True
+        if (history.head - state['window_start'] + n_samples) > (history.capacity - history.guard):
+            history = self._grow_history(state, n_samples)
+        history.write(new_ts, sig_buffer) ## the MinMaxPyramid catches up from it in render prep
+        if state.get('scrollback') is not None:
+            try:
+                state['scrollback'].append(new_ts, sig_buffer)
+            except Exception as e:
+                logger.warning(f'MultiStreamPlotManagingWidget scrollback of {stream_name!r} failed, disabling it: {e}')
+                self._close_scrollback_store(state)
+        state['scaler'].observe(sig_buffer)
+
 
-        # Resolve channel labels and enabled indices for the active stream
+    def is_stream_visible(self, stream_name: str) -> bool:
+        """ whether redrawing a stream's plot is worth it: its tree node is expanded, at least one of its channels is enabled,
+        and the plot is on screen
+        """
+        state = self.stream_graphics.get(stream_name)
+        plot_item = self.stream_plots.get(stream_name)
+        if (state is None) or (plot_item is None) or (not state.get('tree_visible', True)):
+            return False
+        if self.stream_plot_channels.get(stream_name) and state.get('n_enabled', 1) <= 0:
+            return False
+        return self._is_plot_on_screen(plot_item)
+
+
+    def _is_plot_on_screen(self, plot_item) -> bool:
+        if (not self.isVisible()) or self.window().isMinimized():
+            return False
+        try:
+            view_rect = self.mapFromScene(plot_item.sceneBoundingRect()).boundingRect()
+            return (view_rect.height() > 1) and view_rect.intersects(self.viewport().rect())
+        except Exception:
+            return True
+
+
+    def set_stream_tree_visible(self, stream_name: str, visible: bool):
+        """ called when the stream's tree node is expanded/collapsed; a plot that becomes visible is redrawn from its history on the next frame """
+        state = self.stream_graphics.get(stream_name)
+        if state is None:
+            return
+        state['tree_visible'] = bool(visible)
+        if visible:
+            self._dirty_streams.setdefault(stream_name, 0)
+
+
+    def _ensure_layout(self, plot_item, state, stream_name: str, n_channels_total: int) -> dict:
+        """ returns the stream's channel layout, rebuilding it (y offsets, axis ticks, default Y range and the pooled curve
+        items' visibility) only if set_channel_enabled() marked it dirty or the channel count or render mode changed
+        """
+        layout = state.get('layout')
+        layout_key = (self.render_mode, n_channels_total)
+        if (layout is not None) and (not state.get('layout_dirty')) and (layout['key'] == layout_key):
+            return layout
+
+        # Resolve channel labels and enabled indices for the stream
         if not state['channel_labels']:
-            try:
-                ch_labels = self.dataTr.stream_params[self.dataTr.sig_strm_idx]['metadata'].get('ch_labels', [])
-            except Exception:
-                ch_labels = []
-            state['channel_labels'] = ch_labels or []
-
-        channel_map = self.stream_plot_channels.get(active_stream_name, {})
-        enabled = [(info['idx'], name) for name, info in channel_map.items() if info.get('is_enabled', True)]
-        enabled.sort(key=lambda t: t[0])
-        enabled_indices = [idx for idx, _ in enabled]
-        enabled_labels = [name for _, name in enabled]
-
-        n_enabled = len(enabled_indices) if enabled_indices else n_channels_total
-        spacing = CHANNEL_Y_FILL / max(n_enabled or 1, 1)
-        y_offsets = [i * spacing for i in range(n_enabled or n_channels_total)]
-
-        # Recompute robust stats over current visible window
-        for ch in range(n_channels_total):
-            ywin = state['raw_history'][ch]
-            if ywin:
-                sy = sorted(ywin)
-                median = sy[len(sy)//2]
-                if state.get('fit_to_band'):
-                    # Fit entire visible min..max into the band's height (approx spacing)
-                    yrng = max(ywin) - min(ywin)
-                    iqr = yrng if yrng != 0 else 1
-                else:
-                    iqr = (sy[int(0.75*len(sy))] - sy[int(0.25*len(sy))]) if len(sy) > 3 else (max(ywin)-min(ywin) if max(ywin)!=min(ywin) else 1)
-                state['means'][ch] = median
-                state['scales'][ch] = iqr if iqr != 0 else 1
-
-        # Ensure curves exist and setData for enabled channels
-        need_rebuild = (len(state['curves']) != (len(enabled_indices) if enabled_indices else n_channels_total))
-        if need_rebuild:
-            for c in state['curves']:
-                try:
-                    plot_item.removeItem(c)
-                except Exception:
-                    pass
-            state['curves'] = []
-            if enabled_indices:
-                for out_idx, ch in enumerate(enabled_indices):
-                    pen = pg.mkPen(color=pg.intColor(ch, hues=max(n_channels_total, 1), values=1, maxValue=200), width=1)
-                    curve = pg.PlotDataItem(pen=pen, antialias=True)
-                    plot_item.addItem(curve)
-                    state['curves'].append(curve)
-            else:
-                for ch in range(n_channels_total):
-                    pen = pg.mkPen(color=pg.intColor(ch, hues=max(n_channels_total, 1), values=1, maxValue=200), width=1)
-                    curve = pg.PlotDataItem(pen=pen, antialias=True)
-                    plot_item.addItem(curve)
-                    state['curves'].append(curve)
-
-        # Update curve data
-        if enabled_indices:
-            for out_idx, ch in enumerate(enabled_indices):
-                if x:
-                    yraw = state['raw_history'][ch]
-                    if state.get('fit_to_band'):
-                        # Scale to fill band: normalize min..max to [-0.5, 0.5] of band height
-                        ymin = min(yraw) if yraw else 0
-                        ymax = max(yraw) if yraw else 1
-                        yrng = (ymax - ymin) or 1
-                        ynorm = [(((v - (ymin + yrng/2)) / yrng) + 0) / 1.0 for v in yraw]
-                    else:
-                        ynorm = [(((v - state['means'][ch]) / state['scales'][ch]) if state['scales'][ch] else v) for v in yraw]
-                    ynorm = [v + y_offsets[out_idx] for v in ynorm]
-                    state['curves'][out_idx].setData(x, ynorm)
+            a_metadata = self.dataTr.get_stream_metadata(stream_name) or {}
+            state['channel_labels'] = a_metadata.get('ch_labels', []) or []
+        channel_map = self.stream_plot_channels.get(stream_name, {})
+        if channel_map:
+            enabled = sorted((info['idx'], name) for name, info in channel_map.items() if info.get('is_enabled', True) and info['idx'] < n_channels_total)
+            channel_order = [idx for idx, _ in enabled]
+            labels = [name for _, name in enabled]
         else:
-            for ch in range(n_channels_total):
-                if x:
-                    yraw = state['raw_history'][ch]
-                    if state.get('fit_to_band'):
-                        ymin = min(yraw) if yraw else 0
-                        ymax = max(yraw) if yraw else 1
-                        yrng = (ymax - ymin) or 1
-                        ynorm = [(((v - (ymin + yrng/2)) / yrng) + 0) / 1.0 for v in yraw]
-                    else:
-                        ynorm = [(((v - state['means'][ch]) / state['scales'][ch]) if state['scales'][ch] else v) for v in yraw]
-                    ynorm = [v + y_offsets[ch] for v in ynorm]
-                    state['curves'][ch].setData(x, ynorm)
+            channel_order = list(range(n_channels_total))
+            if state['channel_labels'] and len(state['channel_labels']) == n_channels_total:
+                labels = list(state['channel_labels'])
+            else:
+                labels = [str(i+1) for i in channel_order]
+
+        spacing = CHANNEL_Y_FILL / max(len(channel_order), 1)
+        y_offsets = np.arange(len(channel_order), dtype=np.float64) * spacing
 
         # Set y-axis ticks to channel labels or numbers
-        if enabled_labels:
-            yticks = [(y_offsets[i], enabled_labels[i]) for i in range(len(enabled_labels))]
-        elif state['channel_labels'] and len(state['channel_labels']) == n_channels_total:
-            yticks = [(y_offsets[i], state['channel_labels'][i]) for i in range(min(len(y_offsets), len(state['channel_labels'])))]
-        else:
-            yticks = [(y_offsets[i], str(i+1)) for i in range(len(y_offsets))]
-        ax = plot_item.getAxis('left')
-        ax.setTicks([yticks])
+        plot_item.getAxis('left').setTicks([[(float(y_offsets[i]), labels[i]) for i in range(len(channel_order))]])
 
         # Fix Y range by default so channels remain stationary vertically,
         # but do not override if the user has manually adjusted Y.
-        if y_offsets and not state.get('y_manual'):
-            y_min = -spacing * 0.5
-            y_max = y_offsets[-1] + spacing * 0.5
+        if len(y_offsets) and not state.get('y_manual'):
             state['suppress_y_signal'] = True
-            plot_item.setYRange(y_min, y_max, padding=0.0)
+            plot_item.setYRange(-spacing * 0.5, y_offsets[-1] + spacing * 0.5, padding=0.0)
             state['suppress_y_signal'] = False
 
-        # Lock x-range to the window
-        plot_item.setXRange(0, x_max, padding=0.0)
-        state['last_x_range'] = (0, x_max)
-
-        # Plot markers as scatter points at top of stack
-        if marker_ts and marker_buffer and (enabled_indices or n_channels_total > 0):
-            marker_x, marker_y = [], []
-            top = y_offsets[-1] + spacing*0.5 if y_offsets else 0
-            if time_mode and state['ts_history']:
-                t0 = state['ts_history'][0]
-                for ts, ms in zip(marker_ts, marker_buffer):
-                    x_val = ts - t0
-                    if 0 <= x_val <= x_max:
-                        marker_x.append(x_val)
-                        marker_y.append(top)
-            # synthetic index mode: skip marker alignment unless we can map indices
-            if state['marker_scatter']:
-                try:
-                    plot_item.removeItem(state['marker_scatter'])
-                except Exception:
-                    pass
-                state['marker_scatter'] = None
-            if marker_x:
-                state['marker_scatter'] = pg.ScatterPlotItem(marker_x, marker_y, symbol='t', size=14, brush='r', pen=pg.mkPen('k', width=1))
-                plot_item.addItem(state['marker_scatter'])
+        self._sync_curve_items(plot_item, state, channel_order, n_channels_total)
+        layout = {'key': layout_key, 'channel_order': np.asarray(channel_order, dtype=np.intp), 'y_offsets': y_offsets, 'spacing': spacing}
+        state['layout'] = layout
+        state['layout_dirty'] = False
+        state['layout_version'] += 1
+        return layout
 
-        logger.info(f'MultiStreamPlotManagingWidget get_data(...) finished.')
+
+    def _sync_curve_items(self, plot_item, state, channel_order, n_channels_total: int):
+        """ shows the items for the enabled channels: in RENDER_PER_CHANNEL mode one pooled PlotDataItem per channel, created
+        once and then only shown/hidden; in RENDER_STACKED mode the stream's single StackedCurvesItem
+        """
+        if len(state.get('pens') or []) != n_channels_total:
+            state['pens'] = [pg.mkPen(color=pg.intColor(ch, hues=max(n_channels_total, 1), values=1, maxValue=200), width=1) for ch in range(n_channels_total)]
+        pens = state['pens']
+        pool = state.setdefault('curve_pool', {}) ## channel index -> PlotDataItem
+        if self.render_mode == RENDER_STACKED:
+            for curve in pool.values():
+                curve.setVisible(False)
+            if state['stacked_item'] is None:
+                state['stacked_item'] = StackedCurvesItem(antialias=True)
+                plot_item.addItem(state['stacked_item'])
+            state['stacked_item'].color_mode = self.stacked_color_mode
+            state['stacked_item'].setVisible(True)
+            state['stacked_pens'] = [pens[ch] for ch in channel_order]
+            state['curves'] = []
+        else:
+            if state['stacked_item'] is not None:
+                state['stacked_item'].clear()
+                state['stacked_item'].setVisible(False)
+            enabled_set = set(channel_order)
+            for ch in channel_order:
+                if ch not in pool:
+                    pool[ch] = pg.PlotDataItem(pen=pens[ch], antialias=True)
+                    plot_item.addItem(pool[ch])
+            for ch, curve in pool.items():
+                curve.setVisible(ch in enabled_set)
+            state['curves'] = [pool[ch] for ch in channel_order]
+
+
+    def _plot_pixel_width(self, plot_item) -> int:
+        try:
+            return max(int(plot_item.getViewBox().width()), 100)
+        except Exception:
+            return 1000
+
+
+    def on_render_prepared(self, stream_name: str, result):
+        """ GUI-thread half of render prep: swaps the prepared arrays into the stream's items """
+        state = self.stream_graphics.get(stream_name)
+        if (state is None) or (result is None) or (result['layout_version'] != state.get('layout_version')):
+            return # plot removed, window overwritten, or prepared for an outdated size/channel selection
+        x, y = result['x'], result['y']
+        if state['layout']['key'][0] == RENDER_STACKED:
+            state['stacked_item'].setData(x, y, state['stacked_pens'], y_offsets=state['layout']['y_offsets'], spacing=state['layout']['spacing'])
+        else:
+            for out_idx, curve in enumerate(state['curves'][:y.shape[1]]):
+                curve.setData(x, y[:, out_idx])
+
+
+    def stop_render_worker(self):
+        if self._render_worker is not None:
+            self._render_worker.stop()
+            self._render_worker = None
+
+
+    def _create_history(self, stream_name: str, n_channels: int, dtype) -> StreamRingBuffer:
+        """ allocates a stream's plot history, sized for a bit more than one window at the stream's nominal rate """
+        srate = (self.dataTr.get_stream_metadata(stream_name) or {}).get('srate') or 0.0
+        seconds_per_screen = getattr(self.dataTr, 'seconds_per_screen', 2)
+        capacity = max(int(srate * seconds_per_screen * 1.5), 1024)
+        return StreamRingBuffer(capacity, n_channels, dtype=np.result_type(dtype, np.float32))
+
+
+    def _grow_history(self, state, n_incoming: int) -> StreamRingBuffer:
+        """ doubles the history until the current window plus the incoming chunk fits, keeping the window's samples (its new,
+        empty MinMaxPyramid is filled from them by the next render prep) """
+        old = state['history']
+        ts, data, _ = old.read(state['window_start'])
+        capacity = old.capacity
+        while (len(ts) + n_incoming) > (capacity - max(capacity // 8, 1)):
+            capacity *= 2
+        history = StreamRingBuffer(capacity, old.n_channels, dtype=old.dtype)
+        history.write(ts, data)
+        state['history'] = history
+        state['lod'] = MinMaxPyramid(capacity, old.n_channels, dtype=old.dtype)
+        state['window_start'] = 0
+        return history
 
 
     def set_channel_enabled(self, stream_name: str, channel_name: str, enabled: bool):
-        """Toggle channel visibility for a given stream."""
-        if stream_name in self.stream_plot_channels and channel_name in self.stream_plot_channels[stream_name]:
-            self.stream_plot_channels[stream_name][channel_name]['is_enabled'] = bool(enabled)
-            # No immediate redraw; will apply on next get_data()
-    
+        """Toggle channel visibility for a given stream.
+        O(1): a pooled per-channel curve is shown/hidden right away; the layout (offsets, ticks) is rebuilt once and the stream
+        is redrawn from its history on the next frame, so toggling many channels in a row doesn't rebuild anything per toggle.
+        """
+        self.set_channels_enabled(stream_name, [channel_name], enabled)
+
+
+    def set_channels_enabled(self, stream_name: str, channel_names, enabled: bool):
+        """ enables/disables several channels of a stream at once (all of them if `channel_names` is None) """
+        channel_map = self.stream_plot_channels.get(stream_name)
+        state = self.stream_graphics.get(stream_name)
+        if channel_map is None:
+            return
+        if channel_names is None:
+            channel_names = list(channel_map.keys())
+        n_changed = 0
+        for channel_name in channel_names:
+            info = channel_map.get(channel_name)
+            if (info is None) or (info.get('is_enabled', True) == bool(enabled)):
+                continue
+            info['is_enabled'] = bool(enabled)
+            n_changed += 1
+            if state is not None:
+                curve = state.get('curve_pool', {}).get(info['idx'])
+                if (curve is not None) and (self.render_mode == RENDER_PER_CHANNEL):
+                    curve.setVisible(bool(enabled))
+        if (state is None) or (n_changed == 0):
+            return
+        state['n_enabled'] += n_changed if enabled else -n_changed
+        state['layout_dirty'] = True
+        state['layout_version'] += 1 ## drop render results prepared for the old selection
+        if state['n_enabled'] <= 0 and state.get('stacked_item') is not None:
+            state['stacked_item'].clear()
+        self._dirty_streams.setdefault(stream_name, 0)
+
 
     def _attach_plot_interactions(self, stream_name: str, plot_item: pg.PlotItem) -> None:
         """Enable context menu, add Reset Y-Scale action, and watch for manual Y-range changes."""
@@ -379,6 +928,8 @@ class MultiStreamPlotManagingWidget(pg.GraphicsLayoutWidget):
                     if not st:
                         return
                     st['fit_to_band'] = not st.get('fit_to_band', False)
+                    if st.get('scaler') is not None:
+                        st['scaler'].invalidate()
                 fit_action = menu.addAction('Toggle Fit Channels to Band')
                 fit_action.triggered.connect(toggle_fit)
         except Exception:
@@ -392,13 +943,20 @@ class MultiStreamPlotManagingWidget(pg.GraphicsLayoutWidget):
                 st = self.stream_graphics.get(stream_name)
                 if not st:
                     return
-                if st.get('suppress_y_signal'):
+                if st.get('suppress_y_signal') or self._suppress_range_signals:
                     return
                 st['y_manual'] = True
             # Connect to both generic and y-specific signals for robustness
             vb.sigRangeChanged.connect(on_y_changed)
             if hasattr(vb, 'sigYRangeChanged'):
                 vb.sigYRangeChanged.connect(on_y_changed)
+            # Envelopes are prepared for the plot's pixel width, so results computed before a resize are stale
+            def on_resized(*args, **kwargs):
+                st = self.stream_graphics.get(stream_name)
+                if st:
+                    st['layout_version'] += 1
+                    self._dirty_streams.setdefault(stream_name, 0) ## redraw at the new width (or catch up if it came into view)
+            vb.sigResized.connect(on_resized)
         except Exception:
             pass
 
@@ -414,13 +972,15 @@ class MultiStreamPlotManagingWidget(pg.GraphicsLayoutWidget):
             channel_map = self.stream_plot_channels.get(stream_name, {})
             enabled = [(info['idx'], name) for name, info in channel_map.items() if info.get('is_enabled', True)]
             enabled.sort(key=lambda t: t[0])
-            n_enabled = len(enabled) if enabled else (len(state.get('raw_history') or []))
+            n_enabled = len(enabled) if enabled else (state['history'].n_channels if state.get('history') is not None else 0)
             spacing = CHANNEL_Y_FILL / max(n_enabled or 1, 1)
 
             y_min = -spacing * 0.5
             y_max = (max(n_enabled - 1, 0) * spacing) + spacing * 0.5
 
             state['y_manual'] = False
+            if state.get('scaler') is not None:
+                state['scaler'].invalidate()
             state['suppress_y_signal'] = True
             plot_item.setYRange(y_min, y_max, padding=0.0)
             state['suppress_y_signal'] = False
@@ -443,6 +1003,7 @@ class PaintWidget(pg.PlotWidget):
         self.setBackground('w')
         self.showGrid(x=True, y=True, alpha=0.3)
         self.dataTr = DataThread(self)
+        self.dataTr.push_payloads = True ## this widget consumes sendData payloads rather than the ring buffers
         self.dataTr.sendData.connect(self.get_data)
         self.dataTr.changedStream.connect(self.reset)
         self.curves = []
@@ -488,38 +1049,36 @@ class PaintWidget(pg.PlotWidget):
 
     def get_data(self, stream_name, sig_ts, sig_buffer, marker_stream_names, marker_ts, marker_buffer):
         """ updates self.curves and self.marker_scatter 
+        Markers come from the DataThread's marker_store (sendData's marker lists are empty).
         """
         logger.info(f'PaintWidget get_data(...) started.')
 
         # Defensive: check for valid buffer
-        if not sig_buffer or not isinstance(sig_buffer, list) or not sig_buffer or not isinstance(sig_buffer[0], (list, tuple)):
+        sig_buffer = np.asarray(sig_buffer) if sig_buffer is not None else None
+        if sig_buffer is None or sig_buffer.ndim != 2 or len(sig_buffer) == 0:
             self.clear()
             self.curves = []
             self.n_channels = 0
             self.n_samples = 0
             return
 
-        n_samples = len(sig_buffer)
-        n_channels = len(sig_buffer[0]) if n_samples > 0 else 0
+        n_samples, n_channels = sig_buffer.shape
         self.n_channels = n_channels
         self.n_samples = n_samples
 
         # Defensive: check for valid timestamps
-        if not sig_ts or len(sig_ts) != n_samples:
+        if sig_ts is None or len(sig_ts) != n_samples:
             x = list(range(n_samples))
             time_mode = False
         else:
+            sig_ts = np.asarray(sig_ts, dtype=np.float64).tolist()
             x = [t - sig_ts[0] for t in sig_ts]
             time_mode = True
 
         # Get channel labels if available
-        if hasattr(self.dataTr, "stream_params") and self.dataTr.stream_params:
-            try:
-                ch_labels = self.dataTr.stream_params[self.dataTr.sig_strm_idx]['metadata'].get('ch_labels', [])
-                if ch_labels and len(ch_labels) == n_channels:
-                    self.channel_labels = ch_labels
-            except Exception:
-                self.channel_labels = []
+        a_metadata = self.dataTr.get_stream_metadata(stream_name) or {}
+        ch_labels = a_metadata.get('ch_labels', []) or []
+        self.channel_labels = ch_labels if len(ch_labels) == n_channels else []
 
         # Compute mean and scaling for each channel for robust display
         if not self.mean or len(self.mean) != n_channels:
@@ -571,6 +1130,8 @@ class PaintWidget(pg.PlotWidget):
             self.last_x_range = (x_min, x_max)
 
         # Plot markers as scatter points
+        if time_mode and not marker_ts:
+            _, marker_ts, marker_buffer = self.dataTr.marker_store.query(sig_ts[0], sig_ts[-1])
         if marker_ts and marker_buffer and n_channels > 0:
             marker_x = []
             marker_y = []
@@ -615,146 +1176,3 @@ class PaintWidget(pg.PlotWidget):
         super().paintEvent(event)
 
         logger.info(f'PaintWidget paintEvent(...) finished.')
-
-        
-# class PaintWidget(QWidget):
-
-#     def __init__(self, widget):
-#         super().__init__()
-#         self.reset()
-#         pal = QPalette()
-#         pal.setColor(QPalette.Background, Qt.white)
-#         self.setAutoFillBackground(True)
-#         self.setPalette(pal)
-
-#         self.dataTr = DataThread(self)
-#         self.dataTr.sendData.connect(self.get_data)
-#         self.dataTr.changedStream.connect(self.reset)
-
-#     def reset(self):
-#         self.chunk_idx = 0
-#         self.channelHeight = 0
-#         self.px_per_samp = 0
-#         self.dataBuffer = None
-#         self.markerBuffer = None
-#         self.lastY = []
-#         self.scaling = []
-#         self.mean = []
-#         self.t0 = 0
-
-#     def get_data(self, sig_ts, sig_buffer, marker_ts, marker_buffer):
-#         update_x0 = float(self.width())
-#         update_width = 0.
-
-#         # buffer should have exactly self.dataTr.chunkSize samples or be empty
-#         if any(sig_ts):
-#             if not self.mean:
-#                 self.mean = [0 for _ in range(len(sig_buffer[0]))]
-#                 self.scaling = [1 for _ in range(len(sig_buffer[0]))]
-#             if self.chunk_idx == 0:
-#                 self.t0 = sig_ts[0]
-#             self.dataBuffer = deepcopy(sig_buffer)
-#             px_per_chunk = self.width() / self.dataTr.chunksPerScreen
-#             update_x0 = self.chunk_idx * px_per_chunk
-#             update_width = px_per_chunk
-
-#         if any(marker_ts):
-#             px_out = []
-#             ms_out = []
-#             px_per_sec = self.width() / self.dataTr.seconds_per_screen
-#             for ts, ms in zip(marker_ts, marker_buffer):
-#                 if any(sig_ts):  # Relative to signal timestamps
-#                     this_px = update_x0 + (ts - sig_ts[0]) * px_per_sec
-#                     if 0 <= this_px <= self.width():
-#                         px_out.append(this_px)
-#                         ms_out.append(','.join(ms))
-#                 else:
-#                     # TODO: Check samples vs pixels for both data stream and marker stream.
-#                     # I think there is some rounding error.
-                    
-#                     if self.t0 <= ts <= (self.t0 + self.dataTr.seconds_per_screen):
-#                         px_out.append((ts - self.t0) * px_per_sec)
-#                         ms_out.append(','.join(ms))
-#             if any(px_out):
-#                 # Sometimes the marker might happen just off screen so we lose it.
-#                 self.markerBuffer = zip(px_out, ms_out)
-#                 update_x0 = min(update_x0, min(px_out))
-#                 update_width = max(update_width, max([_ - update_x0 for _ in px_out]))
-
-#         if any(sig_ts) and update_x0 == sig_ts[0]:
-#             update_x0 -= self.px_per_samp  # Offset to connect with previous sample
-
-#         # Repaint only the region of the screen containing this data chunk.
-#         if update_width > 0:
-#             self.update(int(update_x0), 0, int(update_width + 1), self.height())
-
-#     def paintEvent(self, event):
-#         painter = QPainter(self)
-#         if self.dataBuffer is not None:
-#             painter.setPen(QPen(Qt.blue))
-
-#             n_samps = len(self.dataBuffer)
-#             n_chans = len(self.dataBuffer[0])
-
-#             self.channelHeight = self.height() / n_chans
-#             self.px_per_samp = self.width() / self.dataTr.chunksPerScreen / n_samps
-
-#             # ======================================================================================================
-#             # Calculate Trend and Scaling
-#             # ======================================================================================================
-#             if self.chunk_idx == 0 or not self.mean:
-#                 for chan_idx in range(n_chans):
-#                     samps_for_chan = [frame[chan_idx] for frame in self.dataBuffer]
-#                     self.mean[chan_idx] = sum(samps_for_chan) / len(samps_for_chan)
-
-#                     for m in range(len(samps_for_chan)):
-#                         samps_for_chan[m] -= self.mean[chan_idx]
-
-#                     data_range = (max(samps_for_chan) - min(samps_for_chan) + 0.0000000000001)
-#                     self.scaling[chan_idx] = self.channelHeight * CHANNEL_Y_FILL / data_range
-
-#             # ======================================================================================================
-#             # Trend Removal and Scaling
-#             # ======================================================================================================
-#             try:
-#                 for samp_idx in range(n_samps):
-#                     for chan_idx in range(n_chans):
-#                         self.dataBuffer[samp_idx][chan_idx] -= self.mean[chan_idx]
-#                         self.dataBuffer[samp_idx][chan_idx] *= self.scaling[chan_idx]
-#             except (IndexError, ValueError) as e:
-#                 print(f'removing trend failed. Skipping.')
-#                 pass
-#             except Exception as e:
-#                 raise
-
-
-#             # ======================================================================================================
-#             # Plot
-#             # ======================================================================================================
-#             px_per_chunk = self.width() / self.dataTr.chunksPerScreen
-#             x0 = self.chunk_idx * px_per_chunk
-#             for ch_idx in range(n_chans):
-#                 chan_offset = (ch_idx + 0.5) * self.channelHeight
-#                 if self.lastY:
-#                     if not math.isnan(self.lastY[ch_idx]) and not math.isnan(self.dataBuffer[0][ch_idx]):
-#                         painter.drawLine(QPointF((x0 - self.px_per_samp),
-#                                          (-self.lastY[ch_idx] + chan_offset)),
-#                                         QPointF(x0,
-#                                          (-self.dataBuffer[0][ch_idx] + chan_offset)))
-
-#                 for m in range(n_samps - 1):
-#                     if not math.isnan(self.dataBuffer[m][ch_idx]) and not math.isnan(self.dataBuffer[m+1][ch_idx]):
-#                         painter.drawLine(QPointF((x0 + m * self.px_per_samp), (-self.dataBuffer[m][ch_idx] + chan_offset)),
-#                                          QPointF((x0 + (m + 1) * self.px_per_samp),  (-self.dataBuffer[m+1][ch_idx] + chan_offset)))
-
-#             # Reset for next iteration
-#             self.chunk_idx = (self.chunk_idx + 1) % self.dataTr.chunksPerScreen  # For next iteration
-#             self.lastY = self.dataBuffer[-1]
-#             self.dataBuffer = None
-
-#         if self.markerBuffer is not None:
-#             painter.setPen(QPen(Qt.red))
-#             for px, mrk in self.markerBuffer:
-#                 painter.drawLine(px, 0, px, self.height())
-#                 painter.drawText(px - 2 * self.px_per_samp, 0.95 * self.height(), mrk)
-#             self.markerBuffer = None
@@ -0,0 +1,398 @@
+import logging
+import os
+import queue
+import re
+import struct
+import threading
+import time
+from datetime import datetime
+from xml.sax.saxutils import escape
+import numpy as np
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+logger = logging.getLogger("phohale.sigvisualizer.Recorder")
+
+FORMAT_XDF = 'xdf'
+FORMAT_HDF5 = 'hdf5' ## needs the optional h5py package
+RECORDING_FORMATS = (FORMAT_XDF, FORMAT_HDF5)
+
+FSYNC_NONE = 'none' ## leave it to the OS when written batches reach the disk
+FSYNC_INTERVAL = 'interval' ## fsync at most every `fsync_interval` seconds
+FSYNC_ALWAYS = 'always' ## fsync after every batch write
+FSYNC_POLICIES = (FSYNC_NONE, FSYNC_INTERVAL, FSYNC_ALWAYS)
+
+## XDF chunk tags (https://github.com/sccn/xdf/wiki/Specifications)
+_TAG_FILE_HEADER, _TAG_STREAM_HEADER, _TAG_SAMPLES, _TAG_CLOCK_OFFSET, _TAG_BOUNDARY, _TAG_STREAM_FOOTER = 1, 2, 3, 4, 5, 6
+_BOUNDARY_UUID = bytes([0x43, 0xA5, 0x46, 0xDC, 0xCB, 0xF5, 0x41, 0x0F, 0xB3, 0x0E, 0xD5, 0x46, 0x73, 0x83, 0xCB, 0xE4])
+_XDF_VALUE_FORMATS = {np.dtype(np.float32): 'float32', np.dtype(np.float64): 'double64', np.dtype(np.int8): 'int8',
+                      np.dtype(np.int16): 'int16', np.dtype(np.int32): 'int32', np.dtype(np.int64): 'int64'}
+
+
+def format_for_path(path: str) -> str:
+    return FORMAT_HDF5 if os.path.splitext(path)[1].lower() in ('.h5', '.hdf5') else FORMAT_XDF
+
+
+def _xdf_varlen(n: int) -> bytes:
+    if n < 256:
+        return struct.pack('<BB', 1, n)
+    if n < 2 ** 32:
+        return struct.pack('<BI', 4, n)
+    return struct.pack('<BQ', 8, n)
+
+
+def _xdf_chunk(tag: int, content: bytes) -> bytes:
+    return _xdf_varlen(len(content) + 2) + struct.pack('<H', tag) + content
+
+
+def _set_xml_field(info_xml: str, field: str, value) -> str:
+    """ replaces (or adds) a top-level <field> of an LSL stream info XML """
+    pattern = re.compile(f'<{field}>.*?</{field}>', re.S)
+    element = f'<{field}>{escape(str(value))}</{field}>'
+    if pattern.search(info_xml):
+        return pattern.sub(lambda _: element, info_xml, count=1)
+    return info_xml.replace('</info>', f'{element}</info>', 1)
+
+
+
+class _XDFWriter:
+    """ serializes recording events into XDF chunks; the chunks are returned as bytes for the batching writer thread """
+
+    def __init__(self, file_obj):
+        self.file = file_obj
+        self._stream_ids = {} ## stream key -> XDF stream id
+        self._stats = {} ## stream id -> {'first', 'last', 'count', 'offsets'}
+        self._clock_offsets = {} ## stream id -> latest offset, undone on the timestamps (see StreamRecorder)
+        self._last_boundary_t = time.monotonic()
+        self.file.write(b'XDF:' + _xdf_chunk(_TAG_FILE_HEADER, (f'<?xml version="1.0"?><info><version>1.0</version>'
+                                                                 f'<datetime>{datetime.now().astimezone().isoformat()}</datetime></info>').encode('utf-8')))
+
+
+    def stream_header(self, key, info_xml: str, dtype) -> bytes:
+        stream_id = len(self._stats) + 1
+        self._stream_ids[key] = stream_id
+        self._stats[stream_id] = {'first': None, 'last': None, 'count': 0, 'offsets': [], 'dtype': np.dtype(dtype).newbyteorder('<')}
+        return _xdf_chunk(_TAG_STREAM_HEADER, struct.pack('<I', stream_id) + info_xml.encode('utf-8'))
+
+
+    def samples(self, key, ts, data, is_marker: bool) -> bytes:
+        stream_id = self._stream_ids.get(key)
+        if (stream_id is None) or (len(ts) == 0):
+            return b''
+        ts = np.asarray(ts, dtype=np.float64) - self._clock_offsets.get(stream_id, 0.0)
+        stats = self._stats[stream_id]
+        stats['first'] = float(ts[0]) if stats['first'] is None else stats['first']
+        stats['last'] = float(ts[-1])
+        stats['count'] += len(ts)
+        if is_marker:
+            parts = []
+            for a_ts, a_sample in zip(ts, data):
+                values = a_sample if isinstance(a_sample, (list, tuple)) else [a_sample]
+                parts.append(struct.pack('<Bd', 8, a_ts))
+                for a_value in values:
+                    encoded = str(a_value).encode('utf-8')
+                    parts.append(_xdf_varlen(len(encoded)) + encoded)
+            body = b''.join(parts)
+        else:
+            data = np.asarray(data)
+            rows = np.empty((len(ts),), dtype=np.dtype([('n_ts_bytes', 'u1'), ('ts', '<f8'), ('values', stats['dtype'], (data.shape[1],))]))
+            rows['n_ts_bytes'] = 8
+            rows['ts'] = ts
+            rows['values'] = data
+            body = rows.tobytes()
+        return _xdf_chunk(_TAG_SAMPLES, struct.pack('<I', stream_id) + _xdf_varlen(len(ts)) + body)
+
+
+    def clock_offset(self, key, collection_time: float, offset: float) -> bytes:
+        stream_id = self._stream_ids.get(key)
+        if stream_id is None:
+            return b''
+        self._clock_offsets[stream_id] = offset
+        self._stats[stream_id]['offsets'].append((collection_time - offset, offset))
+        return _xdf_chunk(_TAG_CLOCK_OFFSET, struct.pack('<Idd', stream_id, collection_time - offset, offset))
+
+
+    def boundary(self, boundary_interval: float) -> bytes:
+        now = time.monotonic()
+        if (now - self._last_boundary_t) < boundary_interval:
+            return b''
+        self._last_boundary_t = now
+        return _xdf_chunk(_TAG_BOUNDARY, _BOUNDARY_UUID)
+
+
+    def stream_footer(self, key) -> bytes:
+        stream_id = self._stream_ids.pop(key, None)
+        if stream_id is None:
+            return b''
+        stats = self._stats[stream_id] ## kept, so stream ids stay unique if the key is recorded again
+        offsets = ''.join(f'<offset><time>{t}</time><value>{v}</value></offset>' for t, v in stats['offsets'])
+        footer = (f'<?xml version="1.0"?><info><first_timestamp>{stats["first"] or 0.0}</first_timestamp>'
+                  f'<last_timestamp>{stats["last"] or 0.0}</last_timestamp><sample_count>{stats["count"]}</sample_count>'
+                  f'<clock_offsets>{offsets}</clock_offsets></info>')
+        return _xdf_chunk(_TAG_STREAM_FOOTER, struct.pack('<I', stream_id) + footer.encode('utf-8'))
+
+
+    def close(self) -> bytes:
+        return b''.join(self.stream_footer(key) for key in list(self._stream_ids))
+
+
+
+class _HDF5Writer:
+    """ writes each stream into /streams/<name>/ as chunked, resizable datasets (time_stamps, time_series, clock_offsets)
+    with the stream's info XML as an attribute. Timestamps are stored as displayed (already clock-corrected, local clock).
+    Sample chunks are collected per stream and appended by flush(), one resize per dataset for the whole batch. """
+
+    def __init__(self, h5_file, chunk_rows: int = 4096):
+        self.file = h5_file
+        self.chunk_rows = chunk_rows
+        self._groups = {} ## stream key -> h5py Group
+        self._pending = {} ## stream key -> ([ts arrays], [data arrays or marker rows]) not yet appended
+        self.pending_bytes = 0
+        self.file.attrs['datetime'] = datetime.now().astimezone().isoformat()
+
+
+    def stream_header(self, key, name: str, info_xml: str, n_channels: int, dtype, is_marker: bool):
+        group_name = name
+        suffix = 1
+        while f'streams/{group_name}' in self.file:
+            suffix += 1
+            group_name = f'{name} ({suffix})'
+        group = self.file.create_group(f'streams/{group_name}')
+        group.attrs['info_xml'] = info_xml
+        group.attrs['clock'] = 'local (timestamps already clock-corrected)'
+        value_dtype = h5py.string_dtype() if is_marker else dtype
+        group.create_dataset('time_stamps', shape=(0,), maxshape=(None,), dtype=np.float64, chunks=(self.chunk_rows,))
+        group.create_dataset('time_series', shape=(0, n_channels), maxshape=(None, n_channels), dtype=value_dtype,
+                             chunks=(self.chunk_rows, max(n_channels, 1)))
+        group.create_dataset('clock_offsets', shape=(0, 2), maxshape=(None, 2), dtype=np.float64, chunks=(256, 2))
+        self._groups[key] = group
+
+
+    @staticmethod
+    def _append(dataset, rows):
+        n = len(dataset)
+        dataset.resize(n + len(rows), axis=0)
+        dataset[n:] = rows
+
+
+    def samples(self, key, ts, data, is_marker: bool):
+        group = self._groups.get(key)
+        if (group is None) or (len(ts) == 0):
+            return
+        ts_parts, data_parts = self._pending.setdefault(key, ([], []))
+        ts_parts.append(np.asarray(ts, dtype=np.float64))
+        if is_marker:
+            data_parts.extend([str(v) for v in (a_sample if isinstance(a_sample, (list, tuple)) else [a_sample])] for a_sample in data)
+        else:
+            data_parts.append(np.asarray(data, dtype=group['time_series'].dtype))
+        self.pending_bytes += len(ts) * 8 + getattr(data_parts[-1], 'nbytes', 0)
+
+
+    def _flush_stream(self, key):
+        ts_parts, data_parts = self._pending.pop(key, ([], []))
+        group = self._groups.get(key)
+        if (group is None) or (not ts_parts):
+            return
+        is_marker = group['time_series'].dtype.kind == 'O'
+        self._append(group['time_stamps'], np.concatenate(ts_parts))
+        self._append(group['time_series'], np.asarray(data_parts, dtype=object) if is_marker else np.concatenate(data_parts))
+
+
+    def flush(self):
+        """ appends the collected sample chunks of every stream """
+        for key in list(self._pending):
+            self._flush_stream(key)
+        self.pending_bytes = 0
+
+
+    def clock_offset(self, key, collection_time: float, offset: float):
+        group = self._groups.get(key)
+        if group is not None:
+            self._append(group['clock_offsets'], np.array([[collection_time, offset]]))
+
+
+    def stream_footer(self, key):
+        self._flush_stream(key)
+        self._groups.pop(key, None)
+
+
+    def close(self):
+        self.flush()
+        self._groups.clear()
+
+
+
+class StreamRecorder(threading.Thread):
+    """ Records the chunks the ingestion layer receives to an XDF (or chunked HDF5) file on a dedicated writer thread.
+
+    `write_chunk()` / `add_clock_offset()` only enqueue and never block, so the dispatch loop (and hence the display) is never
+    held up by the disk. Buffering is bounded: numeric chunks beyond `max_buffer_bytes` of unwritten data are dropped and
+    counted in `dropped_chunks` (markers are always kept). The writer thread serializes everything into one buffer and writes
+    it with a single sequential write once `batch_bytes` have accumulated or every `flush_interval` seconds (HDF5 appends are
+    batched the same way, per dataset); `fsync_policy` decides when the written data is forced to disk.
+
+    XDF files follow LabRecorder's layout: stream headers with the full LSL info XML, sample chunks, ClockOffset chunks and
+    stream footers. Since the inlets already apply clock correction, timestamps are written in the sender's clock (the latest
+    offset undone) with the offsets alongside, so XDF readers that synchronize clocks reproduce the displayed times.
+    """
+
+    def __init__(self, path: str, file_format: str = None, max_buffer_bytes: int = 256 * 2 ** 20, batch_bytes: int = 4 * 2 ** 20,
+                 flush_interval: float = 1.0, fsync_policy: str = FSYNC_INTERVAL, fsync_interval: float = 5.0,
+                 boundary_interval: float = 10.0):
+        super().__init__(name='StreamRecorder', daemon=True)
+        self.path = path
+        self.file_format = file_format or format_for_path(path)
+        if self.file_format not in RECORDING_FORMATS:
+            raise ValueError(f'Unknown recording format {self.file_format!r}; expected one of {RECORDING_FORMATS}')
+        if (self.file_format == FORMAT_HDF5) and (h5py is None):
+            raise ValueError('Recording to HDF5 needs the optional h5py package')
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f'Unknown fsync policy {fsync_policy!r}; expected one of {FSYNC_POLICIES}')
+        self.max_buffer_bytes = max_buffer_bytes
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.boundary_interval = boundary_interval
+        self.dropped_chunks = 0
+        self.bytes_written = 0
+        self._queue = queue.Queue()
+        self._buffered_bytes = 0 ## bytes of sample data enqueued but not yet serialized
+        self._buffer_lock = threading.Lock()
+        self._streams = {} ## stream key -> is_marker
+        self._running = True
+        self._file_obj, self._writer = self._open() ## opened here so a bad path raises in the caller, not in the writer thread
+
+
+    def add_stream(self, key, name: str, info_xml: str, n_channels: int, dtype=np.float32, srate: float = None, is_marker: bool = False,
+                   clock_offset=None):
+        """ starts recording a stream; `dtype`/`srate` are those of the chunks that will be written (i.e. after any decimation).
+        `clock_offset` (collection_time, offset), measured as the stream joins, is recorded right after its header, so its
+        first samples are already written in the sender's clock """
+        info_xml = info_xml or f'<?xml version="1.0"?><info><name>{escape(name)}</name><channel_count>{n_channels}</channel_count></info>'
+        info_xml = _set_xml_field(info_xml, 'channel_format', 'string' if is_marker else _XDF_VALUE_FORMATS.get(np.dtype(dtype), 'float32'))
+        if srate is not None:
+            info_xml = _set_xml_field(info_xml, 'nominal_srate', srate)
+        self._queue.put(('header', key, name, info_xml, n_channels, np.dtype(dtype), is_marker))
+        if clock_offset is not None:
+            self._queue.put(('offset', key, clock_offset[0], clock_offset[1]))
+        self._streams[key] = is_marker ## only now does write_chunk() accept the stream's samples
+
+
+    def remove_stream(self, key):
+        if self._streams.pop(key, None) is not None:
+            self._queue.put(('footer', key))
+
+
+    def write_chunk(self, key, ts, data) -> bool:
+        """ enqueues a chunk (which must not be modified afterwards); returns False if it was dropped to bound the buffering """
+        is_marker = self._streams.get(key)
+        if is_marker is None:
+            return False
+        n_bytes = 0 if is_marker else (len(ts) * 8 + getattr(data, 'nbytes', 0))
+        with self._buffer_lock:
+            if (n_bytes > 0) and (self._buffered_bytes + n_bytes > self.max_buffer_bytes):
+                self.dropped_chunks += 1
+                if self.dropped_chunks == 1 or (self.dropped_chunks % 100) == 0:
+                    logger.warning(f'StreamRecorder: writer is falling behind, {self.dropped_chunks} chunks dropped so far.')
+                return False
+            self._buffered_bytes += n_bytes
+        self._queue.put(('samples', key, ts, data, is_marker, n_bytes))
+        return True
+
+
+    def add_clock_offset(self, key, collection_time: float, offset: float):
+        if key in self._streams:
+            self._queue.put(('offset', key, collection_time, offset))
+
+
+    def stop(self, wait: bool = True, timeout: float = 5.0):
+        """ asks the writer thread to write the stream footers, flush and close the file; with `wait` this blocks until it
+        has (up to `timeout`), otherwise it returns at once and the thread finishes on its own """
+        self._running = False
+        self._queue.put(None)
+        if wait:
+            self.join(timeout)
+
+
+    def _open(self):
+        if self.file_format == FORMAT_HDF5:
+            h5_file = h5py.File(self.path, 'w')
+            return h5_file, _HDF5Writer(h5_file)
+        file_obj = open(self.path, 'wb', buffering=0)
+        return file_obj, _XDFWriter(file_obj)
+
+
+    def _fsync(self, file_obj):
+        try:
+            if self.file_format == FORMAT_HDF5:
+                file_obj.flush()
+                os.fsync(file_obj.id.get_vfd_handle())
+            else:
+                os.fsync(file_obj.fileno())
+        except Exception as e:
+            logger.debug(f'StreamRecorder fsync failed: {e}')
+
+
+    def run(self):
+        logger.info(f'StreamRecorder run() started ({self.file_format}: {self.path!r}).')
+        file_obj, writer = self._file_obj, self._writer
+        is_xdf = (self.file_format == FORMAT_XDF)
+        pending = bytearray()
+        last_flush_t = last_fsync_t = time.monotonic()
+        done = False
+        while not done:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = False
+            if item is None:
+                done = True
+            elif item:
+                kind, key = item[0], item[1]
+                try:
+                    if kind == 'samples':
+                        _, _, ts, data, is_marker, n_bytes = item
+                        with self._buffer_lock:
+                            self._buffered_bytes -= n_bytes
+                        chunk = writer.samples(key, ts, data, is_marker)
+                    elif kind == 'header':
+                        _, _, name, info_xml, n_channels, dtype, is_marker = item
+                        chunk = writer.stream_header(key, info_xml, dtype) if is_xdf else writer.stream_header(key, name, info_xml, n_channels, dtype, is_marker)
+                    elif kind == 'offset':
+                        chunk = writer.clock_offset(key, item[2], item[3])
+                    else:
+                        chunk = writer.stream_footer(key)
+                    if is_xdf and chunk:
+                        pending += chunk
+                except Exception as e:
+                    logger.exception(f'StreamRecorder failed to write a {kind} record: {e}')
+            now = time.monotonic()
+            pending_bytes = len(pending) if is_xdf else writer.pending_bytes
+            if done or (pending_bytes >= self.batch_bytes) or ((now - last_flush_t) >= self.flush_interval):
+                if is_xdf:
+                    pending += writer.boundary(self.boundary_interval)
+                    if done:
+                        pending += writer.close()
+                    if pending:
+                        file_obj.write(pending)
+                        self.bytes_written += len(pending)
+                        pending = bytearray()
+                else:
+                    try:
+                        writer.flush()
+                    except Exception as e:
+                        logger.exception(f'StreamRecorder failed to append the batched samples: {e}')
+                    file_obj.flush()
+                last_flush_t = now
+                if (self.fsync_policy == FSYNC_ALWAYS) or ((self.fsync_policy == FSYNC_INTERVAL) and ((now - last_fsync_t) >= self.fsync_interval)) or done:
+                    if self.fsync_policy != FSYNC_NONE:
+                        self._fsync(file_obj)
+                    last_fsync_t = now
+        if not is_xdf:
+            writer.close()
+        file_obj.close()
+        logger.info(f'StreamRecorder run() finished ({self.bytes_written} bytes, {self.dropped_chunks} chunks dropped).')
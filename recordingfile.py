@@ -0,0 +1,260 @@
+import logging
+import os
+import struct
+import xml.etree.ElementTree as ET
+import numpy as np
+import pylsl
+from recorder import FORMAT_HDF5, FORMAT_XDF
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+logger = logging.getLogger("phohale.sigvisualizer.RecordingFile")
+
+FORMAT_NPZ = 'npz'
+
+## XDF channel_format -> (numpy dtype of the values, pylsl channel format)
+XDF_VALUE_FORMATS = {
+    'float32': (np.float32, pylsl.cf_float32),
+    'double64': (np.float64, pylsl.cf_double64),
+    'int8': (np.int8, pylsl.cf_int8),
+    'int16': (np.int16, pylsl.cf_int16),
+    'int32': (np.int32, pylsl.cf_int32),
+    'int64': (np.int64, pylsl.cf_int64),
+    'string': (None, pylsl.cf_string),
+}
+_DTYPE_CHANNEL_FORMATS = {np.dtype(dtype): channel_format for dtype, channel_format in XDF_VALUE_FORMATS.values() if dtype is not None}
+_TAG_STREAM_HEADER, _TAG_SAMPLES, _TAG_CLOCK_OFFSET = 2, 3, 4
+
+
+def recording_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.h5', '.hdf5'):
+        return FORMAT_HDF5
+    if extension == '.npz':
+        return FORMAT_NPZ
+    return FORMAT_XDF
+
+
+def info_field(info_xml: str, field: str, default=''):
+    """ the text of a top-level field of an LSL stream info XML, or `default` """
+    if not info_xml:
+        return default
+    try:
+        value = ET.fromstring(info_xml).findtext(field)
+    except ET.ParseError:
+        value = None
+    return default if value is None else value.strip()
+
+
+
+class RecordedStream:
+    """ one stream of a recording: its LSL info XML, timestamps (n,) and samples, an (n, n_channels) NDArray for numeric
+    streams or a list of per-sample string lists for marker streams """
+
+    def __init__(self, name: str, info_xml: str, ts, data, stream_type: str = '', srate: float = 0.0, channel_format=pylsl.cf_float32,
+                 source_id: str = ''):
+        self.name = name
+        self.info_xml = info_xml
+        self.ts = np.asarray(ts, dtype=np.float64)
+        self.data = data
+        self.type = stream_type
+        self.srate = float(srate)
+        self.channel_format = channel_format
+        self.source_id = source_id
+        self.is_marker = (channel_format == pylsl.cf_string)
+        self.n_channels = (len(data[0]) if len(data) else int(info_field(info_xml, 'channel_count', '1') or 1)) if self.is_marker else data.shape[1]
+
+
+    @classmethod
+    def from_info_xml(cls, info_xml: str, ts, data, default_name: str = 'stream'):
+        value_format = info_field(info_xml, 'channel_format', 'float32')
+        channel_format = XDF_VALUE_FORMATS.get(value_format, (None, pylsl.cf_float32))[1]
+        return cls(info_field(info_xml, 'name') or default_name, info_xml, ts, data, stream_type=info_field(info_xml, 'type'),
+                   srate=float(info_field(info_xml, 'nominal_srate', '0') or 0.0), channel_format=channel_format,
+                   source_id=info_field(info_xml, 'source_id'))
+
+
+    @property
+    def duration(self) -> float:
+        return float(self.ts[-1] - self.ts[0]) if len(self.ts) else 0.0
+
+
+
+def read_varlen(file_obj):
+    """ reads an XDF variable-length integer (a 1/4/8 byte length prefix, then the value), or returns None at end of file """
+    prefix = file_obj.read(1)
+    if not prefix:
+        return None
+    n_bytes = prefix[0]
+    if n_bytes not in (1, 4, 8):
+        raise ValueError(f'invalid XDF varlen prefix {n_bytes} at offset {file_obj.tell() - 1}')
+    return int.from_bytes(file_obj.read(n_bytes), 'little')
+
+
+def _varlen_at(buffer, pos: int):
+    n_bytes = buffer[pos]
+    return int.from_bytes(buffer[pos + 1:pos + 1 + n_bytes], 'little'), pos + 1 + n_bytes
+
+
+def iter_xdf_chunks(file_obj, read_content: bool = True):
+    """ yields (tag, content_offset, content_length, content) for each chunk of an XDF file positioned after the magic bytes;
+    `content` is None if `read_content` is False (the file is then seeked past it). A truncated last chunk ends the iteration. """
+    while True:
+        chunk_length = read_varlen(file_obj)
+        if chunk_length is None:
+            return
+        tag_bytes = file_obj.read(2)
+        if len(tag_bytes) < 2:
+            return
+        content_offset, content_length = file_obj.tell(), chunk_length - 2
+        if read_content:
+            content = file_obj.read(content_length)
+            if len(content) < content_length:
+                logger.warning(f'iter_xdf_chunks: truncated chunk at offset {content_offset}, ignoring the rest of the file.')
+                return
+        else:
+            content = None
+            file_obj.seek(content_length, os.SEEK_CUR)
+        yield struct.unpack('<H', tag_bytes)[0], content_offset, content_length, content
+
+
+def decode_xdf_samples(content, value_dtype, n_channels: int, srate: float, last_ts: float = 0.0):
+    """ decodes the body of an XDF Samples chunk (after the stream id) into (ts, values, last_ts). Samples without a
+    timestamp get the previous one plus 1/srate. Numeric chunks where every sample carries its timestamp are decoded in one
+    structured-array view; `value_dtype` None means string values (returned as a list of per-sample lists). """
+    n_samples, pos = _varlen_at(content, 0)
+    if value_dtype is not None:
+        row_dtype = np.dtype([('n_ts_bytes', 'u1'), ('ts', '<f8'), ('values', np.dtype(value_dtype).newbyteorder('<'), (n_channels,))])
+        if len(content) - pos == n_samples * row_dtype.itemsize:
+            rows = np.frombuffer(content, dtype=row_dtype, count=n_samples, offset=pos)
+            if (rows['n_ts_bytes'] == 8).all():
+                ts = rows['ts'].copy()
+                return ts, rows['values'].astype(value_dtype), (float(ts[-1]) if n_samples else last_ts)
+    interval = (1.0 / srate) if srate > 0 else 0.0
+    ts = np.empty((n_samples,), dtype=np.float64)
+    values = np.empty((n_samples, n_channels), dtype=value_dtype) if value_dtype is not None else []
+    value_size = np.dtype(value_dtype).itemsize * n_channels if value_dtype is not None else 0
+    for i in range(n_samples):
+        if content[pos] == 8:
+            last_ts = struct.unpack_from('<d', content, pos + 1)[0]
+            pos += 9
+        else:
+            last_ts += interval
+            pos += 1
+        ts[i] = last_ts
+        if value_dtype is not None:
+            values[i] = np.frombuffer(content, dtype=np.dtype(value_dtype).newbyteorder('<'), count=n_channels, offset=pos)
+            pos += value_size
+        else:
+            a_sample = []
+            for _ in range(n_channels):
+                n_bytes, pos = _varlen_at(content, pos)
+                a_sample.append(bytes(content[pos:pos + n_bytes]).decode('utf-8', errors='replace'))
+                pos += n_bytes
+            values.append(a_sample)
+    return ts, values, last_ts
+
+
+def read_xdf(path: str, synchronize_clocks: bool = True):
+    """ loads every stream of an XDF file; with `synchronize_clocks` the timestamps are mapped into the recording computer's
+    clock by interpolating the stream's ClockOffset measurements (as XDF readers do) """
+    headers, parts, offsets = {}, {}, {}
+    with open(path, 'rb') as file_obj:
+        if file_obj.read(4) != b'XDF:':
+            raise ValueError(f'{path!r} is not an XDF file')
+        for tag, _, _, content in iter_xdf_chunks(file_obj):
+            if tag == _TAG_STREAM_HEADER:
+                stream_id = struct.unpack_from('<I', content)[0]
+                info_xml = bytes(content[4:]).decode('utf-8', errors='replace')
+                value_format = info_field(info_xml, 'channel_format', 'float32')
+                headers[stream_id] = {'info_xml': info_xml, 'dtype': XDF_VALUE_FORMATS.get(value_format, (np.float32,))[0],
+                                      'n_channels': int(info_field(info_xml, 'channel_count', '1') or 1),
+                                      'srate': float(info_field(info_xml, 'nominal_srate', '0') or 0.0), 'last_ts': 0.0}
+                parts[stream_id] = []
+            elif tag == _TAG_SAMPLES:
+                stream_id = struct.unpack_from('<I', content)[0]
+                header = headers.get(stream_id)
+                if header is None:
+                    continue
+                ts, values, header['last_ts'] = decode_xdf_samples(memoryview(content)[4:], header['dtype'], header['n_channels'],
+                                                                   header['srate'], header['last_ts'])
+                parts[stream_id].append((ts, values))
+            elif tag == _TAG_CLOCK_OFFSET:
+                stream_id, collection_time, offset = struct.unpack('<Idd', content)
+                offsets.setdefault(stream_id, []).append((collection_time, offset))
+    streams = []
+    for stream_id, header in headers.items():
+        stream_parts = parts[stream_id]
+        ts = np.concatenate([a_ts for a_ts, _ in stream_parts]) if stream_parts else np.empty((0,), dtype=np.float64)
+        if header['dtype'] is None:
+            data = [a_sample for _, values in stream_parts for a_sample in values]
+        elif stream_parts:
+            data = np.concatenate([values for _, values in stream_parts])
+        else:
+            data = np.empty((0, header['n_channels']), dtype=header['dtype'])
+        if synchronize_clocks and offsets.get(stream_id) and len(ts):
+            offset_t, offset_v = np.array(offsets[stream_id]).T
+            ts = ts + np.interp(ts, offset_t, offset_v)
+        streams.append(RecordedStream.from_info_xml(header['info_xml'], ts, data, default_name=f'stream {stream_id}'))
+    return streams
+
+
+def read_npz(path: str):
+    """ loads a `.npz` recording: per stream `<name>/time_stamps` (n,) and `<name>/time_series` (n, n_channels), optionally
+    `<name>/info_xml` and `<name>/srate`. A file with bare `time_stamps`/`time_series` arrays is one stream named after the
+    file. String `time_series` are replayed as markers. """
+    streams = []
+    with np.load(path, allow_pickle=False) as npz:
+        prefixes = sorted({key[:-len('time_stamps')] for key in npz.files if key.endswith('time_stamps')})
+        for prefix in prefixes:
+            name = prefix.rstrip('/') or os.path.splitext(os.path.basename(path))[0]
+            ts = npz[f'{prefix}time_stamps']
+            data = npz[f'{prefix}time_series']
+            if data.ndim == 1:
+                data = data[:, np.newaxis]
+            srate = float(npz[f'{prefix}srate']) if f'{prefix}srate' in npz.files else 0.0
+            info_xml = str(npz[f'{prefix}info_xml']) if f'{prefix}info_xml' in npz.files else None
+            if data.dtype.kind in 'US':
+                streams.append(RecordedStream(name, info_xml, ts, data.astype(str).tolist(), stream_type='Markers', channel_format=pylsl.cf_string))
+            elif info_xml:
+                streams.append(RecordedStream.from_info_xml(info_xml, ts, data, default_name=name))
+            else:
+                streams.append(RecordedStream(name, info_xml, ts, data, srate=srate, channel_format=_DTYPE_CHANNEL_FORMATS.get(data.dtype, pylsl.cf_float32)))
+    return streams
+
+
+def read_hdf5(path: str):
+    """ loads an HDF5 recording in the layout recorder.StreamRecorder writes (/streams/<name>/time_stamps, time_series) """
+    if h5py is None:
+        raise ValueError('Reading HDF5 recordings needs the optional h5py package')
+    streams = []
+    with h5py.File(path, 'r') as h5_file:
+        for name, group in h5_file.get('streams', {}).items():
+            info_xml = group.attrs.get('info_xml')
+            ts = group['time_stamps'][:]
+            dataset = group['time_series']
+            if dataset.dtype.kind == 'O':
+                data = [[v.decode('utf-8', errors='replace') if isinstance(v, bytes) else str(v) for v in row] for row in dataset[:]]
+            else:
+                data = dataset[:]
+            if info_xml:
+                streams.append(RecordedStream.from_info_xml(info_xml, ts, data, default_name=name))
+            else:
+                streams.append(RecordedStream(name, None, ts, data, channel_format=pylsl.cf_string if dataset.dtype.kind == 'O' else _DTYPE_CHANNEL_FORMATS.get(dataset.dtype, pylsl.cf_float32)))
+    return streams
+
+
+def read_recording(path: str):
+    """ loads all streams of an XDF, NPZ or HDF5 recording (by file extension) as a list of RecordedStream """
+    file_format = recording_format(path)
+    if file_format == FORMAT_HDF5:
+        streams = read_hdf5(path)
+    elif file_format == FORMAT_NPZ:
+        streams = read_npz(path)
+    else:
+        streams = read_xdf(path)
+    logger.info(f'read_recording({path!r}): {len(streams)} streams.')
+    return streams
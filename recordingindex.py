@@ -0,0 +1,394 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import numpy as np
+from recorder import FORMAT_HDF5, FORMAT_XDF
+from recordingfile import XDF_VALUE_FORMATS, decode_xdf_samples, info_field, recording_format
+from renderprep import envelope_parts
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+logger = logging.getLogger("phohale.sigvisualizer.RecordingIndex")
+
+INDEX_VERSION = 2 ## 2: per-chunk min/max of numeric streams
+INDEX_SUFFIX = '.svidx.npz' ## sidecar file next to the recording (or in the temp directory if that isn't writable)
+HDF5_INDEX_STRIDE = 4096 ## an HDF5 stream is indexed in blocks of this many samples
+_TAG_STREAM_HEADER, _TAG_SAMPLES, _TAG_CLOCK_OFFSET = 2, 3, 4
+
+
+def _sidecar_paths(path: str):
+    """ candidate sidecar locations, preferred first """
+    digest = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+    return [path + INDEX_SUFFIX, os.path.join(tempfile.gettempdir(), f'{os.path.basename(path)}-{digest}{INDEX_SUFFIX}')]
+
+
+
+class IndexedStream:
+    """ one stream of an indexed recording: its metadata, the time index (`index`, a dict of equally long arrays) and
+    the stream's clock offsets (k, 2) as (remote time, offset) rows """
+
+    def __init__(self, name: str, info_xml: str, n_channels: int, dtype, srate: float, is_marker: bool, index: dict = None, clock_offsets=None):
+        self.name = name
+        self.info_xml = info_xml
+        self.n_channels = int(n_channels)
+        self.dtype = np.dtype(dtype) if dtype is not None else None
+        self.srate = float(srate)
+        self.is_marker = bool(is_marker)
+        self.index = index or {}
+        self.clock_offsets = np.asarray(clock_offsets if clock_offsets is not None else np.empty((0, 2)), dtype=np.float64).reshape(-1, 2)
+
+
+    def to_local(self, ts):
+        """ maps the stream's own timestamps to the recording computer's clock (identity without clock offsets) """
+        if len(self.clock_offsets) == 0:
+            return ts
+        return ts + np.interp(ts, self.clock_offsets[:, 0], self.clock_offsets[:, 1])
+
+
+    def from_local(self, t: float) -> float:
+        if len(self.clock_offsets) == 0:
+            return t
+        return t - float(np.interp(t, self.clock_offsets[:, 0], self.clock_offsets[:, 1]))
+
+
+    def meta(self) -> dict:
+        return {'name': self.name, 'info_xml': self.info_xml, 'n_channels': self.n_channels, 'srate': self.srate,
+                'dtype': self.dtype.str if self.dtype is not None else None, 'is_marker': self.is_marker}
+
+
+
+class RecordingIndex:
+    """ Random access into an XDF or HDF5 recording by time, for viewing files far larger than RAM.
+
+    On first open a time index is built and saved as a sidecar (`<recording>.svidx.npz`); later opens load the sidecar
+    as long as the recording's size and modification time are unchanged. For XDF the index holds every Samples chunk's
+    file offset, sample count and first/last timestamp, for HDF5 the same per block of HDF5_INDEX_STRIDE samples; for
+    numeric streams it also keeps each chunk's per-channel min and max (building it reads the file once, through a
+    memory map for XDF).
+
+    `read_range()` then touches only the chunks overlapping the requested window: XDF chunks whose rows all carry a
+    timestamp (as written by LabRecorder and StreamRecorder) are viewed in place in the memory-mapped file, others are
+    decoded. Windows with more than `max_samples` samples are reduced to their min/max envelope; if they also span more
+    than `max_chunks` chunks, the interior chunks contribute their indexed min/max instead of their samples, so zooming
+    out over an overnight recording stays bounded without dropping any chunk's peaks.
+    """
+
+    def __init__(self, path: str, file_format: str, streams, max_chunks: int = 4096):
+        self.path = path
+        self.file_format = file_format
+        self.streams = streams
+        self.max_chunks = max_chunks
+        self._mm = None ## np.memmap of the whole XDF file
+        self._h5 = None
+        if file_format == FORMAT_XDF:
+            self._mm = np.memmap(path, dtype=np.uint8, mode='r')
+        else:
+            self._h5 = h5py.File(path, 'r')
+        spans = [self.time_span(i) for i in range(len(streams))]
+        spans = [span for span in spans if span is not None]
+        self.t_start = min((span[0] for span in spans), default=0.0)
+        self.t_stop = max((span[1] for span in spans), default=0.0)
+
+
+    @classmethod
+    def open(cls, path: str, rebuild: bool = False, **kwargs) -> 'RecordingIndex':
+        """ opens a recording, loading its sidecar index or (re)building it """
+        file_format = recording_format(path)
+        if file_format not in (FORMAT_XDF, FORMAT_HDF5):
+            raise ValueError(f'Only XDF and HDF5 recordings can be viewed offline, not {path!r}')
+        if (file_format == FORMAT_HDF5) and (h5py is None):
+            raise ValueError('Viewing HDF5 recordings needs the optional h5py package')
+        stat = os.stat(path)
+        signature = {'version': INDEX_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        streams = None if rebuild else cls._load_sidecar(path, signature)
+        if streams is None:
+            streams = _build_xdf_index(path) if file_format == FORMAT_XDF else _build_hdf5_index(path)
+            cls._save_sidecar(path, signature, streams)
+        return cls(path, file_format, streams, **kwargs)
+
+
+    @staticmethod
+    def _load_sidecar(path: str, signature: dict):
+        for sidecar_path in _sidecar_paths(path):
+            if not os.path.exists(sidecar_path):
+                continue
+            try:
+                with np.load(sidecar_path, allow_pickle=False) as npz:
+                    meta = json.loads(str(npz['meta']))
+                    if meta['signature'] != signature:
+                        logger.info(f'RecordingIndex: {sidecar_path!r} is out of date, rebuilding.')
+                        continue
+                    streams = []
+                    for i, stream_meta in enumerate(meta['streams']):
+                        index = {key[len(f's{i}_'):]: npz[key] for key in npz.files if key.startswith(f's{i}_') and key != f's{i}_clock_offsets'}
+                        streams.append(IndexedStream(**stream_meta, index=index, clock_offsets=npz[f's{i}_clock_offsets']))
+                    return streams
+            except Exception as e:
+                logger.warning(f'RecordingIndex could not load {sidecar_path!r}: {e}')
+        return None
+
+
+    @staticmethod
+    def _save_sidecar(path: str, signature: dict, streams):
+        arrays = {'meta': np.array(json.dumps({'signature': signature, 'streams': [stream.meta() for stream in streams]}))}
+        for i, stream in enumerate(streams):
+            arrays[f's{i}_clock_offsets'] = stream.clock_offsets
+            arrays.update({f's{i}_{key}': value for key, value in stream.index.items()})
+        for sidecar_path in _sidecar_paths(path):
+            try:
+                with open(sidecar_path, 'wb') as file_obj:
+                    np.savez(file_obj, **arrays)
+                logger.info(f'RecordingIndex saved {sidecar_path!r}.')
+                return
+            except OSError as e:
+                logger.info(f'RecordingIndex could not write {sidecar_path!r}: {e}')
+
+
+    def time_span(self, stream_index: int):
+        """ (first, last) timestamp of a stream in the recording computer's clock, or None if it has no samples """
+        stream = self.streams[stream_index]
+        first, last = stream.index.get('first_ts'), stream.index.get('last_ts')
+        if (first is None) or (not len(first)):
+            return None
+        return float(stream.to_local(first[:1])[0]), float(stream.to_local(last[-1:])[0])
+
+
+    def _xdf_chunk(self, stream: IndexedStream, i: int):
+        """ (ts, values) of one indexed XDF Samples chunk; fixed-layout numeric chunks are zero-copy views of the memory map """
+        index = stream.index
+        offset, n = int(index['offset'][i]), int(index['n_samples'][i])
+        if index['fixed'][i]:
+            row_dtype = np.dtype([('n_ts_bytes', 'u1'), ('ts', '<f8'), ('values', stream.dtype.newbyteorder('<'), (stream.n_channels,))])
+            rows = np.ndarray((n,), dtype=row_dtype, buffer=self._mm, offset=offset)
+            return rows['ts'], rows['values']
+        body = memoryview(self._mm)[offset:offset + int(index['length'][i])]
+        ts, values, _ = decode_xdf_samples(body, stream.dtype, stream.n_channels, stream.srate, float(index['prev_ts'][i]))
+        return ts, values
+
+
+    def _hdf5_block(self, stream: IndexedStream, i: int):
+        """ (ts, values) of one indexed block of an HDF5 stream """
+        group = self._h5['streams'][stream.name]
+        a = i * HDF5_INDEX_STRIDE
+        b = a + int(stream.index['n_samples'][i])
+        return group['time_stamps'][a:b], group['time_series'][a:b]
+
+
+    def read_range(self, stream_index: int, t_start: float, t_stop: float, max_samples: int = None):
+        """ returns (ts, data) of a numeric stream with t_start <= ts <= t_stop (recording computer's clock), or their
+        min/max envelope (renderprep.envelope_parts) within `max_samples` rows if there are more """
+        stream = self.streams[stream_index]
+        empty = (np.empty((0,), dtype=np.float64), np.empty((0, stream.n_channels), dtype=stream.dtype))
+        if stream.is_marker:
+            return empty
+        raw_start, raw_stop = stream.from_local(t_start), stream.from_local(t_stop)
+        ts, data = self._read_chunks_range(stream, raw_start, raw_stop, max_samples)
+        if ts is None:
+            return empty
+        return stream.to_local(ts), data
+
+
+    def _read_chunks_range(self, stream: IndexedStream, raw_start: float, raw_stop: float, max_samples: int):
+        index = stream.index
+        i0 = int(np.searchsorted(index['last_ts'], raw_start, side='left'))
+        i1 = int(np.searchsorted(index['first_ts'], raw_stop, side='right'))
+        if i1 <= i0:
+            return None, None
+        read_chunk = self._hdf5_block if self.file_format == FORMAT_HDF5 else self._xdf_chunk
+        n_total = int(index['n_samples'][i0:i1].sum())
+        summarize = bool(max_samples) and (n_total > max_samples) and ((i1 - i0) > self.max_chunks) and ('min' in index)
+
+        def clipped(i):
+            ts, values = read_chunk(stream, i)
+            a = int(np.searchsorted(ts, raw_start, side='left')) if i == i0 else 0
+            b = int(np.searchsorted(ts, raw_stop, side='right')) if i == (i1 - 1) else len(ts)
+            return ts[a:b], values[a:b]
+
+        def parts():
+            if not summarize:
+                for i in range(i0, i1):
+                    yield clipped(i)
+                return
+            yield clipped(i0) ## the edge chunks may reach beyond the window, so only their samples inside it count
+            yield index['first_ts'][i0 + 1:i1 - 1], index['min'][i0 + 1:i1 - 1], index['max'][i0 + 1:i1 - 1]
+            yield clipped(i1 - 1)
+
+        ts, data = envelope_parts(parts(), n_total, raw_start, raw_stop, max_samples, stream.n_channels, stream.dtype)
+        if not len(ts):
+            return None, None
+        return ts, data
+
+
+    def read_markers(self, stream_index: int):
+        """ returns (ts, samples) of a whole marker stream (recording computer's clock), samples as per-sample string lists """
+        stream = self.streams[stream_index]
+        if self.file_format == FORMAT_HDF5:
+            group = self._h5['streams'][stream.name]
+            samples = [[v.decode('utf-8', errors='replace') if isinstance(v, bytes) else str(v) for v in row] for row in group['time_series'][:]]
+            return group['time_stamps'][:], samples
+        parts_ts, samples = [], []
+        for i in range(len(stream.index.get('offset', []))):
+            ts, values = self._xdf_chunk(stream, i)
+            parts_ts.append(ts)
+            samples.extend(values)
+        ts = np.concatenate(parts_ts) if parts_ts else np.empty((0,), dtype=np.float64)
+        return stream.to_local(ts), samples
+
+
+    def stream_view(self, stream_index: int) -> 'RecordingStreamView':
+        return RecordingStreamView(self, stream_index)
+
+
+    def close(self):
+        self._mm = None
+        if self._h5 is not None:
+            self._h5.close()
+            self._h5 = None
+
+
+
+class RecordingStreamView:
+    """ one numeric stream of a RecordingIndex with the ScrollbackStore interface the plot widget browses (`time_span`,
+    `read_range`, `close`); samples are returned in a floating point dtype like the plot histories """
+
+    def __init__(self, recording: RecordingIndex, stream_index: int):
+        self.recording = recording
+        self.stream_index = stream_index
+
+
+    def time_span(self):
+        return self.recording.time_span(self.stream_index)
+
+
+    def read_range(self, t_start: float, t_stop: float, max_samples: int = None):
+        ts, data = self.recording.read_range(self.stream_index, t_start, t_stop, max_samples=max_samples)
+        return ts, data.astype(np.result_type(data.dtype, np.float32), copy=False)
+
+
+    def close(self):
+        pass
+
+
+
+def _build_xdf_index(path: str):
+    """ scans an XDF file through a memory map, reading chunk headers and, for fixed-layout sample chunks, only their
+    first and last row; other sample chunks (markers, rows without timestamps) are decoded to find their time span """
+    streams, chunks = {}, {}
+    with open(path, 'rb') as file_obj, mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        if mm[:4] != b'XDF:':
+            raise ValueError(f'{path!r} is not an XDF file')
+        pos = 4
+        while pos < size:
+            n_bytes = mm[pos]
+            chunk_length = int.from_bytes(mm[pos + 1:pos + 1 + n_bytes], 'little')
+            pos += 1 + n_bytes
+            if (n_bytes not in (1, 4, 8)) or (pos + chunk_length > size):
+                logger.warning(f'_build_xdf_index: truncated or corrupt chunk at offset {pos} of {path!r}, indexing stops there.')
+                break
+            tag = struct.unpack_from('<H', mm, pos)[0]
+            content, end = pos + 2, pos + chunk_length
+            pos = end
+            if tag == _TAG_STREAM_HEADER:
+                stream_id = struct.unpack_from('<I', mm, content)[0]
+                info_xml = mm[content + 4:end].decode('utf-8', errors='replace')
+                value_format = info_field(info_xml, 'channel_format', 'float32')
+                dtype = XDF_VALUE_FORMATS.get(value_format, (np.float32,))[0]
+                streams[stream_id] = IndexedStream(info_field(info_xml, 'name') or f'stream {stream_id}', info_xml,
+                                                   int(info_field(info_xml, 'channel_count', '1') or 1), dtype,
+                                                   float(info_field(info_xml, 'nominal_srate', '0') or 0.0), dtype is None)
+                chunks[stream_id] = {'offset': [], 'length': [], 'n_samples': [], 'first_ts': [], 'last_ts': [], 'prev_ts': [], 'fixed': [],
+                                     'min': [], 'max': [], 'offsets': [], 'last_ts_seen': 0.0}
+            elif tag == _TAG_SAMPLES:
+                stream_id = struct.unpack_from('<I', mm, content)[0]
+                stream, table = streams.get(stream_id), chunks.get(stream_id)
+                if stream is None:
+                    continue
+                n_samples = int.from_bytes(mm[content + 5:content + 5 + mm[content + 4]], 'little')
+                body = content + 5 + mm[content + 4]
+                if n_samples == 0:
+                    continue
+                row_size = (9 + stream.dtype.itemsize * stream.n_channels) if stream.dtype is not None else 0
+                fixed = bool(row_size) and (end - body == n_samples * row_size) ## every row then has an 8-byte timestamp
+                if fixed:
+                    first_ts = struct.unpack_from('<d', mm, body + 1)[0]
+                    last_ts = struct.unpack_from('<d', mm, body + (n_samples - 1) * row_size + 1)[0]
+                    extrema = _fixed_chunk_extrema(mm, body, n_samples, stream)
+                else:
+                    ts, values, last_ts = decode_xdf_samples(memoryview(mm)[content + 4:end], stream.dtype, stream.n_channels, stream.srate, table['last_ts_seen'])
+                    first_ts = float(ts[0])
+                    extrema = (values.min(axis=0), values.max(axis=0)) if stream.dtype is not None else None
+                    del values
+                if extrema is not None:
+                    table['min'].append(extrema[0])
+                    table['max'].append(extrema[1])
+                table['offset'].append(body if fixed else content + 4)
+                table['length'].append(end - body if fixed else end - content - 4)
+                table['n_samples'].append(n_samples)
+                table['first_ts'].append(first_ts)
+                table['last_ts'].append(last_ts)
+                table['prev_ts'].append(table['last_ts_seen'])
+                table['fixed'].append(fixed)
+                table['last_ts_seen'] = last_ts
+            elif tag == _TAG_CLOCK_OFFSET:
+                stream_id, collection_time, offset = struct.unpack_from('<Idd', mm, content)
+                if stream_id in chunks:
+                    chunks[stream_id]['offsets'].append((collection_time, offset))
+    for stream_id, stream in streams.items():
+        table = chunks[stream_id]
+        stream.clock_offsets = np.array(table['offsets'], dtype=np.float64).reshape(-1, 2)
+        stream.index = {'offset': np.array(table['offset'], dtype=np.int64), 'length': np.array(table['length'], dtype=np.int64),
+                        'n_samples': np.array(table['n_samples'], dtype=np.int64), 'first_ts': np.array(table['first_ts'], dtype=np.float64),
+                        'last_ts': np.array(table['last_ts'], dtype=np.float64), 'prev_ts': np.array(table['prev_ts'], dtype=np.float64),
+                        'fixed': np.array(table['fixed'], dtype=bool)}
+        if stream.dtype is not None:
+            stream.index['min'] = np.array(table['min'], dtype=stream.dtype).reshape(-1, stream.n_channels)
+            stream.index['max'] = np.array(table['max'], dtype=stream.dtype).reshape(-1, stream.n_channels)
+        if len(stream.index['last_ts']) and np.any(np.diff(stream.index['last_ts']) < 0):
+            logger.warning(f'_build_xdf_index: chunks of {stream.name!r} are not in time order; time lookups may miss samples.')
+    logger.info(f'_build_xdf_index({path!r}): {len(streams)} streams, {sum(len(t["offset"]) for t in chunks.values())} sample chunks.')
+    return list(streams.values())
+
+
+def _fixed_chunk_extrema(mm, body: int, n_samples: int, stream: IndexedStream):
+    """ per-channel (min, max) of a fixed-layout XDF Samples chunk, read in place from the memory map """
+    row_dtype = np.dtype([('n_ts_bytes', 'u1'), ('ts', '<f8'), ('values', stream.dtype.newbyteorder('<'), (stream.n_channels,))])
+    values = np.ndarray((n_samples,), dtype=row_dtype, buffer=mm, offset=body)['values']
+    return values.min(axis=0), values.max(axis=0)
+
+
+def _build_hdf5_index(path: str, blocks_per_read: int = 64):
+    """ indexes every stream in blocks of HDF5_INDEX_STRIDE samples, reading `blocks_per_read` blocks at a time """
+    streams = []
+    with h5py.File(path, 'r') as h5_file:
+        for name, group in h5_file.get('streams', {}).items():
+            info_xml = group.attrs.get('info_xml') or ''
+            dataset = group['time_series']
+            is_marker = dataset.dtype.kind == 'O'
+            time_stamps = group['time_stamps']
+            n_total = len(time_stamps)
+            starts = np.arange(0, n_total, HDF5_INDEX_STRIDE)
+            index = {'first_ts': time_stamps[::HDF5_INDEX_STRIDE].astype(np.float64),
+                     'last_ts': time_stamps[HDF5_INDEX_STRIDE - 1::HDF5_INDEX_STRIDE].astype(np.float64),
+                     'n_samples': np.diff(np.append(starts, n_total)).astype(np.int64)}
+            if n_total % HDF5_INDEX_STRIDE:
+                index['last_ts'] = np.append(index['last_ts'], float(time_stamps[n_total - 1]))
+            if not is_marker:
+                mins, maxs = [], []
+                for a in range(0, n_total, HDF5_INDEX_STRIDE * blocks_per_read):
+                    values = dataset[a:a + HDF5_INDEX_STRIDE * blocks_per_read]
+                    block_starts = np.arange(0, len(values), HDF5_INDEX_STRIDE)
+                    mins.append(np.minimum.reduceat(values, block_starts, axis=0))
+                    maxs.append(np.maximum.reduceat(values, block_starts, axis=0))
+                index['min'] = np.concatenate(mins) if mins else np.empty((0, dataset.shape[1]), dtype=dataset.dtype)
+                index['max'] = np.concatenate(maxs) if maxs else np.empty((0, dataset.shape[1]), dtype=dataset.dtype)
+            streams.append(IndexedStream(name, info_xml, dataset.shape[1], None if is_marker else dataset.dtype,
+                                         float(info_field(info_xml, 'nominal_srate', '0') or 0.0), is_marker, index=index))
+    return streams
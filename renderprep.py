@@ -0,0 +1,177 @@
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger("phohale.sigvisualizer.RenderPrep")
+
+
+def _bin_extrema(x, y, x_start: float, x_stop: float, n_bins: int, y_max=None):
+    """ groups sorted x (n,) into `n_bins` equal-width bins over [x_start, x_stop] and returns, per non-empty bin, its
+    (bin index, first x, last x, per-channel minimum, per-channel maximum); samples before x_start form their own group """
+    n = len(x)
+    edges = np.linspace(x_start, x_stop, n_bins + 1)
+    starts = np.unique(np.searchsorted(x, edges[:-1], side='left'))
+    starts = starts[starts < n]
+    if (len(starts) == 0) or (starts[0] != 0):
+        starts = np.concatenate(([0], starts))
+    ends = np.append(starts[1:], n)
+    bins = np.clip(np.searchsorted(edges, x[starts], side='right') - 1, 0, n_bins - 1)
+    return (bins, x[starts], x[ends - 1], np.minimum.reduceat(y, starts, axis=0),
+            np.maximum.reduceat(y if y_max is None else y_max, starts, axis=0))
+
+
+def _interleave_extrema(x_first, x_last, y_min, y_max, dtype):
+    out_x = np.empty((2 * len(x_first),), dtype=np.float64)
+    out_x[0::2] = x_first
+    out_x[1::2] = x_last
+    out_y = np.empty((2 * len(x_first), y_min.shape[1]), dtype=np.result_type(dtype, np.float32))
+    out_y[0::2] = y_min
+    out_y[1::2] = y_max
+    return out_x, out_y
+
+
+def minmax_envelope(x, y, x_start: float, x_stop: float, n_bins: int, y_max=None):
+    """ reduces sorted x (n,) and y (n, n_channels) to at most 2 * n_bins rows: the min and the max of every channel within
+    each of `n_bins` equal-width x bins over [x_start, x_stop] (one bin per pixel column keeps every peak visible).
+    Inputs that are already small enough are returned unchanged. With `y_max`, y and y_max are per-row minima and maxima
+    (e.g. the buckets of a MinMaxPyramid level) and the output always alternates min/max rows.
+    """
+    n = len(x)
+    if (n <= 2 * n_bins) or (n_bins < 1) or (x_stop <= x_start):
+        if y_max is None:
+            return x, y
+        return _interleave_extrema(x, x, y, y_max, y.dtype)
+    _, x_first, x_last, y_min, y_max = _bin_extrema(x, y, x_start, x_stop, n_bins, y_max=y_max)
+    return _interleave_extrema(x_first, x_last, y_min, y_max, y.dtype)
+
+
+class MinMaxEnvelopeBuilder:
+    """ minmax_envelope() of a range that is read in consecutive, time-ordered parts (segments, blocks, file chunks), so the
+    range never has to be in memory at once: each part is reduced on its own and a bin split across two parts is merged.
+    The result has at most 2 * n_bins rows for parts within [x_start, x_stop].
+    """
+
+    def __init__(self, x_start: float, x_stop: float, n_bins: int):
+        self.x_start = float(x_start)
+        self.x_stop = max(float(x_stop), self.x_start + 1e-9)
+        self.n_bins = max(int(n_bins), 1)
+        self._parts = [] ## [(bins, x_first, x_last, y_min, y_max)], one per reduced part
+        self._dtype = None
+
+
+    def add(self, x, y, y_max=None):
+        """ reduces the next part; with `y_max`, y and y_max are already per-row minima and maxima """
+        if len(x) == 0:
+            return
+        self._dtype = np.result_type(y.dtype, self._dtype) if self._dtype is not None else y.dtype
+        bins, x_first, x_last, lo, hi = _bin_extrema(x, y, self.x_start, self.x_stop, self.n_bins, y_max=y_max)
+        if self._parts and (self._parts[-1][0][-1] == bins[0]):
+            _, _, prev_last, prev_lo, prev_hi = self._parts[-1]
+            prev_last[-1] = x_last[0]
+            prev_lo[-1] = np.minimum(prev_lo[-1], lo[0])
+            prev_hi[-1] = np.maximum(prev_hi[-1], hi[0])
+            bins, x_first, x_last, lo, hi = bins[1:], x_first[1:], x_last[1:], lo[1:], hi[1:]
+        if len(bins):
+            self._parts.append((bins, x_first, x_last, lo, hi))
+
+
+    def result(self, n_channels: int, dtype=np.float32):
+        """ (x, y) alternating each bin's min and max rows """
+        if not self._parts:
+            return np.empty((0,), dtype=np.float64), np.empty((0, n_channels), dtype=np.result_type(dtype, np.float32))
+        return _interleave_extrema(*(np.concatenate([part[k] for part in self._parts]) for k in range(1, 5)), self._dtype)
+
+
+def envelope_parts(parts, n_total: int, x_start: float, x_stop: float, max_samples: int, n_channels: int, dtype):
+    """ reads a range stored in consecutive parts, an iterable of (x, y) or (x, y, y_max) (see MinMaxEnvelopeBuilder.add):
+    copies of all `n_total` samples if there are at most `max_samples`, otherwise their min/max envelope over
+    max_samples // 2 bins of [x_start, x_stop], which keeps every peak and stays within `max_samples` rows """
+    if (not max_samples) or (n_total <= max_samples):
+        parts = [part[:2] for part in parts]
+        if not parts:
+            return np.empty((0,), dtype=np.float64), np.empty((0, n_channels), dtype=dtype)
+        return np.concatenate([np.asarray(x, dtype=np.float64) for x, _ in parts]), np.concatenate([y for _, y in parts])
+    builder = MinMaxEnvelopeBuilder(x_start, x_stop, max_samples // 2)
+    for part in parts:
+        builder.add(*part)
+    return builder.result(n_channels, dtype)
+
+
+def prepare_render(job: dict):
+    """ turns a plot's visible window into plot-ready arrays: reads [start, stop) from the history ring buffer, maps the
+    timestamps onto the shared time axis (x = ts - x_origin), reduces the window to min/max envelopes at the plot's pixel
+    width over `x_range`, then normalizes (centre/scale) and stacks (y offsets) the enabled channels.
+    Long windows are read from the coarsest level of the job's MinMaxPyramid (`lod`) that still has two buckets per pixel,
+    so the cost per frame depends on the plot's width rather than on the window's sample count. The pyramid is first caught
+    up with the history here, so it is maintained on the render prep thread rather than by whoever writes the history.
+    Returns {'x', 'y' (n_points, n_enabled), 'layout_version'}, or None if the window is empty or was overwritten meanwhile.
+    """
+    ring, lod, n_pixels = job['ring'], job.get('lod'), int(job['n_pixels'])
+    if lod is not None:
+        lod.catch_up(ring, job['stop'])
+    level_idx = lod.select_level(job['stop'] - job['start'], n_pixels) if lod is not None else None
+    if level_idx is None:
+        ts, data, start = ring.read(job['start'], job['stop'])
+        data_max = None
+        x_index = np.arange(len(ts), dtype=np.float64)
+    else:
+        ts, data, data_max, start = lod.read(level_idx, job['start'], job['stop'])
+        x_index = (np.arange(start, start + len(ts), dtype=np.float64) * lod.factors[level_idx]) - job['start']
+    if len(ts) == 0:
+        return None
+    x = (ts - job['x_origin']) if job['time_mode'] else x_index
+    x_start, x_stop = job['x_range']
+    x, data = minmax_envelope(x, data, float(x_start), float(x_stop), n_pixels, y_max=data_max)
+    idx = job['channel_order']
+    y = (data[:, idx] - job['means'][idx]) / job['scales'][idx] + job['y_offsets']
+    if not (ring.is_valid(start) if level_idx is None else lod.is_valid(level_idx, start)):
+        return None ## the writer lapped us while we were reading
+    return {'x': np.ascontiguousarray(x), 'y': y, 'layout_version': job['layout_version']}
+
+
+class RenderPrepWorker(threading.Thread):
+    """ Runs `prepare_render()` off the GUI thread.
+
+    `submit(name, job)` replaces any job for that plot that hasn't started yet (only the newest window matters), and each
+    result is handed to `on_result(name, result)`; pass a Qt signal's `emit` so the GUI thread receives it queued and only
+    has to swap the arrays into its items.
+    """
+
+    def __init__(self, on_result):
+        super().__init__(name='RenderPrepWorker', daemon=True)
+        self.on_result = on_result
+        self._jobs = {} ## plot name -> newest pending job
+        self._condition = threading.Condition()
+        self._running = True
+
+
+    def submit(self, name: str, job: dict):
+        with self._condition:
+            self._jobs[name] = job
+            self._condition.notify()
+
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+
+    def run(self):
+        logger.info(f'RenderPrepWorker run() started.')
+        while True:
+            with self._condition:
+                while self._running and not self._jobs:
+                    self._condition.wait()
+                if not self._running:
+                    break
+                jobs, self._jobs = self._jobs, {}
+            for name, job in jobs.items():
+                try:
+                    result = prepare_render(job)
+                except Exception as e:
+                    logger.exception(f'RenderPrepWorker failed to prepare {name!r}: {e}')
+                    continue
+                if result is not None:
+                    self.on_result(name, result)
+        logger.info(f'RenderPrepWorker run() finished.')
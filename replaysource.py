@@ -0,0 +1,220 @@
+import logging
+import math
+import os
+import time
+from xml.sax.saxutils import escape
+import numpy as np
+import pylsl
+from recordingfile import read_recording
+
+logger = logging.getLogger("phohale.sigvisualizer.ReplaySource")
+
+
+class ReplayClock:
+    """ Maps wall-clock time to recording time for all inlets of a ReplaySource.
+
+    With a `speed` the recording advances `speed` seconds per wall-clock second (1.0 = the original timing). With `speed`
+    None it advances as fast as the inlets are drained, in lockstep: an inlet may run at most `fast_step` recording-seconds
+    ahead of the least advanced other inlet, so streams (and markers relative to signals) stay interleaved as they were recorded.
+    When looping, the recording restarts every `period` seconds of recording time, which keeps increasing.
+    """
+
+    def __init__(self, t_start: float, t_stop: float, speed: float = 1.0, loop: bool = False, loop_gap: float = 0.1, fast_step: float = 0.1):
+        self.t_start = t_start
+        self.t_stop = t_stop
+        self.speed = speed
+        self.loop = loop
+        self.period = (t_stop - t_start) + loop_gap
+        self.fast_step = fast_step
+        self.time_offset = 0.0 ## added to replayed timestamps, so the replay starts at the local clock's "now"
+        self._inlets = []
+        self._wall_start = None
+
+
+    def register(self, inlet):
+        self._inlets.append(inlet)
+
+
+    def start(self):
+        self.time_offset = pylsl.local_clock() - self.t_start
+        self._wall_start = time.monotonic()
+
+
+    @property
+    def started(self) -> bool:
+        return self._wall_start is not None
+
+
+    def now(self, inlet=None) -> float:
+        """ the current recording time (as seen by `inlet`): samples with (loop-adjusted) timestamps up to it are available """
+        if self._wall_start is None:
+            return -math.inf
+        if self.speed is None:
+            return min((other.next_time() for other in self._inlets if other is not inlet), default=math.inf) + self.fast_step
+        return self.t_start + (time.monotonic() - self._wall_start) * self.speed
+
+
+
+class ReplayStreamInfo:
+    """ the subset of pylsl.StreamInfo's interface DataThread uses, for one recorded stream """
+
+    def __init__(self, stream, path: str):
+        self.stream = stream
+        self._source_id = f'replay:{os.path.basename(path)}:{stream.source_id or stream.name}'
+
+
+    def name(self) -> str:
+        return self.stream.name
+
+    def type(self) -> str:
+        return self.stream.type
+
+    def channel_count(self) -> int:
+        return self.stream.n_channels
+
+    def channel_format(self) -> int:
+        return self.stream.channel_format
+
+    def nominal_srate(self) -> float:
+        return self.stream.srate
+
+    def source_id(self) -> str:
+        return self._source_id
+
+    def uid(self) -> str:
+        return self._source_id
+
+    def session_id(self) -> str:
+        return 'replay'
+
+    def hostname(self) -> str:
+        return 'replay'
+
+
+    def as_xml(self) -> str:
+        if self.stream.info_xml:
+            return self.stream.info_xml
+        return (f'<?xml version="1.0"?><info><name>{escape(self.stream.name)}</name><type>{escape(self.stream.type)}</type>'
+                f'<channel_count>{self.stream.n_channels}</channel_count><nominal_srate>{self.stream.srate}</nominal_srate></info>')
+
+
+
+class ReplayInlet:
+    """ Serves one recorded stream with the pylsl.StreamInlet calls InletWorker makes (`samples_available`, `pull_chunk`
+    with or without `dest_obj`, `open_stream`, `close_stream`, `info`, `time_correction`). A sample becomes available once
+    the shared ReplayClock passes its timestamp; timestamps are shifted by the clock's `time_offset` (plus one period per loop).
+    """
+
+    def __init__(self, info: ReplayStreamInfo, clock: ReplayClock):
+        self._info = info
+        self.stream = info.stream
+        self.clock = clock
+        self._cursor = 0 ## index of the next sample to deliver
+        self._loop_count = 0
+        self._open = False ## only open inlets hold back the clock in as-fast-as-possible mode
+        clock.register(self)
+
+
+    @property
+    def exhausted(self) -> bool:
+        return (not self.clock.loop) and (self._cursor >= len(self.stream.ts))
+
+
+    def _wrap(self):
+        if self.clock.loop and len(self.stream.ts) and (self._cursor >= len(self.stream.ts)):
+            self._cursor = 0
+            self._loop_count += 1
+
+
+    def next_time(self) -> float:
+        """ recording time (loop-adjusted) of the next undelivered sample, or inf once exhausted (or closed). Called from other
+        inlets' threads via ReplayClock.now(), so it only reads the cursor """
+        cursor, loop_count = self._cursor, self._loop_count
+        if (not self._open) or (not len(self.stream.ts)):
+            return math.inf
+        if cursor >= len(self.stream.ts):
+            if not self.clock.loop:
+                return math.inf
+            cursor, loop_count = 0, loop_count + 1
+        return float(self.stream.ts[cursor]) + loop_count * self.clock.period
+
+
+    def samples_available(self) -> int:
+        self._wrap()
+        until = self.clock.now(self) - self._loop_count * self.clock.period
+        return int(np.searchsorted(self.stream.ts, until, side='right')) - self._cursor if self._cursor < len(self.stream.ts) else 0
+
+
+    def pull_chunk(self, timeout: float = 0.0, max_samples: int = 1024, dest_obj=None):
+        n = min(max(self.samples_available(), 0), int(max_samples))
+        a, b = self._cursor, self._cursor + n
+        self._cursor = b
+        ts = (self.stream.ts[a:b] + (self._loop_count * self.clock.period + self.clock.time_offset)).tolist()
+        if self.stream.is_marker:
+            return [list(a_sample) for a_sample in self.stream.data[a:b]], ts
+        if dest_obj is not None:
+            dest_obj[:n] = self.stream.data[a:b]
+            return dest_obj, ts
+        return self.stream.data[a:b].tolist(), ts
+
+
+    def open_stream(self, timeout: float = 0.0):
+        self._open = True
+
+
+    def close_stream(self):
+        self._open = False
+
+
+    def info(self, timeout: float = 0.0) -> ReplayStreamInfo:
+        return self._info
+
+
+    def time_correction(self, timeout: float = 0.0) -> float:
+        return 0.0
+
+
+
+class ReplaySource:
+    """ A recorded XDF, NPZ or HDF5 file played back as live streams, for deterministic load without hardware or a network.
+
+    `stream_infos` describe the recorded streams; `open_inlet()` returns a ReplayInlet for one of them, which DataThread
+    pulls from in place of a pylsl inlet (see DataThread.start_replay). Playback runs at `speed`× the original timing,
+    or as fast as the consumers drain it with `speed` None; all inlets share one ReplayClock, so marker and signal
+    streams interleave as recorded. `start()` starts the clock once the inlets are open.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False):
+        if (speed is not None) and (speed <= 0):
+            raise ValueError(f'speed must be positive (or None for as fast as possible), got {speed}')
+        self.path = path
+        self.streams = [a_stream for a_stream in read_recording(path) if len(a_stream.ts)]
+        if not self.streams:
+            raise ValueError(f'{path!r} contains no samples to replay')
+        t_start = min(float(a_stream.ts[0]) for a_stream in self.streams)
+        t_stop = max(float(a_stream.ts[-1]) for a_stream in self.streams)
+        self.clock = ReplayClock(t_start, t_stop, speed=speed, loop=loop)
+        self.stream_infos = [ReplayStreamInfo(a_stream, path) for a_stream in self.streams]
+        self.inlets = []
+
+
+    @property
+    def duration(self) -> float:
+        return self.clock.t_stop - self.clock.t_start
+
+
+    @property
+    def finished(self) -> bool:
+        return bool(self.inlets) and all(inlet.exhausted for inlet in self.inlets)
+
+
+    def open_inlet(self, info: ReplayStreamInfo) -> ReplayInlet:
+        inlet = ReplayInlet(info, self.clock)
+        self.inlets.append(inlet)
+        return inlet
+
+
+    def start(self):
+        self.clock.start()
+        logger.info(f'ReplaySource started {self.path!r}: {len(self.streams)} streams, {self.duration:.1f} s at '
+                    f'{"max" if self.clock.speed is None else self.clock.speed}× speed{" (looping)" if self.clock.loop else ""}.')
@@ -0,0 +1,92 @@
+import numpy as np
+
+
+class StreamRingBuffer:
+    """ Single-producer/multi-consumer ring buffer of timestamps and samples for one stream, backed by NumPy arrays.
+
+    The storage is "double-mapped": every sample is written both at `i % capacity` and at `i % capacity + capacity`, so any
+    window of up to `capacity` consecutive samples is available as one contiguous slice, and readers get views instead of
+    copies. Positions are absolute sample indices: `head` is the number of samples ever written, and samples
+    `[oldest_index, head)` are readable.
+
+    There are no locks. The producer fills the slots first and only then publishes the new `head` (a single attribute
+    assignment), so a reader never sees unwritten data. The producer may overwrite the oldest `guard` samples while a reader is
+    looking at them, so reads are clamped to `head - capacity + guard`. A reader that holds a view across later writes can check
+    `is_valid(start)` before trusting it.
+    """
+
+    def __init__(self, capacity: int, n_channels: int, dtype=np.float32, guard: int = None):
+        self.capacity = int(capacity)
+        self.n_channels = int(n_channels)
+        self.guard = int(guard) if guard is not None else max(self.capacity // 8, 1) ## slots reserved for in-progress writes
+        self._ts = np.zeros((2 * self.capacity,), dtype=np.float64)
+        self._data = np.zeros((2 * self.capacity, self.n_channels), dtype=dtype)
+        self.head = 0
+
+
+    @property
+    def dtype(self):
+        return self._data.dtype
+
+
+    @property
+    def oldest_index(self) -> int:
+        """ absolute index of the oldest sample that is safe to read """
+        return max(self.head - self.capacity + self.guard, 0)
+
+
+    def is_valid(self, start: int) -> bool:
+        """ whether samples from absolute index `start` on have not been (and are not about to be) overwritten """
+        return start >= self.oldest_index
+
+
+    def _store(self, pos: int, ts, data):
+        n = len(ts)
+        self._ts[pos:pos + n] = ts
+        self._ts[pos + self.capacity:pos + self.capacity + n] = ts
+        self._data[pos:pos + n] = data
+        self._data[pos + self.capacity:pos + self.capacity + n] = data
+
+
+    def write(self, ts, data) -> int:
+        """ appends a chunk (producer only) and returns the new head. Chunks longer than the usable capacity keep their newest samples. """
+        ts = np.asarray(ts, dtype=np.float64)
+        data = np.asarray(data)
+        n = len(ts)
+        if n == 0:
+            return self.head
+        max_n = self.capacity - self.guard
+        head = self.head
+        if n > max_n:
+            head += n - max_n ## skip over the samples that would be overwritten within this write
+            ts, data, n = ts[-max_n:], data[-max_n:], max_n
+        pos = head % self.capacity
+        first = min(n, self.capacity - pos)
+        self._store(pos, ts[:first], data[:first])
+        if first < n:
+            self._store(0, ts[first:], data[first:])
+        self.head = head + n ## publish only after the samples are in place
+        return self.head
+
+
+    def read(self, start: int, stop: int = None):
+        """ returns contiguous (ts, data) views of the samples in [start, stop), clamped to what is still readable, plus the
+        actual start index used. `stop` defaults to the current head.
+        """
+        stop = self.head if stop is None else min(int(stop), self.head)
+        start = max(int(start), self.oldest_index)
+        if stop <= start:
+            return self._ts[:0], self._data[:0], stop
+        pos = start % self.capacity
+        n = stop - start
+        return self._ts[pos:pos + n], self._data[pos:pos + n], start
+
+
+    def read_latest(self, n_samples: int):
+        """ returns views of the newest `n_samples` samples (or fewer, if not that many are readable) """
+        ts, data, _ = self.read(self.head - int(n_samples))
+        return ts, data
+
+
+    def clear(self):
+        self.head = 0
@@ -0,0 +1,127 @@
+import time
+import numpy as np
+
+SCALING_EXACT = 'exact' ## percentiles of the visible window, evenly strided down to at most `max_window_rows` rows (most accurate)
+SCALING_RESERVOIR = 'reservoir' ## percentiles of an evenly strided subsample of at most `reservoir_size` rows of the window
+SCALING_STREAMING = 'streaming' ## stochastic-approximation quantile estimates, updated with every chunk in O(chunk)
+SCALING_METHODS = (SCALING_EXACT, SCALING_RESERVOIR, SCALING_STREAMING)
+
+
+class StreamingQuantiles:
+    """ Per-channel running estimates of a few quantiles, updated chunk by chunk without keeping any history.
+
+    Each estimate moves by `learning_rate * spread * (p - fraction of the chunk at or below it)`, where `spread` is the
+    current inter-quartile estimate, so it tracks drifting signals at a rate independent of their amplitude and forgets
+    old data over roughly 1 / learning_rate chunks.
+    """
+
+    def __init__(self, n_channels: int, probs=(0.25, 0.5, 0.75), learning_rate: float = 0.05):
+        self.probs = np.asarray(probs, dtype=np.float64)
+        self.n_channels = int(n_channels)
+        self.learning_rate = learning_rate
+        self.estimates = None ## (len(probs), n_channels), initialized from the first chunk
+
+
+    def update(self, data):
+        data = np.asarray(data, dtype=np.float64)
+        if len(data) == 0:
+            return
+        if self.estimates is None:
+            self.estimates = np.percentile(data, self.probs * 100.0, axis=0)
+            return
+        spread = np.maximum(self.estimates[-1] - self.estimates[0], 1e-12)
+        for i, p in enumerate(self.probs):
+            below = (data <= self.estimates[i]).mean(axis=0)
+            self.estimates[i] += self.learning_rate * spread * (p - below)
+        self.estimates.sort(axis=0) ## keep the quantiles ordered
+
+
+    def reset(self):
+        self.estimates = None
+
+
+
+class RobustScaler:
+    """ Per-channel centre/scale for the stacked display (median/IQR, or mid-range/range in fit-to-band mode).
+
+    `observe()` is called with every new chunk and is O(chunk); the (more expensive) recomputation from the visible
+    window happens in `maybe_rescale()` at most every `rescale_interval` seconds, independent of the chunk rate, and reads
+    at most `max_window_rows` rows of it whatever the window's length.
+    A newly computed centre or scale only replaces the displayed one when it differs by more than `hysteresis`
+    (relative to the current scale), so the traces don't jitter from one rescale to the next.
+    """
+
+    def __init__(self, n_channels: int, method: str = SCALING_RESERVOIR, rescale_interval: float = 0.5, hysteresis: float = 0.1,
+                 reservoir_size: int = 512, learning_rate: float = 0.05, max_window_rows: int = 65536):
+        if method not in SCALING_METHODS:
+            raise ValueError(f'Unknown scaling method {method!r}; expected one of {SCALING_METHODS}')
+        self.n_channels = int(n_channels)
+        self.method = method
+        self.rescale_interval = rescale_interval
+        self.hysteresis = hysteresis
+        self.reservoir_size = reservoir_size
+        self.max_window_rows = max_window_rows
+        self.center = np.zeros((self.n_channels,))
+        self.scale = np.ones((self.n_channels,))
+        self._streaming = StreamingQuantiles(self.n_channels, learning_rate=learning_rate) if method == SCALING_STREAMING else None
+        self._last_rescale_t = None
+        self._last_fit_to_band = None
+
+
+    def observe(self, new_data):
+        """ feeds a new chunk to the streaming estimator (no-op for the window-based methods) """
+        if self._streaming is not None:
+            self._streaming.update(new_data)
+
+
+    def invalidate(self):
+        """ forces the next maybe_rescale() to recompute and apply the statistics without hysteresis """
+        self._last_rescale_t = None
+
+
+    def _window_sample(self, window_data):
+        max_rows = self.max_window_rows if self.method == SCALING_EXACT else min(self.reservoir_size, self.max_window_rows)
+        if len(window_data) <= max_rows:
+            return window_data
+        stride = -(-len(window_data) // max_rows)
+        return window_data[::stride]
+
+
+    def _compute(self, window_data, fit_to_band: bool):
+        if fit_to_band:
+            # Fit entire visible min..max into the band's height
+            sample = self._window_sample(window_data)
+            ymin, ymax = sample.min(axis=0), sample.max(axis=0)
+            return (ymin + ymax) / 2.0, (ymax - ymin).astype(np.float64)
+        if (self._streaming is not None) and (self._streaming.estimates is not None):
+            q25, median, q75 = self._streaming.estimates
+            return median.copy(), (q75 - q25)
+        sample = self._window_sample(window_data)
+        if len(sample) <= 3:
+            return np.median(sample, axis=0), (sample.max(axis=0) - sample.min(axis=0)).astype(np.float64)
+        q25, median, q75 = np.percentile(sample, [25, 50, 75], axis=0)
+        return median, (q75 - q25)
+
+
+    def maybe_rescale(self, window_data, fit_to_band: bool = False, now: float = None) -> bool:
+        """ recomputes centre/scale from the visible window if a rescale is due; returns whether the displayed values changed """
+        if len(window_data) == 0:
+            return False
+        now = time.monotonic() if now is None else now
+        forced = (self._last_rescale_t is None) or (fit_to_band != self._last_fit_to_band)
+        if (not forced) and ((now - self._last_rescale_t) < self.rescale_interval):
+            return False
+        self._last_rescale_t = now
+        self._last_fit_to_band = fit_to_band
+        center, scale = self._compute(window_data, fit_to_band)
+        scale = np.where(scale != 0, scale, 1.0)
+        if forced:
+            self.center, self.scale = np.asarray(center, dtype=np.float64), np.asarray(scale, dtype=np.float64)
+            return True
+        scale_changed = np.abs(scale / self.scale - 1.0) > self.hysteresis
+        center_changed = np.abs(center - self.center) > (self.hysteresis * self.scale)
+        if not (scale_changed.any() or center_changed.any()):
+            return False
+        self.scale = np.where(scale_changed, scale, self.scale)
+        self.center = np.where(center_changed, center, self.center)
+        return True
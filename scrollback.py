@@ -0,0 +1,132 @@
+import bisect
+import logging
+import os
+import numpy as np
+from renderprep import envelope_parts
+
+logger = logging.getLogger("phohale.sigvisualizer.Scrollback")
+
+
+class ScrollbackStore:
+    """ Append-only, memory-mapped history of one stream, for scrolling back far beyond what the plot history keeps in RAM.
+
+    Samples go into fixed-size segment files (`<path_prefix>.<n>.ts` / `.dat`) that are mapped with `np.memmap`, so the data
+    lives in the OS page cache and on disk rather than in the process heap. The time index is the first timestamp of each
+    segment (kept in a list) plus a binary search over the segment's mapped timestamps, so `read_range()` costs
+    O(log n + visible samples) however long the session runs. Beyond `max_bytes` the oldest segments are deleted.
+    """
+
+    def __init__(self, path_prefix: str, n_channels: int, dtype=np.float32, segment_samples: int = 2 ** 20, max_bytes: int = 2 ** 31):
+        self.path_prefix = path_prefix
+        self.n_channels = int(n_channels)
+        self.dtype = np.dtype(dtype)
+        self.segment_samples = int(segment_samples)
+        segment_bytes = self.segment_samples * (8 + self.n_channels * self.dtype.itemsize)
+        self.max_segments = max(int(max_bytes // segment_bytes), 2)
+        self._segments = [] ## [(segment number, ts memmap, data memmap)]
+        self._first_ts = [] ## first timestamp of each segment, the coarse time index
+        self._fill = 0 ## samples written into the newest segment
+        self._next_segment = 0
+
+
+    def _segment_paths(self, number: int):
+        return f'{self.path_prefix}.{number}.ts', f'{self.path_prefix}.{number}.dat'
+
+
+    def _new_segment(self):
+        number = self._next_segment
+        self._next_segment += 1
+        ts_path, data_path = self._segment_paths(number)
+        seg_ts = np.memmap(ts_path, dtype=np.float64, mode='w+', shape=(self.segment_samples,))
+        seg_data = np.memmap(data_path, dtype=self.dtype, mode='w+', shape=(self.segment_samples, self.n_channels))
+        self._segments.append((number, seg_ts, seg_data))
+        self._fill = 0
+        while len(self._segments) > self.max_segments:
+            self._drop_segment(0)
+
+
+    def _drop_segment(self, i: int):
+        number, seg_ts, seg_data = self._segments.pop(i)
+        if i < len(self._first_ts):
+            self._first_ts.pop(i)
+        del seg_ts, seg_data
+        for path in self._segment_paths(number):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f'ScrollbackStore could not remove {path!r}: {e}')
+
+
+    def append(self, ts, data):
+        """ appends a chunk; timestamps are expected to be non-decreasing """
+        ts = np.asarray(ts, dtype=np.float64)
+        data = np.asarray(data)
+        pos, n = 0, len(ts)
+        while pos < n:
+            if (not self._segments) or (self._fill >= self.segment_samples):
+                self._new_segment()
+            _, seg_ts, seg_data = self._segments[-1]
+            k = min(n - pos, self.segment_samples - self._fill)
+            seg_ts[self._fill:self._fill + k] = ts[pos:pos + k]
+            seg_data[self._fill:self._fill + k] = data[pos:pos + k]
+            if self._fill == 0:
+                self._first_ts.append(float(ts[pos]))
+            self._fill += k
+            pos += k
+
+
+    def _segment_ts(self, i: int):
+        n_valid = self._fill if i == len(self._segments) - 1 else self.segment_samples
+        return self._segments[i][1][:n_valid]
+
+
+    def time_span(self):
+        """ (first, last) timestamp held, or None if empty """
+        if not self._first_ts:
+            return None
+        return self._first_ts[0], float(self._segment_ts(len(self._segments) - 1)[-1])
+
+
+    def read_range(self, t_start: float, t_stop: float, max_samples: int = None):
+        """ returns copies (ts, data) of the samples with t_start <= ts <= t_stop. If there are more than `max_samples`, their
+        min/max envelope (renderprep.envelope_parts) is returned instead, so zooming out over hours stays within
+        `max_samples` rows without aliasing away short peaks """
+        spans = [] ## (segment index, first, stop)
+        i0 = max(bisect.bisect_right(self._first_ts, t_start) - 1, 0)
+        i1 = bisect.bisect_right(self._first_ts, t_stop)
+        for i in range(i0, min(i1, len(self._first_ts))):
+            seg_ts = self._segment_ts(i)
+            a = int(np.searchsorted(seg_ts, t_start, side='left'))
+            b = int(np.searchsorted(seg_ts, t_stop, side='right'))
+            if b > a:
+                spans.append((i, a, b))
+        total = sum(b - a for _, a, b in spans)
+        parts = ((self._segments[i][1][a:b], self._segments[i][2][a:b]) for i, a, b in spans)
+        return envelope_parts(parts, total, t_start, t_stop, max_samples, self.n_channels, self.dtype)
+
+
+    def close(self):
+        """ unmaps and deletes all segment files """
+        while self._segments:
+            self._drop_segment(0)
+        self._fill = 0
+
+
+
+class ScrollbackView:
+    """ a range loaded from a ScrollbackStore, readable by renderprep.prepare_render() in place of a StreamRingBuffer """
+
+    def __init__(self, ts, data):
+        self.ts = ts
+        self.data = data
+        self.head = len(ts)
+
+
+    def read(self, start: int, stop: int = None):
+        stop = self.head if stop is None else min(int(stop), self.head)
+        start = max(int(start), 0)
+        return self.ts[start:stop], self.data[start:stop], start
+
+
+    def is_valid(self, start: int) -> bool:
+        return True
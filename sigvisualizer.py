@@ -2,12 +2,11 @@ import sys
 import logging
 from PyQt5.QtCore import QSize, Qt, pyqtSignal
 from PyQt5.QtGui import QIcon
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QStatusBar, QTableWidgetItem, QTreeWidgetItem, QLabel)
-from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QMenu, QStatusBar, QTableWidgetItem, QTreeWidgetItem, QLabel, QFileDialog)
 
 from ui_sigvisualizer import Ui_MainWindow
 
-from PyQt5.QtCore import QTimer, QThreadPool, QRunnable, pyqtSlot
+from PyQt5.QtCore import QThreadPool, QRunnable, pyqtSlot
 # ...existing code...
 
 
@@ -73,24 +72,28 @@ class SigVisualizer(QMainWindow):
 		self.ui.toggleButton.clicked.connect(self.toggle_panel)
 		# self.ui.updateButton.clicked.connect(self.ui.widget.dataTr.update_streams)
 		self.ui.updateButton.clicked.connect(self.manual_refresh_streams)
-		self.ui.widget.dataTr.updateStreamNames.connect(self.update_metadata_widget)
-		self.ui.widget.dataTr.updateStreamNames.connect(self.ui.widget.on_streams_updated)
+		self.ui.widget.dataTr.streamAdded.connect(self.on_stream_added)
+		self.ui.widget.dataTr.streamRemoved.connect(self.on_stream_removed)
 		self.panelHidden = False
 
 		self.ui.treeWidget.itemExpanded.connect(self.tree_item_expanded)
+		self.ui.treeWidget.itemCollapsed.connect(self.tree_item_collapsed)
+		self.ui.treeWidget.setContextMenuPolicy(Qt.CustomContextMenu)
+		self.ui.treeWidget.customContextMenuRequested.connect(self.show_tree_context_menu)
 		self.ui.treeWidget.itemChanged.connect(self.tree_item_changed)
 		self.stream_expanded.connect(self.ui.widget.dataTr.handle_stream_expanded)
 
 		self.ui.btnShowDataStream.clicked.connect(self.toggle_data_stream_window)
 		self.dataStreamHidden = False
 
-		self.auto_refresh_timer = QTimer(self)
-		self.auto_refresh_timer.timeout.connect(self.ui.widget.dataTr.update_streams)
-
+		## Discovery runs continuously in the background while auto-update is checked (see DataThread.set_auto_discovery)
 		self.ui.chkEnableAutoUpdate.clicked.connect(self.toggle_auto_refresh_streams)
 		self.toggle_auto_refresh_streams()
 
 		self.ui.btnUpdateActivePlots.clicked.connect(self.perform_update_all_plots)
+		self.ui.btnPause.toggled.connect(self.toggle_pause)
+		self.ui.btnRecord.clicked.connect(self.toggle_recording)
+		self.ui.btnOpenRecording.clicked.connect(self.toggle_recording_view)
 
 		## Handle right-sidebar with continuous stream table in it
 		self.right_sidebar_table_cols_map = {i:v for i, v in enumerate(["Timestamp", "Stream", "Description"])} # QTableWidgetItem("Some text")
@@ -220,8 +223,6 @@ class SigVisualizer(QMainWindow):
 
 	def manual_refresh_streams(self):
 		self.run_update_streams()
-		if self.ui.chkEnableAutoUpdate.isChecked():
-			self.auto_refresh_timer.start(2000) ## reset timer
 
 	def run_update_streams(self):
 		logger.info(f'SigVisualizer run_update_streams() started.')
@@ -232,12 +233,7 @@ class SigVisualizer(QMainWindow):
 		logger.info(f'SigVisualizer toggle_auto_refresh_streams() started.')
 		## toggle a timer to auto-refresh if should_auto_update
 		should_auto_update: bool = self.ui.chkEnableAutoUpdate.isChecked()
-		if should_auto_update:
-			self.auto_refresh_timer.timeout.disconnect()
-			self.auto_refresh_timer.timeout.connect(self.run_update_streams)
-			self.auto_refresh_timer.start(2000)  # refresh every 2 seconds
-		else:
-			self.auto_refresh_timer.stop()
+		self.ui.widget.dataTr.set_auto_discovery(should_auto_update)
 			
 
 	def tree_item_expanded(self, widget_item):
@@ -250,54 +246,78 @@ class SigVisualizer(QMainWindow):
 				if item.text(0) != name:
 					item.setExpanded(False)
 
+		self.ui.widget.set_stream_tree_visible(name, True)
 		self.stream_expanded.emit(name)
 
 
-	def update_metadata_widget(self, metadata, default_idx):
-		""" called when the streams are changed (new streams/etc)
-		1. Need to update the tree widget with the new streams and channels 
-		2. Update the plotted graphs (building new ones/removing old ones if needed) so they can be displayed when updated date is received.
+	def tree_item_collapsed(self, widget_item):
+		""" a collapsed stream node means its plot isn't being watched: the plot widget stops redrawing it (see is_stream_visible) """
+		if widget_item.parent() is None:
+			self.ui.widget.set_stream_tree_visible(widget_item.text(0), False)
+
 
-		TODO 2025-10-09 - moving away from single stream selection (specified by default_idx) to being able to preview multiple streams simultaneously.
+	def _find_stream_tree_item(self, name: str):
+		for it_ix in range(self.ui.treeWidget.topLevelItemCount()):
+			item = self.ui.treeWidget.topLevelItem(it_ix)
+			if item.text(0) == name:
+				return item
+		return None
 
+
+	def on_stream_added(self, s_meta):
+		""" called when a new stream was discovered: adds its node (with one checkable item per channel) to the tree widget.
+		The plot for the stream is built by the plot widget itself; nodes of other streams are left untouched.
 		"""
-		logger.info(f'SigVisualizer update_metadata_widget() started.')
-		for s_ix, s_meta in enumerate(metadata):
-			item = QTreeWidgetItem(self.ui.treeWidget)
-			item.setText(0, s_meta["name"])
-
-			# Defensive: labels list can be shorter than ch_count
-			labels = s_meta.get("ch_labels") or []
-			for m in range(s_meta["ch_count"]):
-				channel_item = QTreeWidgetItem(item)
-				channel_name: str = labels[m] if m < len(labels) else ""
-				if not channel_name:
-					channel_name = f'Ch[{m}]'
-
-				channel_item.setText(0, channel_name)
-				channel_item.setToolTip(0, f'Channel[{m+1}]')
-				channel_item.setCheckState(0, Qt.Checked)
-
-			# item.setExpanded(True if s_ix == default_idx else False)
-			self.ui.treeWidget.addTopLevelItem(item)
-
-		# Expand all items recursively by default, without emitting selection changes
+		logger.info(f'SigVisualizer on_stream_added() started.')
+		if (self.ui.widget.recording is not None) and (not s_meta.get('recording')):
+			return # live streams get their nodes back when the recording is closed
+		existing_item = self._find_stream_tree_item(s_meta["name"])
+		if existing_item is not None:
+			self.ui.treeWidget.takeTopLevelItem(self.ui.treeWidget.indexOfTopLevelItem(existing_item))
+
+		# Build the node without emitting itemChanged/itemExpanded for the initial check states and expansion
 		self.ui.treeWidget.blockSignals(True)
-		self.ui.treeWidget.expandAll()
+		item = QTreeWidgetItem(self.ui.treeWidget)
+		item.setText(0, s_meta["name"])
+
+		# Defensive: labels list can be shorter than ch_count
+		labels = s_meta.get("ch_labels") or []
+		for m in range(s_meta["ch_count"]):
+			channel_item = QTreeWidgetItem(item)
+			channel_name: str = labels[m] if m < len(labels) else ""
+			if not channel_name:
+				channel_name = f'Ch[{m}]'
+
+			channel_item.setText(0, channel_name)
+			channel_item.setToolTip(0, f'Channel[{m+1}]')
+			channel_item.setCheckState(0, Qt.Checked)
+
+		self.ui.treeWidget.addTopLevelItem(item)
+		item.setExpanded(True)
 		self.ui.treeWidget.blockSignals(False)
 		self.ui.treeWidget.setAnimated(True)
-		if (default_idx is not None) and (default_idx in metadata):		
-			self.statusBar.showMessage("Sampling rate: {}Hz".format(metadata[default_idx]["srate"]))
-		else:
-			self.statusBar.showMessage("No valid sampling streams.")
+		self.statusBar.showMessage("Stream added: {} ({}Hz)".format(s_meta["name"], s_meta["srate"]))
+
+
+	def on_stream_removed(self, name: str):
+		""" called when a stream vanished from the network: removes only its node from the tree widget """
+		logger.info(f'SigVisualizer on_stream_removed() started.')
+		if self.ui.widget.recording is not None:
+			return
+		item = self._find_stream_tree_item(name)
+		if item is not None:
+			self.ui.treeWidget.takeTopLevelItem(self.ui.treeWidget.indexOfTopLevelItem(item))
+		self.statusBar.showMessage("Stream removed: {}".format(name))
 			
 
 
 	def perform_update_all_plots(self):
 		logger.info(f'SigVisualizer perform_update_all_plots() started.')
 		plot_widget = self.ui.widget
+		if plot_widget.recording is not None:
+			return # the live plots are set aside while a recording is shown (the button is disabled meanwhile)
 		plot_widget.reset()
-		plot_widget.dataTr.update_streams()
+		plot_widget.dataTr.rebroadcast_streams() ## rebuild plots (and tree nodes) for the streams that are already open
 		# plot_widget.get_data(sig_ts=self.ui.widget.dataTr.sig_ts, sig_buffer=self.ui.widget.dataTr.sig_buffer, marker_ts=self.ui.widget.dataTr.marker_ts, marker_buffer=self.ui.widget.dataTr.marker_buffer)
 		logger.info(f'SigVisualizer perform_update_all_plots() finished.')
 		# plot_widget.get_data()
@@ -316,6 +336,34 @@ class SigVisualizer(QMainWindow):
 		except Exception as e:
 			logger.exception("tree_item_changed failed: %s", e)
 
+	def show_tree_context_menu(self, pos):
+		""" right-click on a stream node: check/uncheck all of its channels at once """
+		item = self.ui.treeWidget.itemAt(pos)
+		if item is None:
+			return
+		stream_item = item.parent() or item
+		menu = QMenu(self.ui.treeWidget)
+		check_all_action = menu.addAction('Check All Channels')
+		uncheck_all_action = menu.addAction('Uncheck All Channels')
+		chosen_action = menu.exec_(self.ui.treeWidget.viewport().mapToGlobal(pos))
+		if chosen_action is check_all_action:
+			self.set_all_channels_checked(stream_item, True)
+		elif chosen_action is uncheck_all_action:
+			self.set_all_channels_checked(stream_item, False)
+
+
+	def set_all_channels_checked(self, stream_item, checked: bool):
+		""" sets every channel checkbox of a stream node without one itemChanged per channel, then toggles the plot's channels in one call """
+		self.ui.treeWidget.blockSignals(True)
+		try:
+			for ch_ix in range(stream_item.childCount()):
+				stream_item.child(ch_ix).setCheckState(0, Qt.Checked if checked else Qt.Unchecked)
+		finally:
+			self.ui.treeWidget.blockSignals(False)
+		self.ui.treeWidget.viewport().update()
+		self.ui.widget.set_channels_enabled(stream_item.text(0), None, checked)
+
+
 	def toggle_panel(self):
 		logger.info(f'SigVisualizer toggle_panel() started.')
 		if self.panelHidden:
@@ -332,6 +380,78 @@ class SigVisualizer(QMainWindow):
 			self.ui.toggleButton.setIconSize(QSize(30, 30))
 
 
+	def toggle_pause(self, checked: bool):
+		""" freezes/resumes the plots; while paused the time axis can be panned/zoomed over each stream's scrollback """
+		logger.info(f'SigVisualizer toggle_pause({checked}) started.')
+		self.ui.btnPause.setText('Resume' if checked else 'Pause')
+		self.ui.widget.set_paused(checked)
+
+
+	def toggle_recording(self, checked: bool):
+		""" asks for a file and records every stream to it (XDF, or HDF5 for .h5), or stops the running recording """
+		logger.info(f'SigVisualizer toggle_recording({checked}) started.')
+		data_thread = self.ui.widget.dataTr
+		if not checked:
+			data_thread.stop_recording()
+			self.ui.btnRecord.setText('Record...')
+			self.statusBar.showMessage('Recording stopped.')
+			return
+		path, _ = QFileDialog.getSaveFileName(self, 'Record streams to', 'recording.xdf', 'XDF (*.xdf);;HDF5 (*.h5 *.hdf5)')
+		if not path:
+			self.ui.btnRecord.setChecked(False)
+			return
+		try:
+			data_thread.start_recording(path)
+		except Exception as e:
+			logger.error(f'SigVisualizer could not start recording to {path!r}: {e}')
+			self.statusBar.showMessage(f'Could not record to {path}: {e}')
+			self.ui.btnRecord.setChecked(False)
+			return
+		self.ui.btnRecord.setText('Stop Recording')
+		self.statusBar.showMessage(f'Recording to {path}')
+
+
+	def toggle_recording_view(self, checked: bool):
+		""" asks for an XDF/HDF5 file and shows it instead of the live streams (browsable by panning/zooming the time axis), or returns to the live streams """
+		logger.info(f'SigVisualizer toggle_recording_view({checked}) started.')
+		plot_widget = self.ui.widget
+		if not checked:
+			self.ui.treeWidget.clear()
+			self.ui.tblViewMessages.setRowCount(0)
+			plot_widget.close_recording() ## rebroadcasts the live streams, which rebuilds their tree nodes
+			self.ui.btnOpenRecording.setText('Open Recording...')
+			self.ui.btnPause.setChecked(False) ## close_recording() resumed the live plots
+			self.ui.btnPause.setEnabled(True)
+			self.ui.btnUpdateActivePlots.setEnabled(True)
+			self.statusBar.showMessage('Showing live streams.')
+			return
+		path, _ = QFileDialog.getOpenFileName(self, 'Open recording', '', 'Recordings (*.xdf *.h5 *.hdf5);;All files (*)')
+		if not path:
+			self.ui.btnOpenRecording.setChecked(False)
+			return
+		self.ui.btnPause.setChecked(False) ## resumes the live plots before they are set aside, so they come back live
+		QApplication.setOverrideCursor(Qt.WaitCursor) ## the first open of a file builds its index
+		try:
+			all_metadata = plot_widget.open_recording(path)
+		except Exception as e:
+			logger.error(f'SigVisualizer could not open recording {path!r}: {e}')
+			self.statusBar.showMessage(f'Could not open {path}: {e}')
+			self.ui.btnOpenRecording.setChecked(False)
+			return
+		finally:
+			QApplication.restoreOverrideCursor()
+		self.ui.treeWidget.clear()
+		for s_meta in all_metadata:
+			self.on_stream_added(s_meta)
+		self.ui.tblViewMessages.setRowCount(0)
+		self.on_marker_data_update(*plot_widget.recording_marker_store.query(-float('inf'), float('inf')))
+		self.ui.btnOpenRecording.setText('Close Recording')
+		self.ui.btnPause.setEnabled(False) ## a recording is always browsed
+		self.ui.btnUpdateActivePlots.setEnabled(False) ## would rebuild the live plots over the recording's
+		recording = plot_widget.recording
+		self.statusBar.showMessage(f'Viewing {path} ({len(all_metadata)} streams, {recording.t_stop - recording.t_start:.1f} s)')
+
+
 	def toggle_data_stream_window(self):
 		logger.info(f'SigVisualizer toggle_data_stream_window() started.')
 		# Show/Hide the raw data stream
@@ -343,9 +463,13 @@ class SigVisualizer(QMainWindow):
 	def closeEvent(self, event):
 		"""Ensure background data thread exits cleanly on window close."""
 		try:
-			if hasattr(self.ui.widget, 'dataTr') and self.ui.widget.dataTr.isRunning():
+			if hasattr(self.ui.widget, 'dataTr'):
 				self.ui.widget.dataTr.stop()
 				self.ui.widget.dataTr.wait(1000)
+			if hasattr(self.ui.widget, 'stop_render_worker'):
+				self.ui.widget.stop_render_worker()
+			if hasattr(self.ui.widget, 'close_scrollback'):
+				self.ui.widget.close_scrollback()
 		except Exception:
 			pass
 		return super().closeEvent(event)
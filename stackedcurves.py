@@ -0,0 +1,104 @@
+import numpy as np
+import pyqtgraph as pg
+from pyqtgraph.Qt import QtCore, QtGui
+
+COLORS_GUTTER = 'gutter' ## one path stroked with one pen; each channel's colour is a swatch in a gutter at the left edge
+COLORS_TRACES = 'traces' ## each channel's trace drawn in its own pen (one path per distinct pen)
+COLOR_MODES = (COLORS_GUTTER, COLORS_TRACES)
+
+
+class StackedCurvesItem(pg.GraphicsObject):
+    """ Draws all channels of a stream as a single graphics item.
+
+    `setData(x, y, pens, y_offsets, spacing)` takes the shared x array (n_samples,) and the already normalized and offset
+    channel traces (n_samples, n_channels). The channels are concatenated into one QPainterPath (with a `connect` array that
+    breaks the line between channels), so the scene holds one item per stream no matter how many channels it has, and the
+    bounding rect comes from two array reductions instead of per-item bookkeeping.
+
+    With `color_mode` COLORS_GUTTER (the default) that single path is stroked once with `trace_pen`, and the channels' pens
+    only colour a `gutter_px` wide swatch per channel band (at `y_offsets`, `spacing` apart), which costs a rect fill per
+    channel instead of a path. COLORS_TRACES keeps each channel's own colour on its trace, at the cost of one path per pen.
+    """
+
+    def __init__(self, antialias: bool = False, color_mode: str = COLORS_GUTTER, trace_pen=None, gutter_px: int = 6):
+        super().__init__()
+        if color_mode not in COLOR_MODES:
+            raise ValueError(f'Unknown color mode {color_mode!r}; expected one of {COLOR_MODES}')
+        self.antialias = antialias
+        self.color_mode = color_mode
+        self.trace_pen = trace_pen if trace_pen is not None else pg.mkPen(color=(50, 50, 50), width=1)
+        self.gutter_px = gutter_px
+        self._paths = [] ## [(QPen, QPainterPath)]: a single entry in COLORS_GUTTER mode, one per distinct pen otherwise
+        self._gutter = [] ## [(QColor, y_low, y_high)] per channel band (COLORS_GUTTER mode)
+        self._x0 = 0.0
+        self._bounds = QtCore.QRectF()
+
+
+    @staticmethod
+    def _pen_key(pen: QtGui.QPen):
+        return (pen.color().rgba(), pen.widthF(), int(pen.style()))
+
+
+    @staticmethod
+    def _channels_path(x, y, channels):
+        """ one QPainterPath through the given channel columns of `y`, broken between channels """
+        n_samples = len(x)
+        if len(channels) == 1:
+            return pg.arrayToQPath(x, y[:, channels[0]], connect='all')
+        connect = np.ones((n_samples * len(channels),), dtype=np.int32)
+        connect[n_samples - 1::n_samples] = 0 ## don't join the end of one channel to the start of the next
+        return pg.arrayToQPath(np.tile(x, len(channels)), y[:, channels].T.ravel(), connect=connect)
+
+
+    def setData(self, x, y, pens, y_offsets=None, spacing: float = None):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y)
+        if y.ndim != 2 or len(x) == 0 or y.shape[1] == 0:
+            self.clear()
+            return
+        n_channels = y.shape[1]
+        channel_pens = [pens[ch] if ch < len(pens) else pens[-1] for ch in range(n_channels)]
+        gutter = []
+        if self.color_mode == COLORS_GUTTER:
+            paths = [(self.trace_pen, self._channels_path(x, y, list(range(n_channels))))]
+            if (y_offsets is not None) and (spacing is not None):
+                half_band = 0.5 * float(spacing) * 0.8
+                gutter = [(pen.color(), float(offset) - half_band, float(offset) + half_band) for pen, offset in zip(channel_pens, y_offsets)]
+        else:
+            groups = {} ## pen key -> (pen, [channel indices])
+            for ch, pen in enumerate(channel_pens):
+                groups.setdefault(self._pen_key(pen), (pen, []))[1].append(ch)
+            paths = [(pen, self._channels_path(x, y, channels)) for pen, channels in groups.values()]
+        self.prepareGeometryChange()
+        self._paths = paths
+        self._gutter = gutter
+        self._x0 = float(x[0])
+        y_min, y_max = float(np.nanmin(y)), float(np.nanmax(y))
+        pad = max((pen.widthF() for pen, _ in paths), default=1.0)
+        self._bounds = QtCore.QRectF(float(x[0]), y_min, float(x[-1] - x[0]), y_max - y_min).adjusted(0, -pad * 0.01, 0, pad * 0.01)
+        self.update()
+
+
+    def clear(self):
+        self.prepareGeometryChange()
+        self._paths = []
+        self._gutter = []
+        self._bounds = QtCore.QRectF()
+        self.update()
+
+
+    def boundingRect(self):
+        return self._bounds
+
+
+    def paint(self, p, *args):
+        if not self._paths:
+            return
+        p.setRenderHint(QtGui.QPainter.RenderHint.Antialiasing, self.antialias)
+        for pen, path in self._paths:
+            p.setPen(pen)
+            p.drawPath(path)
+        if self._gutter:
+            width = self.gutter_px * (self.pixelWidth() or 0.0)
+            for color, y_low, y_high in self._gutter:
+                p.fillRect(QtCore.QRectF(self._x0, y_low, width, y_high - y_low), color)
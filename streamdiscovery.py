@@ -0,0 +1,96 @@
+import logging
+import threading
+import pylsl
+
+logger = logging.getLogger("phohale.sigvisualizer.StreamDiscovery")
+
+
+def stream_key(info) -> str:
+    """ identity used to diff discovered streams.
+    Streams with a source_id keep their key across outlet restarts (matching LSL's own inlet recovery rules); streams without
+    one are only identifiable by their per-outlet uid.
+    """
+    source_id = info.source_id()
+    if source_id:
+        return f'{source_id}|{info.name()}|{info.type()}|{info.hostname()}'
+    return info.uid()
+
+
+class StreamDiscovery(threading.Thread):
+    """ Background stream discovery built on `pylsl.ContinuousResolver`.
+
+    The resolver keeps track of the streams on the network by itself; this thread periodically reads its (non-blocking)
+    results, diffs them by `stream_key()` against the streams it reported last time, and calls
+    `on_removed(list[key])` / `on_added(list[StreamInfo])` with only the differences (removals first, so a restarted
+    outlet without a source_id is dropped before its replacement is added). `on_added` returns the keys it actually
+    registered; streams it failed to open stay unknown and are offered again on the next diff.
+    While `auto_refresh` is off the thread only diffs when `refresh()` is called.
+    """
+
+    def __init__(self, on_added, on_removed, poll_interval: float = 1.0, forget_after: float = 5.0, auto_refresh: bool = True):
+        super().__init__(name='StreamDiscovery', daemon=True)
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.poll_interval = poll_interval ## seconds between diffs while auto-refreshing
+        self.forget_after = forget_after ## seconds a vanished stream is still reported by the resolver
+        self.auto_refresh = auto_refresh
+        self.known_keys = set()
+        self._resolver = None
+        self._refresh_event = threading.Event()
+        self._stop_event = threading.Event()
+
+
+    def refresh(self):
+        """ requests an immediate diff (non-blocking) """
+        self._refresh_event.set()
+
+
+    def set_auto_refresh(self, enabled: bool):
+        self.auto_refresh = bool(enabled)
+        if self.auto_refresh:
+            self.refresh()
+
+
+    def stop(self):
+        self._stop_event.set()
+        self._refresh_event.set()
+
+
+    def forget(self, keys):
+        """ drops reported streams from the known ones (e.g. streams that failed to open later on), so the next diff offers them again """
+        self.known_keys.difference_update(keys)
+        self.refresh()
+
+
+    def poll_once(self):
+        """ diffs the resolver's current results against the known streams and reports the changes """
+        results = self._resolver.results()
+        current = {stream_key(info): info for info in results}
+        removed = [key for key in self.known_keys if key not in current]
+        added = [info for key, info in current.items() if key not in self.known_keys]
+        if removed:
+            logger.info(f'StreamDiscovery: {len(removed)} stream(s) vanished.')
+            self.on_removed(removed)
+        self.known_keys.difference_update(removed)
+        if added:
+            logger.info(f'StreamDiscovery: {len(added)} new stream(s) found.')
+            registered_keys = set(self.on_added(added) or ())
+            self.known_keys.update(key for key in registered_keys if key in current)
+            if len(registered_keys) < len(added):
+                logger.info(f'StreamDiscovery: {len(added) - len(registered_keys)} new stream(s) could not be opened; retrying on the next poll.')
+
+
+    def run(self):
+        logger.info(f'StreamDiscovery run() started.')
+        self._resolver = pylsl.ContinuousResolver(forget_after=self.forget_after)
+        while not self._stop_event.is_set():
+            self._refresh_event.wait(self.poll_interval if self.auto_refresh else None)
+            self._refresh_event.clear()
+            if self._stop_event.is_set():
+                break
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.exception(f'StreamDiscovery poll failed: {e}')
+        self._resolver = None
+        logger.info(f'StreamDiscovery run() finished.')
@@ -0,0 +1,55 @@
+import logging
+import threading
+import xml.etree.ElementTree as ET
+
+logger = logging.getLogger("phohale.sigvisualizer.streammetadata")
+
+
+def parse_channel_labels(info_xml: str, channel_count: int):
+    """ extracts the `desc/channels/channel/label` values from a stream info's full XML in one pass.
+    The result always has `channel_count` entries; channels without a label (or missing entirely) get ''.
+    """
+    labels = []
+    try:
+        root = ET.fromstring(info_xml)
+        channels = root.find('desc/channels')
+        if channels is not None:
+            labels = [(a_channel.findtext('label') or '').strip() for a_channel in channels.findall('channel')]
+    except ET.ParseError as e:
+        logger.warning(f'parse_channel_labels: could not parse stream info XML: {e}')
+    labels = labels[:channel_count]
+    labels.extend([''] * (channel_count - len(labels)))
+    return labels
+
+
+def metadata_cache_key(info) -> tuple:
+    """ (source_id or uid, session_id): survives refreshes, and for streams with a source_id also outlet restarts """
+    return (info.source_id() or info.uid(), info.session_id())
+
+
+class StreamMetadataCache:
+    """ Thread-safe cache of the extended metadata parsed from `inlet.info()`, keyed by `metadata_cache_key()`.
+    A hit lets a re-discovered stream skip the blocking `info()` round-trip entirely.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+
+    def get(self, info):
+        with self._lock:
+            entry = self._entries.get(metadata_cache_key(info))
+        if (entry is not None) and (len(entry['ch_labels']) != info.channel_count()):
+            return None ## stale: the outlet was re-created with a different layout
+        return entry
+
+
+    def put(self, info, entry: dict):
+        with self._lock:
+            self._entries[metadata_cache_key(info)] = entry
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,99 @@
+import time
+import numpy as np
+import pytest
+from compressedhistory import CODEC_ZLIB, CompressedHistoryStore, decode_block, encode_block, history_budget
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64, np.int16, np.int32])
+def test_encode_decode_round_trip_is_lossless(dtype):
+    rng = np.random.default_rng(0)
+    ts = 1000.0 + np.cumsum(rng.uniform(0.0005, 0.0015, 500))
+    data = (rng.normal(size=(500, 8)) * 100).astype(dtype)
+    data[7, 3] = np.iinfo(dtype).max if np.issubdtype(dtype, np.integer) else np.nan
+    payload = encode_block(ts, data, CODEC_ZLIB)
+    out_ts, out_data = decode_block(payload, len(ts), data.shape[1], dtype, CODEC_ZLIB)
+    np.testing.assert_array_equal(out_ts, ts)
+    np.testing.assert_array_equal(out_data.view(np.uint8), data.view(np.uint8)) ## bit-exact, NaNs included
+
+
+def test_quantized_block_error_is_bounded_by_its_range():
+    rng = np.random.default_rng(0)
+    ts = 1000.0 + np.arange(500) / 1000.0
+    data = (rng.normal(size=(500, 8)) * np.arange(1, 9) * 100).astype(np.float32)
+    data[:, 5] = 3.0 ## constant channel
+    payload = encode_block(ts, data, CODEC_ZLIB, quantize=True)
+    out_ts, out_data = decode_block(payload, len(ts), data.shape[1], np.float32, CODEC_ZLIB)
+    np.testing.assert_array_equal(out_ts, ts)
+    span = data.max(axis=0) - data.min(axis=0)
+    assert (np.abs(out_data - data) <= (span / 65534 + 1e-3)).all()
+    np.testing.assert_array_equal(out_data[:, 5], data[:, 5])
+
+
+def test_quantize_falls_back_to_lossless_for_non_finite_blocks():
+    ts = np.arange(100, dtype=np.float64)
+    data = np.linspace(0.0, 1.0, 200, dtype=np.float32).reshape(100, 2)
+    data[10, 1] = np.inf
+    out_ts, out_data = decode_block(encode_block(ts, data, CODEC_ZLIB, quantize=True), 100, 2, np.float32, CODEC_ZLIB)
+    np.testing.assert_array_equal(out_data, data)
+
+
+def _wait_compressed(store, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while any(block['raw'] is not None for block in store._blocks) and (time.monotonic() < deadline):
+        time.sleep(0.01)
+
+
+def test_read_range_round_trip_across_blocks_and_fill():
+    store = CompressedHistoryStore(2, block_samples=256, codec=CODEC_ZLIB, cache_blocks=2, quantize=False)
+    ts = np.arange(2000, dtype=np.float64)
+    data = np.stack([np.sin(ts / 50.0), ts], axis=1).astype(np.float32)
+    for start in range(0, 2000, 300):
+        store.append(ts[start:start + 300], data[start:start + 300])
+    _wait_compressed(store)
+    assert store.time_span() == (0.0, 1999.0)
+    out_ts, out_data = store.read_range(200.5, 1900.0)
+    np.testing.assert_array_equal(out_ts, ts[201:1901])
+    np.testing.assert_array_equal(out_data, data[201:1901])
+    store.close()
+
+
+def test_read_range_envelope_respects_max_samples():
+    store = CompressedHistoryStore(1, block_samples=256, codec=CODEC_ZLIB)
+    ts = np.arange(5000, dtype=np.float64)
+    data = np.zeros((5000, 1), dtype=np.float32)
+    data[1234, 0], data[4321, 0] = 7.0, -3.0
+    store.append(ts, data)
+    out_ts, out_data = store.read_range(0.0, 4999.0, max_samples=64)
+    assert len(out_ts) <= 64
+    assert out_data.max() == 7.0 and out_data.min() == -3.0
+    store.close()
+
+
+def test_oldest_blocks_dropped_beyond_max_bytes():
+    block_bytes = 256 * (8 + 4)
+    store = CompressedHistoryStore(1, block_samples=256, max_bytes=3 * block_bytes, codec=CODEC_ZLIB)
+    rng = np.random.default_rng(1)
+    store.append(np.arange(256 * 20, dtype=np.float64), rng.normal(size=(256 * 20, 1)).astype(np.float32))
+    _wait_compressed(store)
+    assert store.nbytes <= 3 * block_bytes
+    assert store.time_span()[0] > 0.0
+    store.close()
+
+
+def test_an_hour_of_64_channels_at_1khz_fits_the_default_budget():
+    srate, n_channels, block_samples = 1000.0, 64, 4096
+    store = CompressedHistoryStore(n_channels, block_samples=block_samples, codec=CODEC_ZLIB, srate=srate)
+    assert store.max_bytes == history_budget(3600.0, srate, n_channels)
+    assert store.max_bytes < 0.55 * (3600 * srate * (8 + 4 * n_channels)) ## about half the raw samples
+    rng = np.random.default_rng(0)
+    drift = np.cumsum(rng.normal(size=(block_samples, n_channels)), axis=0) * 0.1
+    blocks = [(drift + rng.normal(size=(block_samples, n_channels)) * 5.0).astype(np.float32) for _ in range(4)] ## cycled
+    n_blocks = int(np.ceil(3600 * srate / block_samples))
+    for i in range(n_blocks):
+        store.append(i * block_samples / srate + np.arange(block_samples) / srate, blocks[i % len(blocks)])
+        if i % 32 == 31:
+            _wait_compressed(store)
+    _wait_compressed(store)
+    assert store.nbytes <= store.max_bytes
+    assert store.time_span() == (0.0, (n_blocks * block_samples - 1) / srate) ## nothing was dropped
+    store.close()
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from downsampling import DECIMATORS, FIRDecimator, make_decimator
+
+
+def _signal(n=1000, n_channels=3, seed=0):
+    rng = np.random.default_rng(seed)
+    ts = np.arange(n) / 500.0
+    data = (np.sin(2 * np.pi * 7 * ts)[:, None] + rng.normal(scale=0.3, size=(n, n_channels))).astype(np.float32)
+    return ts, data
+
+
+def _run_chunked(decimator, ts, data, chunk_sizes):
+    out_ts, out_data, a = [], [], 0
+    for n in chunk_sizes:
+        chunk_ts, chunk_data = decimator.process(ts[a:a + n], data[a:a + n])
+        out_ts.append(chunk_ts)
+        out_data.append(chunk_data)
+        a += n
+    return np.concatenate(out_ts), np.concatenate(out_data)
+
+
+@pytest.mark.parametrize('method', ['mean', 'minmax', 'fir'])
+def test_chunked_equals_one_shot(method):
+    ts, data = _signal()
+    one_ts, one_data = make_decimator(method, 8, data.shape[1]).process(ts, data)
+    chunk_sizes = [1, 7, 13, 64, 3, 200, 5, 707]
+    assert sum(chunk_sizes) == len(ts)
+    chunked_ts, chunked_data = _run_chunked(make_decimator(method, 8, data.shape[1]), ts, data, chunk_sizes)
+    np.testing.assert_allclose(chunked_ts, one_ts)
+    np.testing.assert_allclose(chunked_data, one_data, rtol=1e-5, atol=1e-6)
+
+
+def test_block_mean_values():
+    ts = np.arange(8, dtype=np.float64)
+    data = np.arange(16, dtype=np.float32).reshape(8, 2)
+    out_ts, out_data = make_decimator('mean', 4, 2).process(ts, data)
+    np.testing.assert_allclose(out_ts, [1.5, 5.5])
+    np.testing.assert_allclose(out_data, [[3.0, 4.0], [11.0, 12.0]])
+
+
+def test_minmax_keeps_extrema_in_order():
+    ts = np.arange(4, dtype=np.float64)
+    data = np.array([[0.0], [5.0], [-3.0], [1.0]], dtype=np.float32)
+    out_ts, out_data = make_decimator('minmax', 4, 1).process(ts, data)
+    np.testing.assert_allclose(out_data[:, 0], [5.0, -3.0])
+    assert len(out_ts) == 2
+
+
+def test_lttb_keeps_real_samples():
+    ts, data = _signal()
+    out_ts, out_data = _run_chunked(make_decimator('lttb', 10, data.shape[1]), ts, data, [100] * 10)
+    idx = np.searchsorted(ts, out_ts)
+    np.testing.assert_array_equal(ts[idx], out_ts)
+    np.testing.assert_array_equal(data[idx], out_data)
+    assert len(out_ts) == len(ts) // 10 - 1 ## the last bucket waits for the next chunk
+
+
+def test_fir_has_unity_dc_gain():
+    taps = FIRDecimator.design_lowpass(5)
+    assert len(taps) % 2 == 1
+    assert taps.sum() == pytest.approx(1.0)
+
+
+def test_unknown_method_raises():
+    with pytest.raises(ValueError):
+        make_decimator('nope', 2, 1)
+    assert set(DECIMATORS) == {'mean', 'minmax', 'lttb', 'fir'}
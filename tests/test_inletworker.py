@@ -0,0 +1,39 @@
+import numpy as np
+from inletworker import pull_numeric_chunk
+
+
+class _FakeInlet:
+    """ serves `data` (with timestamps `ts`) through pylsl.StreamInlet.pull_chunk's `dest_obj` interface """
+
+    def __init__(self, ts, data):
+        self.ts = np.asarray(ts, dtype=np.float64)
+        self.data = np.asarray(data)
+        self.cursor = 0
+
+    def pull_chunk(self, timeout=0.0, max_samples=1024, dest_obj=None):
+        a, b = self.cursor, min(self.cursor + max_samples, len(self.ts))
+        self.cursor = b
+        if dest_obj is None:
+            return self.data[a:b].tolist(), self.ts[a:b].tolist()
+        dest_obj[:b - a] = self.data[a:b]
+        return dest_obj, self.ts[a:b].tolist()
+
+
+def test_pull_into_preallocated_buffer_returns_copies():
+    data = np.arange(40, dtype=np.int16).reshape(10, 4)
+    params = {'inlet': _FakeInlet(np.arange(10) * 0.1, data), 'pull_buffer': np.zeros((6, 4), dtype=np.int16)}
+    first_data, first_ts = pull_numeric_chunk(params, timeout=0.0, max_samples=100)
+    assert first_data.dtype == np.int16
+    np.testing.assert_array_equal(first_data, data[:6])
+    np.testing.assert_allclose(first_ts, np.arange(6) * 0.1)
+    second_data, second_ts = pull_numeric_chunk(params, timeout=0.0)
+    np.testing.assert_array_equal(second_data, data[6:])
+    np.testing.assert_array_equal(first_data, data[:6]) ## not overwritten by the second pull into the same buffer
+    empty_data, empty_ts = pull_numeric_chunk(params, timeout=0.0)
+    assert empty_data.shape == (0, 4) and len(empty_ts) == 0
+
+
+def test_pull_without_buffer_falls_back_to_lists():
+    params = {'inlet': _FakeInlet([0.0, 0.1], [[1.0], [2.0]]), 'pull_buffer': None}
+    sig_data, sig_ts = pull_numeric_chunk(params, timeout=0.0)
+    assert sig_data == [[1.0], [2.0]] and sig_ts == [0.0, 0.1]
@@ -0,0 +1,44 @@
+import numpy as np
+from lodpyramid import MinMaxPyramid
+from ringbuffer import StreamRingBuffer
+
+
+def _fill(ring, n, n_channels=2, seed=0, start=0):
+    rng = np.random.default_rng(seed)
+    ts = np.arange(start, start + n, dtype=np.float64)
+    data = rng.normal(size=(n, n_channels)).astype(np.float32)
+    ring.write(ts, data)
+    return ts, data
+
+
+def test_catch_up_matches_one_shot_reduction():
+    ring = StreamRingBuffer(4096, 2)
+    lod = MinMaxPyramid(4096, 2, ratio=4, min_buckets=16)
+    chunks = []
+    for i, n in enumerate([1, 7, 100, 3, 500, 29]):
+        chunks.append(_fill(ring, n, seed=i, start=ring.head))
+        lod.catch_up(ring)
+    assert lod.head == ring.head
+    data = np.concatenate([d for _, d in chunks])
+    n_full = (len(data) // 4) * 4
+    _, lo, hi, bucket_start = lod.read(0, 0, ring.head)
+    assert bucket_start == 0
+    np.testing.assert_array_equal(lo, data[:n_full].reshape(-1, 4, 2).min(axis=1))
+    np.testing.assert_array_equal(hi, data[:n_full].reshape(-1, 4, 2).max(axis=1))
+
+
+def test_catch_up_restarts_after_being_lapped():
+    ring = StreamRingBuffer(1024, 2)
+    lod = MinMaxPyramid(1024, 2, ratio=4, min_buckets=16)
+    _fill(ring, 100)
+    lod.catch_up(ring)
+    _fill(ring, 5000, start=100)
+    lod.catch_up(ring)
+    assert lod.head == ring.head
+    assert lod.first_index >= ring.oldest_index
+    assert lod.first_index % lod.factors[-1] == 0
+    ts, lo, hi, bucket_start = lod.read(0, 0, ring.head)
+    assert len(ts) and (ts[0] >= lod.first_index)
+    raw_ts, raw_data, _ = ring.read(bucket_start * 4, (bucket_start + len(ts)) * 4)
+    np.testing.assert_array_equal(ts, raw_ts[::4])
+    np.testing.assert_array_equal(hi, raw_data.reshape(-1, 4, 2).max(axis=1))
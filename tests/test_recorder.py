@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from recorder import StreamRecorder
+from recordingfile import read_hdf5, read_xdf
+
+OFFSET = 0.25 ## the recording computer's clock runs this far ahead of the sender's
+
+
+def _record(path, clock_offset=(1000.0, OFFSET)):
+    """ records a 2-channel int16 stream in three chunks and a marker stream; returns the (local-clock) timestamps and samples """
+    ts = 1000.0 + np.arange(300) / 100.0
+    data = np.stack([np.arange(300), -np.arange(300)], axis=1).astype(np.int16)
+    recorder = StreamRecorder(path, flush_interval=0.05)
+    recorder.start()
+    recorder.add_stream('eeg', 'eeg', None, 2, dtype=np.int16, srate=100.0, clock_offset=clock_offset)
+    recorder.add_stream('mrk', 'mrk', None, 1, is_marker=True, clock_offset=clock_offset)
+    for start in (0, 100, 200):
+        assert recorder.write_chunk('eeg', ts[start:start + 100], data[start:start + 100])
+    recorder.write_chunk('mrk', ts[[5, 250]], [['start'], ['stop']])
+    recorder.stop(wait=False) ## returns at once; the writer thread finishes the file
+    recorder.join(5.0)
+    assert not recorder.is_alive()
+    return ts, data
+
+
+def _by_name(streams):
+    return {stream.name: stream for stream in streams}
+
+
+def test_xdf_round_trip_with_initial_clock_offset(tmp_path):
+    path = str(tmp_path / 'rec.xdf')
+    ts, data = _record(path)
+    raw = _by_name(read_xdf(path, synchronize_clocks=False))
+    np.testing.assert_allclose(raw['eeg'].ts, ts - OFFSET) ## the very first samples are already in the sender's clock
+    synced = _by_name(read_xdf(path))
+    np.testing.assert_allclose(synced['eeg'].ts, ts)
+    np.testing.assert_array_equal(synced['eeg'].data, data)
+    assert synced['eeg'].srate == 100.0
+    np.testing.assert_allclose(synced['mrk'].ts, ts[[5, 250]])
+    assert synced['mrk'].data == [['start'], ['stop']]
+
+
+def test_xdf_without_clock_offset_keeps_timestamps(tmp_path):
+    path = str(tmp_path / 'rec.xdf')
+    ts, _ = _record(path, clock_offset=None)
+    np.testing.assert_allclose(_by_name(read_xdf(path, synchronize_clocks=False))['eeg'].ts, ts)
+
+
+def test_hdf5_round_trip_batches_appends(tmp_path):
+    pytest.importorskip('h5py')
+    path = str(tmp_path / 'rec.h5')
+    ts, data = _record(path)
+    streams = _by_name(read_hdf5(path))
+    np.testing.assert_array_equal(streams['eeg'].ts, ts)
+    np.testing.assert_array_equal(streams['eeg'].data, data)
+    assert [list(sample) for sample in streams['mrk'].data] == [['start'], ['stop']]
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from recorder import StreamRecorder
+from recordingindex import INDEX_SUFFIX, RecordingIndex
+
+SRATE, N_SAMPLES, CHUNK = 1000.0, 20000, 50
+
+
+@pytest.fixture(params=['xdf', 'h5'])
+def recording(request, tmp_path):
+    """ an XDF (or HDF5) file with a 3-channel float32 stream (a ramp, a sine and isolated spikes) in CHUNK-sample chunks and a marker stream """
+    if request.param == 'h5':
+        pytest.importorskip('h5py')
+    path = str(tmp_path / f'rec.{request.param}')
+    ts = 100.0 + np.arange(N_SAMPLES) / SRATE
+    data = np.zeros((N_SAMPLES, 3), dtype=np.float32)
+    data[:, 0] = np.arange(N_SAMPLES)
+    data[:, 1] = np.sin(np.arange(N_SAMPLES) / 20.0)
+    data[1234::3001, 2] = 9.0
+    recorder = StreamRecorder(path, flush_interval=0.05)
+    recorder.add_stream('eeg', 'eeg', None, 3, dtype=np.float32, srate=SRATE)
+    recorder.add_stream('mrk', 'mrk', None, 1, is_marker=True)
+    recorder.start()
+    for start in range(0, N_SAMPLES, CHUNK):
+        recorder.write_chunk('eeg', ts[start:start + CHUNK], data[start:start + CHUNK])
+    recorder.write_chunk('mrk', ts[[10, 5000]], [['a'], ['b']])
+    recorder.stop()
+    return path, ts, data
+
+
+def _stream_index(index, name):
+    return [s.name for s in index.streams].index(name)
+
+
+def test_read_range_is_exact_and_sidecar_reloads(recording):
+    path, ts, data = recording
+    index = RecordingIndex.open(path)
+    i = _stream_index(index, 'eeg')
+    assert len(index.streams[i].index['first_ts']) == (N_SAMPLES // CHUNK if path.endswith('.xdf') else 5)
+    out_ts, out_data = index.read_range(i, ts[1234] - 1e-4, ts[5678] + 1e-4)
+    np.testing.assert_array_equal(out_ts, ts[1234:5679])
+    np.testing.assert_array_equal(out_data, data[1234:5679])
+    index.close()
+    reloaded = RecordingIndex.open(path) ## from the sidecar this time
+    assert np.array_equal(reloaded.streams[i].index['max'], index.streams[i].index['max'])
+    marker_ts, markers = reloaded.read_markers(_stream_index(reloaded, 'mrk'))
+    np.testing.assert_array_equal(marker_ts, ts[[10, 5000]])
+    assert [list(m) for m in markers] == [['a'], ['b']]
+    reloaded.close()
+
+
+@pytest.mark.parametrize('max_chunks', [4096, 2]) ## reading every chunk's samples, and interior chunks' indexed min/max
+def test_read_range_envelope_is_bounded_and_keeps_peaks(recording, max_chunks):
+    path, ts, data = recording
+    index = RecordingIndex.open(path, max_chunks=max_chunks)
+    i = _stream_index(index, 'eeg')
+    out_ts, out_data = index.read_range(i, ts[25], ts[-25], max_samples=500)
+    assert len(out_ts) <= 500
+    assert np.all(np.diff(out_ts) >= 0)
+    assert (out_ts[0] >= ts[25]) and (out_ts[-1] <= ts[-25])
+    assert out_data[:, 0].min() == 25 and out_data[:, 0].max() == N_SAMPLES - 25
+    assert out_data[:, 1].min() == data[25:-24, 1].min() and out_data[:, 1].max() == data[25:-24, 1].max()
+    n_spikes = (out_data[:, 2] == 9.0).sum()
+    if path.endswith('.h5') and (max_chunks == 2):
+        assert n_spikes >= 1 ## indexed extrema of 4096-sample blocks are coarser than the bins and merge neighbouring spikes
+    else:
+        spike_bins = (np.flatnonzero(data[:, 2]) - 25) // ((N_SAMPLES - 50) / 250)
+        assert n_spikes == len(np.unique(spike_bins)) ## not one spike aliased away
+    index.close()
+
+
+def test_stale_sidecar_is_rebuilt(recording, tmp_path):
+    path, _, _ = recording
+    RecordingIndex.open(path).close()
+    with open(path + INDEX_SUFFIX, 'r+b') as file_obj: ## corrupt it
+        file_obj.write(b'garbage')
+    index = RecordingIndex.open(path)
+    assert len(index.streams) == 2
+    index.close()
@@ -0,0 +1,61 @@
+import numpy as np
+from ringbuffer import StreamRingBuffer
+
+
+def _chunk(start, n, n_channels=2):
+    ts = np.arange(start, start + n, dtype=np.float64)
+    return ts, np.repeat(ts[:, None], n_channels, axis=1).astype(np.float32)
+
+
+def test_wraparound_reads_are_contiguous_views():
+    ring = StreamRingBuffer(capacity=16, n_channels=2, guard=2)
+    written = 0
+    for n in (5, 7, 9, 3, 11):
+        ring.write(*_chunk(written, n))
+        written += n
+    assert ring.head == written
+    assert ring.oldest_index == written - 16 + 2
+    ts, data, start = ring.read(0)
+    assert start == ring.oldest_index
+    np.testing.assert_array_equal(ts, np.arange(start, written))
+    np.testing.assert_array_equal(data[:, 1], ts)
+    assert ts.base is not None ## a view into the ring, not a copy
+
+
+def test_read_window_and_latest():
+    ring = StreamRingBuffer(capacity=10, n_channels=1, guard=1)
+    ring.write(*_chunk(0, 8, 1))
+    ring.write(*_chunk(8, 6, 1))
+    ts, _, start = ring.read(7, 12)
+    assert start == 7
+    np.testing.assert_array_equal(ts, np.arange(7, 12))
+    ts, _ = ring.read_latest(4)
+    np.testing.assert_array_equal(ts, np.arange(10, 14))
+    ts, _, start = ring.read(14)
+    assert len(ts) == 0 and start == 14
+
+
+def test_oversized_write_keeps_newest_samples():
+    ring = StreamRingBuffer(capacity=8, n_channels=1, guard=2)
+    ring.write(*_chunk(0, 20, 1))
+    assert ring.head == 20
+    ts, data, start = ring.read(0)
+    np.testing.assert_array_equal(ts, np.arange(14, 20))
+    np.testing.assert_array_equal(data[:, 0], np.arange(14, 20))
+    assert not ring.is_valid(13) and ring.is_valid(14)
+
+
+def test_shared_ring_buffer_attach_sees_writes():
+    from ingestprocess import SharedStreamRingBuffer
+    owner = SharedStreamRingBuffer(32, 3, dtype=np.float64)
+    try:
+        writer = SharedStreamRingBuffer.attach(owner.spec())
+        writer.write(*_chunk(0, 40, 3))
+        assert owner.head == 40
+        ts, data, start = owner.read(0)
+        np.testing.assert_array_equal(ts, np.arange(start, 40))
+        np.testing.assert_array_equal(data[:, 2], ts)
+        del ts, data
+        writer.release()
+    finally:
+        owner.release()
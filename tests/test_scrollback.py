@@ -0,0 +1,36 @@
+import numpy as np
+from scrollback import ScrollbackStore
+
+
+def _store(tmp_path, n, segment_samples=1000, n_channels=2):
+    store = ScrollbackStore(str(tmp_path / 'sb'), n_channels, segment_samples=segment_samples)
+    ts = np.arange(n, dtype=np.float64)
+    data = np.zeros((n, n_channels), dtype=np.float32)
+    data[:, 1] = ts
+    for start in range(0, n, 333):
+        store.append(ts[start:start + 333], data[start:start + 333])
+    return store, ts, data
+
+
+def test_read_range_returns_exact_copies_across_segments(tmp_path):
+    store, ts, data = _store(tmp_path, 3500)
+    assert store.time_span() == (0.0, 3499.0)
+    out_ts, out_data = store.read_range(900.0, 2100.0)
+    np.testing.assert_array_equal(out_ts, ts[900:2101])
+    np.testing.assert_array_equal(out_data, data[900:2101])
+    store.close()
+
+
+def test_read_range_envelope_keeps_peaks_and_max_samples(tmp_path):
+    store, ts, data = _store(tmp_path, 10000)
+    store.close()
+    store = ScrollbackStore(str(tmp_path / 'spikes'), 2, segment_samples=1000)
+    data[::997, 0] = 5.0 ## isolated spikes a plain stride would skip
+    store.append(ts, data)
+    out_ts, out_data = store.read_range(0.0, 9999.0, max_samples=100)
+    assert len(out_ts) <= 100
+    assert np.all(np.diff(out_ts) >= 0)
+    assert out_data[:, 0].max() == 5.0
+    assert (out_data[:, 0] == 5.0).sum() == len(np.unique(np.arange(0, 10000, 997) // 200))
+    assert out_data[:, 1].min() == 0.0 and out_data[:, 1].max() == 9999.0
+    store.close()
@@ -42,6 +42,18 @@ class Ui_MainWindow(object):
         self.btnShowDataStream.setToolButtonStyle(QtCore.Qt.ToolButtonTextOnly)
         self.btnShowDataStream.setObjectName("btnShowDataStream")
         self.horizontalLayout.addWidget(self.btnShowDataStream)
+        self.btnPause = QtWidgets.QPushButton(self.centralwidget)
+        self.btnPause.setCheckable(True)
+        self.btnPause.setObjectName("btnPause")
+        self.horizontalLayout.addWidget(self.btnPause)
+        self.btnRecord = QtWidgets.QPushButton(self.centralwidget)
+        self.btnRecord.setCheckable(True)
+        self.btnRecord.setObjectName("btnRecord")
+        self.horizontalLayout.addWidget(self.btnRecord)
+        self.btnOpenRecording = QtWidgets.QPushButton(self.centralwidget)
+        self.btnOpenRecording.setCheckable(True)
+        self.btnOpenRecording.setObjectName("btnOpenRecording")
+        self.horizontalLayout.addWidget(self.btnOpenRecording)
         spacerItem = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
         self.horizontalLayout.addItem(spacerItem)
         self.gridLayout.addLayout(self.horizontalLayout, 2, 2, 1, 1)
@@ -177,6 +189,12 @@ class Ui_MainWindow(object):
         MainWindow.setWindowTitle(_translate("MainWindow", "MainWindow"))
         self.btnUpdateActivePlots.setText(_translate("MainWindow", "Update Active Plots"))
         self.btnShowDataStream.setText(_translate("MainWindow", "Show Received Data Stream..."))
+        self.btnPause.setToolTip(_translate("MainWindow", "Freeze the plots (data keeps being received); pan/zoom the time axis to scroll back"))
+        self.btnPause.setText(_translate("MainWindow", "Pause"))
+        self.btnRecord.setToolTip(_translate("MainWindow", "Record all streams to an XDF (or HDF5) file"))
+        self.btnRecord.setText(_translate("MainWindow", "Record..."))
+        self.btnOpenRecording.setToolTip(_translate("MainWindow", "View an XDF or HDF5 recording instead of the live streams"))
+        self.btnOpenRecording.setText(_translate("MainWindow", "Open Recording..."))
         self.updateButton.setText(_translate("MainWindow", "Update Streams"))
         self.chkEnableAutoUpdate.setText(_translate("MainWindow", "auto"))
         self.pushButton.setText(_translate("MainWindow", "Reload"))